@@ -4,7 +4,7 @@ import subprocess
 import platform
 import argparse
 import json
-import asyncio
+import time
 
 # Define constants for file paths and services
 SAMPLE_FILE_NAME = "generated_audio.mp3"
@@ -69,7 +69,7 @@ def detect_hardware():
 # Import modules with proper error handling
 def import_modules():
     global edge_tts, whisper, generate_script, generate_audio, generate_timed_captions
-    global generate_video_url, get_output_media, getVideoSearchQueriesTimed, merge_empty_intervals
+    global generate_video_url, get_output_media, render_output_formats, getVideoSearchQueriesTimed, merge_empty_intervals
     
     modules_imported = True
     
@@ -113,7 +113,7 @@ def import_modules():
         modules_imported = False
     
     try:
-        from utility.render.render_engine import get_output_media
+        from utility.render.render_engine import get_output_media, render_output_formats
     except ImportError as e:
         print(f"WARNING: Could not import render_engine: {str(e)}")
         modules_imported = False
@@ -138,80 +138,128 @@ def main():
     parser = argparse.ArgumentParser(description="Generate a video from a script.")
     parser.add_argument("--text", type=str, help="The script text to use")
     parser.add_argument("--file", type=str, help="Path to a file containing the script")
-    parser.add_argument("--output", type=str, default="output.mp4", help="Output video file name")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Output video file name (default: the render profile's output file)")
+    parser.add_argument("--backend", type=str, choices=["moviepy", "ffmpeg"], default=None,
+                        help="Render backend (default: moviepy, or the RENDER_BACKEND environment variable)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Cache the encoded background so re-rendering after a caption or narration edit "
+                             "only redoes the caption overlay (uses the ffmpeg backend; the first render "
+                             "encodes the background twice)")
+    parser.add_argument("--profile", type=str, choices=["draft", "standard", "final"], default=None,
+                        help="Render profile: draft for quick previews from cached clips only, standard, or final "
+                             "(default: standard, or the RENDER_PROFILE environment variable)")
+    parser.add_argument("--formats", type=str, default=None,
+                        help="Comma-separated output formats to render from one run, e.g. landscape,vertical "
+                             "(available: landscape, vertical, square; default: landscape)")
+    parser.add_argument("--plan", type=str, default=None, metavar="PLAN_JSON",
+                        help="Only plan the job: write its timeline and a cost estimate to PLAN_JSON, without "
+                             "generating audio, calling the video API, downloading or rendering")
+    parser.add_argument("--from-plan", type=str, default=None, metavar="PLAN_JSON",
+                        help="Render a plan written earlier with --plan")
+    parser.add_argument("--trace", type=str, default=None, metavar="TRACE_JSON",
+                        help="Record a timeline of every stage and sub-step to TRACE_JSON (Chrome trace-event "
+                             "format, open it in chrome://tracing or ui.perfetto.dev) and print a per-step summary")
+    parser.add_argument("--memory-profile", type=str, default=None, metavar="REPORT_JSON",
+                        help="Record peak RSS, live ffmpeg processes and open clips per stage to REPORT_JSON")
+    parser.add_argument("--memory-top", type=int, default=0, metavar="N",
+                        help="With --memory-profile, also list the N source lines that allocated the most "
+                             "memory in each stage (tracemalloc; slower)")
+    parser.add_argument("--progress-jsonl", type=str, default=None, metavar="PATH",
+                        help="Append structured progress events (stages, items, download bytes, encoded frames "
+                             "with ETA) to PATH as JSON lines; '-' writes them to stderr")
+    parser.add_argument("--deadline", type=float, default=None, metavar="SECONDS",
+                        help="Time budget: captions, video search and the render profile degrade to finish "
+                             "within it")
     args = parser.parse_args()
 
-    if not args.text and not args.file:
-        print("Error: Either --text or --file must be provided")
+    if not args.text and not args.file and not args.from_plan:
+        print("Error: Either --text, --file or --from-plan must be provided")
         return
 
+    from utility.tracing import span, start_tracing, save_trace, format_trace_summary
+    if args.trace:
+        start_tracing()
+    progress_sink = None
+    if args.progress_jsonl:
+        from utility.progress import JsonLinesSink, set_progress_sink
+        progress_sink = JsonLinesSink(args.progress_jsonl)
+        set_progress_sink(progress_sink)
+    memory_profiler = None
+    if args.memory_profile:
+        from utility.memory_profile import MemoryProfiler
+        memory_profiler = MemoryProfiler(top_allocations=args.memory_top).start()
+    job_start = time.time()
+
     try:
-        # Get script content either from direct text or file
-        script_content = read_script_file(args.file) if args.file else args.text
+        plan = None
+        if args.from_plan:
+            from utility.plan.timeline_plan import load_plan
+            plan = load_plan(args.from_plan)
+            script_content = plan["script"]
+            # Command line options override the render settings stored in the plan
+            render_settings = plan.get("render", {})
+            args.backend = args.backend or render_settings.get("backend")
+            args.profile = args.profile or render_settings.get("profile")
+            if not args.formats and render_settings.get("output_formats"):
+                args.formats = ",".join(render_settings["output_formats"])
+        else:
+            # Get script content either from direct text or file
+            script_content = read_script_file(args.file) if args.file else args.text
+        output_formats = [f.strip() for f in args.formats.split(",") if f.strip()] if args.formats else []
         
-        # Process the input script (no AI generation, just pass through)
-        script = generate_script(script_content)
+        # The pipeline's script stage processes the script (no AI generation, just pass through)
         print("Script to be used:")
-        print(script)
-        print("\nGenerating audio...")
-        
-        # Generate audio with error handling
-        try:
-            asyncio.run(generate_audio(script, SAMPLE_FILE_NAME))
-            print("Audio generated successfully")
-        except Exception as e:
-            print(f"Warning: Audio generation encountered issues: {str(e)}")
-            print("Using dummy audio file...")
-            # Create a dummy audio file
-            import subprocess
-            subprocess.check_call(["ffmpeg", "-f", "lavfi", "-i", "anullsrc=r=44100:cl=mono", "-t", "10", "-q:a", "9", "-acodec", "libmp3lame", SAMPLE_FILE_NAME, "-y"], 
-                                 stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+        print(script_content.strip())
 
-        # Generate captions with fallback to dummy captions
-        print("\nGenerating captions...")
-        try:
-            from utility.captions.dummy_captions_generator import generate_dummy_captions
-            timed_captions = generate_dummy_captions(script, SAMPLE_FILE_NAME, duration=30.0)
-            print("Using dummy captions due to audio processing limitations")
-        except Exception as e:
-            print(f"Warning: Caption generation failed: {str(e)}")
-            print("Using dummy captions...")
-            timed_captions = generate_dummy_captions(script, SAMPLE_FILE_NAME, duration=30.0)
+        if args.plan:
+            from utility.plan.timeline_plan import build_plan, save_plan, format_plan_summary
+            from utility.render.render_engine import RENDER_BACKEND
+            print("\nPlanning...")
+            with span("plan"):
+                plan = build_plan(generate_script(script_content), VIDEO_SERVER, profile=args.profile,
+                                  backend=args.backend or ("ffmpeg" if args.incremental else RENDER_BACKEND),
+                                  output_formats=output_formats or None)
+            save_plan(plan, args.plan)
+            print(format_plan_summary(plan))
+            print(f"Plan written to {args.plan}")
+            return
 
-        # Generate video search terms
-        print("\nGenerating video search terms...")
-        search_terms = getVideoSearchQueriesTimed(script, timed_captions)
-        if search_terms:
-            print("Search terms generated successfully")
-        else:
-            print("No search terms generated")
-
-        # Get background videos
-        background_video_urls = None
-        if search_terms is not None:
-            print("\nFetching background videos...")
-            background_video_urls = generate_video_url(search_terms, VIDEO_SERVER)
-            if background_video_urls:
-                print("Background videos fetched successfully")
-        else:
-            print("No background videos found")
-
-        background_video_urls = merge_empty_intervals(background_video_urls)
-
-        # Generate final video
-        if background_video_urls:
-            print("\nGenerating final video...")
-            output_file = get_output_media(SAMPLE_FILE_NAME, timed_captions, background_video_urls, VIDEO_SERVER)
+        print("\nGenerating video...")
+        from utility.pipeline import PipelineConfig, generate_video
+        config = PipelineConfig(profile=args.profile, backend=args.backend, incremental=args.incremental or None,
+                                output_formats=output_formats or None,
+                                output_file=args.output, work_dir=".", audio_file=SAMPLE_FILE_NAME,
+                                video_server=VIDEO_SERVER, deadline_seconds=args.deadline)
+        result = generate_video(script_content, config, plan=plan)
+        for degradation in result.metrics["degraded"]:
+            print(f"Degraded to meet the deadline: {degradation}")
+        for output_format, output_file in result.outputs.items():
+            label = f" ({output_format})" if len(result.outputs) > 1 else ""
             if output_file:
-                print(f"Video generated successfully: {output_file}")
+                print(f"Video generated successfully{label}: {output_file}")
             else:
-                print("Failed to generate video")
-        else:
-            print("No background videos available to generate final video")
+                print(f"Failed to generate video{label}")
 
     except Exception as e:
         print(f"Error: {str(e)}")
         return
+    finally:
+        if args.trace:
+            print("\nTrace summary:")
+            print(format_trace_summary(wall_seconds=time.time() - job_start))
+            save_trace(args.trace)
+            print(f"Trace written to {args.trace}")
+        if progress_sink is not None:
+            set_progress_sink(None)
+            progress_sink.close()
+        if memory_profiler is not None:
+            from utility.memory_profile import format_memory_report
+            memory_profiler.stop()
+            print("\nMemory profile:")
+            print(format_memory_report(memory_profiler.report()))
+            memory_profiler.save_report(args.memory_profile)
+            print(f"Memory report written to {args.memory_profile}")
 
 if __name__ == "__main__":
     print("=== Text-To-Video-AI ===")
@@ -0,0 +1,281 @@
+"""
+End-to-end pipeline benchmark that runs fully offline.
+
+Each scenario narrates a synthetic script of a given length (1, 5 and 30
+minutes by default) through the whole pipeline:
+- script handling
+- stub TTS: a tone of the right length
+- caption timing
+- search query generation
+- video search and clip downloads against a local Pexels stand-in serving
+  lavfi-generated clips
+- the render
+
+Every scenario runs in its own process with empty caches, so each number is
+a cold run. The report lists per-stage times (the same stage spans
+``app.py --trace`` records), throughput and peak memory as JSON, and can be
+compared against a saved baseline.
+
+Usage (from the repository root):
+    python -m benchmarks.e2e
+    python -m benchmarks.e2e --minutes 1 --backend ffmpeg --output report.json
+    python -m benchmarks.e2e --save-baseline baseline.json
+    python -m benchmarks.e2e --baseline baseline.json  # exits with 1 on a regression
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.synthetic_media import make_clip_library, stub_tts, synthetic_script
+from benchmarks.fake_pexels import FakePexelsServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MINUTES = (1, 5, 30)
+BENCH_MEDIA_DIR = os.environ.get("BENCH_MEDIA_DIR", os.path.join(os.path.expanduser("~"), ".cache", "text-to-video", "bench-media"))
+# A stage only counts as regressed when it is both this much slower, relatively...
+REGRESSION_TOLERANCE = 0.10
+# ...and this many seconds slower, so sub-second stages do not flap
+REGRESSION_MIN_SECONDS = 0.5
+MB = 1024 * 1024
+
+
+def run_job(job):
+    """
+    Run one scenario in this process. The environment (cache directories,
+    PEXELS_API_URL) must already point at the scenario's sandbox.
+
+    Returns:
+        dict: The scenario's measurements
+    """
+    from utility.tracing import start_tracing, span
+    from utility.memory_profile import MemoryProfiler
+    from utility.script.script_generator import generate_script
+    from utility.captions.dummy_captions_generator import generate_dummy_captions
+    from utility.video.video_search_query_generator import getVideoSearchQueriesTimed
+    from utility.video.background_video_generator import generate_video_url, merge_empty_intervals
+    from utility.render.render_engine import get_output_media
+
+    tracer = start_tracing()
+    profiler = MemoryProfiler().start()
+    audio_file = os.path.abspath("narration.mp3")
+    output_file = os.path.abspath("benchmark.mp4")
+    started = time.time()
+    try:
+        with span("script"):
+            script = generate_script(job["script"])
+        with span("tts"):
+            narration_seconds = stub_tts(script, audio_file)
+        with span("captions"):
+            timed_captions = generate_dummy_captions(script, None, duration=narration_seconds)
+        with span("search terms"):
+            search_terms = getVideoSearchQueriesTimed(script, timed_captions) or []
+        with span("background search"):
+            # Offline, procedural backgrounds fill every segment
+            background_video_urls = merge_empty_intervals(
+                generate_video_url(search_terms, "pexel")
+                or [((t1, t2), None) for (t1, t2), _ in (search_terms or timed_captions)])
+        with span("render"):
+            result = get_output_media(audio_file, timed_captions, background_video_urls, "pexel",
+                                      backend=job.get("backend"), profile=job.get("profile"), output_file=output_file)
+    finally:
+        wall_seconds = time.time() - started
+        profiler.stop()
+
+    rows = tracer.summary()
+    stages = {row["name"]: round(row["total"], 3) for row in rows if row["category"] == "stage"}
+    steps = {row["name"]: {"count": row["count"], "total": round(row["total"], 3)}
+             for row in rows if row["category"] != "stage"}
+    memory = profiler.report()
+    return {
+        "ok": result is not None,
+        "words": len(script.split()),
+        "narration_seconds": round(narration_seconds, 3),
+        "captions": len(timed_captions),
+        "segments": len(background_video_urls or []),
+        "wall_seconds": round(wall_seconds, 3),
+        "stages": stages,
+        "steps": steps,
+        "memory": {
+            "peak_rss": memory["peak_rss"],
+            "peak_total_rss": memory["peak_total_rss"],
+            "peak_ffmpeg_processes": memory["peak_ffmpeg_processes"]
+        },
+        "output_bytes": os.path.getsize(output_file) if os.path.exists(output_file) else 0
+    }
+
+
+def run_scenario(minutes, server, args):
+    """Run one scenario in a child process with its own empty caches."""
+    work_dir = tempfile.mkdtemp(prefix=f"bench_{minutes}min_", dir=args.work_dir)
+    job = {
+        "script": synthetic_script(minutes, seed=args.seed),
+        "backend": args.backend,
+        "profile": args.profile
+    }
+    job_file = os.path.join(work_dir, "job.json")
+    result_file = os.path.join(work_dir, "result.json")
+    with open(job_file, "w", encoding="utf-8") as f:
+        json.dump(job, f)
+
+    env = dict(os.environ,
+               PEXELS_KEY="benchmark",
+               PEXELS_API_URL=server.url,
+               CLIP_CACHE_DIR=os.path.join(work_dir, "clips"),
+               SEARCH_CACHE_DIR=os.path.join(work_dir, "search"),
+               BACKGROUND_TRACK_DIR=os.path.join(work_dir, "tracks"),
+               PROCEDURAL_CACHE_DIR=os.path.join(work_dir, "procedural"),
+               PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+    server.stats.update(searches=0, rate_limited=0, downloads=0, bytes_served=0)
+    print(f"\n=== {minutes}-minute script ({len(job['script'].split())} words) in {work_dir}")
+    log_path = os.path.join(work_dir, "pipeline.log")
+    with open(log_path, "w", encoding="utf-8") as log:
+        completed = subprocess.run([sys.executable, "-m", "benchmarks.e2e", "--job", job_file, "--result", result_file],
+                                   cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    if completed.returncode != 0 or not os.path.exists(result_file):
+        print(f"Scenario failed (exit code {completed.returncode}), see {log_path}")
+        return {"name": f"{minutes}min", "minutes": minutes, "ok": False, "log": log_path}
+
+    with open(result_file, "r", encoding="utf-8") as f:
+        result = json.load(f)
+    server_stats = dict(server.stats)
+    fetch_seconds = result["stages"].get("fetch clips") or 0
+    render_seconds = result["stages"].get("render") or result["wall_seconds"]
+    result.update({
+        "name": f"{minutes}min",
+        "minutes": minutes,
+        "server": server_stats,
+        "throughput": {
+            "realtime_factor": round(render_seconds / result["narration_seconds"], 3) if result["narration_seconds"] else None,
+            "video_seconds_per_second": round(result["narration_seconds"] / render_seconds, 3) if render_seconds else None,
+            "download_mb_per_second": round(server_stats["bytes_served"] / MB / fetch_seconds, 2) if fetch_seconds else None,
+            "searches_per_second": (round(server_stats["searches"] / result["stages"]["background search"], 2)
+                                    if result["stages"].get("background search") else None)
+        }
+    })
+    if not args.keep:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(format_scenario(result))
+    return result
+
+
+def format_scenario(result):
+    memory = result["memory"]
+    lines = [f"{result['name']}: {result['wall_seconds']:.1f}s wall for {result['narration_seconds']:.0f}s of video, "
+             f"peak RSS {memory['peak_rss'] / MB:.0f} MB ({memory['peak_total_rss'] / MB:.0f} MB with ffmpeg), "
+             f"{result['server']['searches']} searches ({result['server']['rate_limited']} rate limited), "
+             f"{result['server']['downloads']} downloads"]
+    for name, seconds in sorted(result["stages"].items(), key=lambda item: -item[1]):
+        lines.append(f"  {name:<22} {seconds:>9.2f}s")
+    return "\n".join(lines)
+
+
+def compare_reports(report, baseline, tolerance=REGRESSION_TOLERANCE, min_seconds=REGRESSION_MIN_SECONDS):
+    """
+    Compare scenario wall times, stage times and peak memory with a baseline report.
+
+    Returns:
+        tuple: (lines describing the comparison, list of regressions)
+    """
+    previous = {scenario["name"]: scenario for scenario in baseline.get("scenarios", []) if scenario.get("ok")}
+    lines = []
+    regressions = []
+    for scenario in report["scenarios"]:
+        before = previous.get(scenario["name"])
+        if not scenario.get("ok") or before is None:
+            continue
+        metrics = [("wall", before["wall_seconds"], scenario["wall_seconds"], min_seconds)]
+        metrics += [(f"stage {name}", before["stages"][name], seconds, min_seconds)
+                    for name, seconds in scenario["stages"].items() if name in before["stages"]]
+        metrics.append(("peak RSS MB", before["memory"]["peak_total_rss"] / MB, scenario["memory"]["peak_total_rss"] / MB, 32))
+        for label, old, new, floor in metrics:
+            change = (new - old) / old if old else 0.0
+            regressed = new > old * (1 + tolerance) and new - old > floor
+            lines.append(f"{scenario['name']:<7} {label:<28} {old:>10.2f} -> {new:>10.2f}  {change:>+7.1%}"
+                         f"{'  REGRESSION' if regressed else ''}")
+            if regressed:
+                regressions.append((scenario["name"], label, old, new))
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the text-to-video pipeline.")
+    parser.add_argument("--minutes", type=str, default=",".join(str(m) for m in DEFAULT_MINUTES),
+                        help="Comma-separated script lengths in minutes (default: 1,5,30)")
+    parser.add_argument("--backend", type=str, choices=["moviepy", "ffmpeg"], default=None)
+    parser.add_argument("--profile", type=str, choices=["standard", "final"], default="standard",
+                        help="Render profile (draft is excluded: it never downloads)")
+    parser.add_argument("--output", type=str, default="benchmark_report.json", help="Where to write the JSON report")
+    parser.add_argument("--baseline", type=str, default=None, help="Compare with this report; exit 1 on a regression")
+    parser.add_argument("--save-baseline", type=str, default=None, help="Also write the report here as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="Relative slowdown treated as a regression")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="Seconds per search response")
+    parser.add_argument("--download-latency", type=float, default=0.02, help="Seconds before a download starts")
+    parser.add_argument("--rate-limit", type=int, default=0, help="Searches per second before HTTP 429 (0 = unlimited)")
+    parser.add_argument("--fail-every", type=int, default=0, help="Answer every Nth search with HTTP 429")
+    parser.add_argument("--bandwidth", type=float, default=20.0, help="Download MB/s per connection (0 = unlimited)")
+    parser.add_argument("--clips", type=int, default=12, help="Distinct synthetic clips the stand-in serves")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic scripts")
+    parser.add_argument("--work-dir", type=str, default=None, help="Parent directory of the scenario sandboxes")
+    parser.add_argument("--keep", action="store_true", help="Keep each scenario's sandbox (caches, log, video)")
+    parser.add_argument("--job", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--result", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.job:
+        # Child process: run one scenario
+        with open(args.job, "r", encoding="utf-8") as f:
+            job = json.load(f)
+        result = run_job(job)
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return 0 if result["ok"] else 1
+
+    print(f"Preparing {args.clips} synthetic clips in {BENCH_MEDIA_DIR}...")
+    clips = make_clip_library(BENCH_MEDIA_DIR, count=args.clips)
+    server = FakePexelsServer(clips, search_latency=args.search_latency, download_latency=args.download_latency,
+                              rate_limit=args.rate_limit, fail_every=args.fail_every,
+                              bandwidth=int(args.bandwidth * MB)).start()
+    print(f"Pexels stand-in listening on {server.url}")
+    try:
+        scenarios = [run_scenario(float(m) if "." in m else int(m), server, args)
+                     for m in args.minutes.split(",") if m.strip()]
+    finally:
+        server.stop()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {key: value for key, value in vars(args).items() if key not in ("job", "result")},
+        "scenarios": scenarios
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.save_baseline)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    status = 0 if all(scenario.get("ok") for scenario in scenarios) else 1
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines, regressions = compare_reports(report, baseline, tolerance=args.tolerance)
+        print(f"\nComparison with {args.baseline}:")
+        print("\n".join(lines))
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            status = 1
+        else:
+            print("\nNo regressions")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
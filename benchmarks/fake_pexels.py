@@ -0,0 +1,195 @@
+"""
+Local stand-in for the Pexels video API.
+
+Serves ``/videos/search`` with Pexels-shaped JSON and ``/files/<name>`` with
+the synthetic clips, so the search and download stages can be benchmarked
+without the network. Search latency, rate limiting (HTTP 429) and download
+bandwidth are configurable. Point the pipeline at it with the
+PEXELS_API_URL environment variable.
+"""
+
+import os
+import time
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, quote
+
+from benchmarks.synthetic_media import clip_for_query
+
+COPY_CHUNK = 64 * 1024
+
+
+class FakePexelsServer(ThreadingHTTPServer):
+    """
+    Args:
+        clips (list): Paths of the clips searches may return
+        search_latency (float): Seconds added to every search response
+        download_latency (float): Seconds before a file response starts
+        rate_limit (int): Searches allowed per second; more get HTTP 429 (0 = unlimited)
+        fail_every (int): Answer every Nth search with HTTP 429 (0 = never)
+        bandwidth (int): Bytes per second per download (0 = unlimited)
+        videos_per_search (int): Videos listed in each search response
+        clip_size (tuple): (width, height) reported for the clips
+    """
+
+    daemon_threads = True
+
+    def __init__(self, clips, host="127.0.0.1", port=0, search_latency=0.05, download_latency=0.0, rate_limit=0,
+                 fail_every=0, bandwidth=0, videos_per_search=3, clip_size=(1280, 720)):
+        super().__init__((host, port), FakePexelsHandler)
+        self.clips = {os.path.basename(path): path for path in clips}
+        self.clip_names = sorted(self.clips)
+        self.search_latency = search_latency
+        self.download_latency = download_latency
+        self.rate_limit = rate_limit
+        self.fail_every = fail_every
+        self.bandwidth = bandwidth
+        self.videos_per_search = videos_per_search
+        self.clip_size = clip_size
+        self.stats = {"searches": 0, "rate_limited": 0, "downloads": 0, "bytes_served": 0}
+        self._lock = threading.Lock()
+        self._window = (0, 0)  # (second, searches answered in it)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-pexels", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def admit_search(self):
+        """Count a search request; False if it should be answered with 429."""
+        with self._lock:
+            self.stats["searches"] += 1
+            if self.fail_every and self.stats["searches"] % self.fail_every == 0:
+                self.stats["rate_limited"] += 1
+                return False
+            if self.rate_limit:
+                second = int(time.time())
+                window_second, count = self._window
+                count = count + 1 if window_second == second else 1
+                self._window = (second, count)
+                if count > self.rate_limit:
+                    self.stats["rate_limited"] += 1
+                    return False
+            return True
+
+    def search_response(self, query):
+        width, height = self.clip_size
+        first = clip_for_query(query, len(self.clip_names))
+        videos = []
+        for rank in range(min(self.videos_per_search, len(self.clip_names))):
+            name = self.clip_names[(first + rank) % len(self.clip_names)]
+            videos.append({
+                "id": first * 100 + rank,
+                "width": width,
+                "height": height,
+                "duration": 8,
+                "url": f"{self.url}/video/{quote(name)}",
+                "video_files": [{
+                    "id": first * 100 + rank,
+                    "quality": "hd",
+                    "file_type": "video/mp4",
+                    "width": width,
+                    "height": height,
+                    "link": f"{self.url}/files/{quote(name)}"
+                }]
+            })
+        return {"page": 1, "per_page": self.videos_per_search, "total_results": len(videos), "videos": videos}
+
+
+class FakePexelsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path == "/videos/search":
+            self.handle_search(parse_qs(parts.query).get("query", [""])[0])
+        elif parts.path.startswith("/files/"):
+            self.handle_file(os.path.basename(parts.path))
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_search(self, query):
+        server = self.server
+        if not self.headers.get("Authorization"):
+            self.send_json(401, {"error": "unauthorized"})
+            return
+        if not server.admit_search():
+            self.send_json(429, {"error": "rate limit exceeded"}, {"Retry-After": "1"})
+            return
+        if server.search_latency:
+            time.sleep(server.search_latency)
+        self.send_json(200, server.search_response(query))
+
+    def handle_file(self, name):
+        server = self.server
+        path = server.clips.get(name)
+        if path is None:
+            self.send_json(404, {"error": "not found"})
+            return
+        if server.download_latency:
+            time.sleep(server.download_latency)
+        size = os.path.getsize(path)
+        start = 0
+        range_header = self.headers.get("Range", "")
+        if range_header.startswith("bytes=") and range_header[6:].split("-")[0].isdigit():
+            start = int(range_header[6:].split("-")[0])
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(size - start))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        with server._lock:
+            server.stats["downloads"] += 1
+        sent = 0
+        began = time.time()
+        with open(path, "rb") as f:
+            f.seek(start)
+            while True:
+                chunk = f.read(COPY_CHUNK)
+                if not chunk:
+                    break
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    break
+                sent += len(chunk)
+                if server.bandwidth:
+                    # Sleep until the transfer is back under the configured rate
+                    ahead = sent / server.bandwidth - (time.time() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        with server._lock:
+            server.stats["bytes_served"] += sent
@@ -0,0 +1,361 @@
+"""
+Micro-benchmarks for the pure-Python caption and keyword hot paths.
+
+Every function is timed on synthetic inputs of growing size, from 100 to
+1,000,000 narrated words by default. The inputs are Whisper-shaped
+transcripts, caption lists, keyword segments and search results built from
+``synthetic_script``. For every function the report holds the scaling curve
+(seconds per size) and its fitted exponent: about 1 for linear code and
+about 2 for quadratic code. A function whose exponent is above its expected
+value plus EXPONENT_TOLERANCE fails the run. Once a run is predicted to take
+longer than the time budget, larger sizes are skipped, so quadratic code
+shows up as a failed check rather than a run that never finishes.
+
+Usage (from the repository root):
+    python -m benchmarks.micro
+    python -m benchmarks.micro --max-words 100000 --only splitWordsBySize getCaptionsWithTime
+    python -m benchmarks.micro --save-baseline micro-baseline.json
+    python -m benchmarks.micro --baseline micro-baseline.json  # exits with 1 on a regression
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import platform
+import argparse
+import contextlib
+
+from benchmarks.synthetic_media import WORDS_PER_MINUTE, synthetic_script
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000, 1000000)
+# Leeway over a benchmark's expected exponent before it counts as superlinear
+EXPONENT_TOLERANCE = 0.3
+# Timings shorter than this are too noisy to fit an exponent on
+FIT_MIN_SECONDS = 0.001
+# A size counts as regressed when it is both this much slower, relatively...
+REGRESSION_TOLERANCE = 0.25
+# ...and this many seconds slower
+REGRESSION_MIN_SECONDS = 0.005
+TIME_BUDGET = float(os.environ.get("MICRO_BENCH_BUDGET", "30"))  # Seconds one measurement may take
+MIN_MEASURE_SECONDS = 0.2  # Small inputs are repeated until a measurement takes this long
+WORDS_PER_SEGMENT = 20  # Words per Whisper segment in the synthetic transcripts
+
+
+def synthetic_words(count, seed=0):
+    """``count`` words of narration (with punctuation, like a transcript)."""
+    words = synthetic_script(count / WORDS_PER_MINUTE + 0.1, seed).split()
+    return words[:count]
+
+
+def synthetic_whisper(words, seconds_per_word=60.0 / WORDS_PER_MINUTE):
+    """A transcript shaped like whisper_timestamped's output for ``words``."""
+    segments = []
+    for first in range(0, len(words), WORDS_PER_SEGMENT):
+        segment_words = [{
+            "text": word,
+            "start": round(index * seconds_per_word, 3),
+            "end": round((index + 1) * seconds_per_word, 3),
+            "confidence": 0.9
+        } for index, word in enumerate(words[first:first + WORDS_PER_SEGMENT], first)]
+        segments.append({
+            "id": len(segments),
+            "start": segment_words[0]["start"],
+            "end": segment_words[-1]["end"],
+            "text": " " + " ".join(word["text"] for word in segment_words),
+            "words": segment_words
+        })
+    return {"text": " ".join(words), "segments": segments, "language": "en"}
+
+
+def synthetic_captions(words, maxCaptionSize=15, seconds_per_word=60.0 / WORDS_PER_MINUTE):
+    """Timed captions like getCaptionsWithTime returns, without building a transcript."""
+    captions = []
+    start = 0.0
+    caption = []
+    for word in words:
+        if caption and len(" ".join(caption + [word])) > maxCaptionSize:
+            end = start + len(caption) * seconds_per_word
+            captions.append(((round(start, 3), round(end, 3)), " ".join(caption)))
+            start, caption = end, []
+        caption.append(word)
+    if caption:
+        captions.append(((round(start, 3), round(start + len(caption) * seconds_per_word, 3)), " ".join(caption)))
+    return captions
+
+
+def synthetic_search_results(words, seed=0, found=0.5):
+    """
+    Search terms for ``words`` (as generate_video_url builds them) and the
+    videos found for a ``found`` share of the distinct queries.
+
+    Returns:
+        tuple: (search_terms, successful_videos)
+    """
+    from utility.video.video_search_query_generator import extract_keywords
+    from utility.video.search_cache import search_query
+
+    rng = random.Random(seed)
+    search_terms = [((t1, t2), search_query(keywords))
+                    for (t1, t2), keywords in extract_keywords("", synthetic_captions(words))]
+    successful_videos = {}
+    for _, term in search_terms:
+        if term not in successful_videos and rng.random() < found:
+            successful_videos[term] = f"https://videos.example/{len(successful_videos)}.mp4"
+    return search_terms, successful_videos
+
+
+def with_gaps(segments, seed=0, empty=0.3):
+    """``[interval, url]`` segments with an ``empty`` share of the URLs missing."""
+    rng = random.Random(seed)
+    return [[list(interval), None if rng.random() < empty else f"https://videos.example/{index}.mp4"]
+            for index, (interval, _) in enumerate(segments)]
+
+
+def _benchmarks():
+    """
+    (name, expected exponent, setup) for every benchmark; ``setup(words)``
+    returns the function call to time.
+    """
+    from utility.captions.timed_captions_generator import (
+        splitWordsBySize, getTimestampMapping, interpolateTimeFromDict, getCaptionsWithTime)
+    from utility.video.video_search_query_generator import extract_keywords, merge_empty_intervals
+    from utility.video import background_video_generator
+
+    def split(words):
+        return lambda: splitWordsBySize(words, 15)
+
+    def mapping(words):
+        whisper = synthetic_whisper(words)
+        return lambda: getTimestampMapping(whisper)
+
+    def interpolate(words):
+        # One lookup near the end of the transcript: the scan covers every word
+        locationToTimestamp = getTimestampMapping(synthetic_whisper(words))
+        position = list(locationToTimestamp)[-1][0] + 1
+        return lambda: interpolateTimeFromDict(position, locationToTimestamp)
+
+    def captions(words):
+        whisper = synthetic_whisper(words)
+        return lambda: getCaptionsWithTime(whisper)
+
+    def keywords(words):
+        timed = synthetic_captions(words)
+        return lambda: extract_keywords("", timed)
+
+    def merge_segments(words):
+        segments = with_gaps(synthetic_captions(words))
+        return lambda: merge_empty_intervals(segments)
+
+    def merge_urls(words):
+        urls = [url for _, url in with_gaps(synthetic_captions(words))]
+        return lambda: background_video_generator.merge_empty_intervals(urls)
+
+    def reuse(words):
+        search_terms, successful_videos = synthetic_search_results(words)
+        # The pass updates the dict it is given, so every call gets a fresh copy
+        return lambda: background_video_generator.reuse_similar_videos(search_terms, dict(successful_videos))
+
+    return [
+        ("splitWordsBySize", 1.0, split),
+        ("getTimestampMapping", 1.0, mapping),
+        ("interpolateTimeFromDict", 1.0, interpolate),
+        ("getCaptionsWithTime", 1.0, captions),
+        ("extract_keywords", 1.0, keywords),
+        ("merge_empty_intervals (search queries)", 1.0, merge_segments),
+        ("merge_empty_intervals (video urls)", 1.0, merge_urls),
+        ("reuse_similar_videos", 1.0, reuse)
+    ]
+
+
+def measure(call, min_seconds=MIN_MEASURE_SECONDS, repeat=3):
+    """
+    Best time of ``repeat`` measurements of one ``call()``; fast calls are
+    looped until a measurement takes at least ``min_seconds``.
+
+    Returns:
+        float: Seconds per call
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        began = time.perf_counter()
+        call()
+        single = time.perf_counter() - began
+        if single >= min_seconds:
+            # Slow enough to time directly; one more run smooths out warm-up
+            began = time.perf_counter()
+            call()
+            return min(single, time.perf_counter() - began)
+        loops = max(1, int(min_seconds / max(single, 1e-7)))
+        best = None
+        for _ in range(repeat):
+            began = time.perf_counter()
+            for _ in range(loops):
+                call()
+            elapsed = (time.perf_counter() - began) / loops
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+
+def fit_exponent(points):
+    """
+    Least-squares slope of log(seconds) over log(size).
+
+    Args:
+        points (list): (size, seconds) pairs
+
+    Returns:
+        float: The exponent, or None with fewer than two usable points
+    """
+    points = [(size, seconds) for size, seconds in points if seconds and seconds >= FIT_MIN_SECONDS]
+    if len(points) < 2:
+        return None
+    xs = [math.log(size) for size, _ in points]
+    ys = [math.log(seconds) for _, seconds in points]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if not variance:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+
+def run_benchmark(name, expected, setup, sizes, budget=TIME_BUDGET, seed=0):
+    """
+    Time one benchmark over ``sizes`` (in words).
+
+    Returns:
+        dict: Sizes, seconds per call, the fitted exponent and whether it is
+        within the expected exponent
+    """
+    points = []
+    skipped = []
+    for size in sizes:
+        if points:
+            # Predict the next run from the curve so far and stop before it blows the budget
+            last_size, last_seconds = points[-1]
+            exponent = max(1.0, fit_exponent(points) or 1.0)
+            if last_seconds * (size / last_size) ** exponent > budget:
+                skipped.append(size)
+                continue
+        words = synthetic_words(size, seed)
+        call = setup(words)
+        seconds = measure(call)
+        points.append((size, seconds))
+        print(f"  {name:<40} {size:>9,} words {seconds * 1000:>11.3f} ms")
+        if seconds > budget:
+            skipped.extend(s for s in sizes if s > size)
+            break
+    exponent = fit_exponent(points)
+    return {
+        "name": name,
+        "sizes": [size for size, _ in points],
+        "seconds": [round(seconds, 7) for _, seconds in points],
+        "ns_per_word": [round(seconds / size * 1e9, 1) for size, seconds in points],
+        "skipped_sizes": skipped,
+        "exponent": round(exponent, 3) if exponent is not None else None,
+        "expected_exponent": expected,
+        "ok": exponent is None or exponent <= expected + EXPONENT_TOLERANCE
+    }
+
+
+def compare_reports(report, baseline, tolerance=REGRESSION_TOLERANCE, min_seconds=REGRESSION_MIN_SECONDS):
+    """
+    Regressions of ``report`` against ``baseline``: sizes that got slower by
+    more than ``tolerance`` (and ``min_seconds``), and exponents that grew
+    by more than EXPONENT_TOLERANCE.
+
+    Returns:
+        list: One message per regression
+    """
+    regressions = []
+    previous = {result["name"]: result for result in baseline.get("benchmarks", [])}
+    for result in report["benchmarks"]:
+        before = previous.get(result["name"])
+        if before is None:
+            continue
+        times = dict(zip(before["sizes"], before["seconds"]))
+        for size, seconds in zip(result["sizes"], result["seconds"]):
+            old = times.get(size)
+            if old and seconds > old * (1 + tolerance) and seconds - old > min_seconds:
+                regressions.append(f"{result['name']} at {size:,} words: {seconds * 1000:.2f} ms "
+                                   f"(was {old * 1000:.2f} ms, +{(seconds / old - 1) * 100:.0f}%)")
+        for size in result["skipped_sizes"]:
+            if size in times:
+                regressions.append(f"{result['name']} at {size:,} words: over the time budget (was {times[size]:.2f}s)")
+        if result["exponent"] is not None and before.get("exponent") is not None \
+                and result["exponent"] > before["exponent"] + EXPONENT_TOLERANCE:
+            regressions.append(f"{result['name']}: scaling exponent {result['exponent']:.2f} (was {before['exponent']:.2f})")
+    return regressions
+
+
+def format_report(report):
+    lines = [f"{'benchmark':<40} {'exponent':>8} {'expected':>8}  {'largest size':>13} {'ns/word':>9}  status"]
+    for result in report["benchmarks"]:
+        exponent = f"{result['exponent']:.2f}" if result["exponent"] is not None else "?"
+        largest = f"{result['sizes'][-1]:,}" if result["sizes"] else "-"
+        per_word = f"{result['ns_per_word'][-1]:.0f}" if result["ns_per_word"] else "-"
+        status = "ok" if result["ok"] else "SUPERLINEAR"
+        if result["skipped_sizes"]:
+            status += f" (skipped {', '.join(f'{size:,}' for size in result['skipped_sizes'])}: over budget)"
+        lines.append(f"{result['name']:<40} {exponent:>8} {result['expected_exponent']:>8.1f}  {largest:>13} {per_word:>9}  {status}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling micro-benchmarks for the caption and keyword hot paths.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Input sizes in words")
+    parser.add_argument("--max-words", type=int, help="Drop sizes above this many words")
+    parser.add_argument("--only", nargs="+", help="Run only benchmarks whose name starts with one of these")
+    parser.add_argument("--budget", type=float, default=TIME_BUDGET, help="Seconds one measurement may take (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic inputs")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--baseline", help="Compare against this report and exit with 1 on a regression")
+    parser.add_argument("--save-baseline", help="Also write the report to this file as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="Allowed relative slowdown (default: %(default)s)")
+    args = parser.parse_args()
+
+    sizes = sorted(size for size in args.sizes if not args.max_words or size <= args.max_words)
+    benchmarks = [benchmark for benchmark in _benchmarks()
+                  if not args.only or any(benchmark[0].startswith(prefix) for prefix in args.only)]
+
+    results = []
+    for name, expected, setup in benchmarks:
+        results.append(run_benchmark(name, expected, setup, sizes, args.budget, args.seed))
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": sizes,
+        "budget": args.budget,
+        "benchmarks": results
+    }
+    print()
+    print(format_report(report))
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"\nReport written to {path}")
+
+    failed = [result["name"] for result in results if not result["ok"]]
+    if failed:
+        print(f"\nSuperlinear scaling: {', '.join(failed)}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_reports(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            failed.extend(regressions)
+        else:
+            print("\nNo regressions against the baseline")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Synthetic inputs for offline benchmarks: stock-like clips generated with
+ffmpeg's lavfi sources, tone narration from a stub TTS, and scripts of a
+given spoken length.
+"""
+
+import os
+import random
+import hashlib
+
+from utility.render.ffmpeg_tools import run_ffmpeg
+
+# Narration speed the stub TTS and the script generator agree on
+WORDS_PER_MINUTE = 150
+
+# lavfi sources with different content and compressibility, like real stock footage
+CLIP_PATTERNS = [
+    "testsrc2=size={w}x{h}:rate={fps}",
+    "mandelbrot=size={w}x{h}:rate={fps}",
+    "life=size={w}x{h}:rate={fps}:mold=10:ratio=0.1:death_color=#202040:life_color=#80c0ff",
+    "cellauto=size={w}x{h}:rate={fps}:rule=110",
+    "smptehdbars=size={w}x{h}:rate={fps}",
+    "gradients=size={w}x{h}:rate={fps}:speed=0.02",
+    "rgbtestsrc=size={w}x{h}:rate={fps}",
+    "testsrc=size={w}x{h}:rate={fps}"
+]
+
+# Words the keyword extractor turns into queries; mostly nature footage terms
+VOCABULARY = [
+    "ocean", "waves", "sunset", "mountains", "forest", "river", "desert", "glacier", "volcano", "canyon",
+    "clouds", "storm", "lightning", "rainbow", "waterfall", "island", "coral", "reef", "whale", "dolphin",
+    "eagle", "wolf", "bear", "deer", "butterfly", "flowers", "meadow", "valley", "lake", "stars",
+    "galaxy", "planet", "moon", "city", "skyline", "bridge", "harbor", "train", "market", "village",
+    "farm", "wheat", "vineyard", "snow", "ice", "aurora", "sunrise", "fog", "rain", "wind"
+]
+FILLER = ["the", "a", "of", "and", "in", "over", "beneath", "across", "with", "where", "every", "quiet", "vast",
+          "ancient", "bright", "slowly", "we", "see", "how", "light", "moves", "through", "life", "returns"]
+
+
+def make_clip(path, seconds=8, width=1280, height=720, fps=25, pattern=0):
+    """Encode a synthetic H.264 clip (no audio) with one of CLIP_PATTERNS, unless it already exists."""
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    source = CLIP_PATTERNS[pattern % len(CLIP_PATTERNS)].format(w=width, h=height, fps=fps)
+    tmp_path = path + ".tmp.mp4"
+    run_ffmpeg(["-v", "error", "-f", "lavfi", "-i", source, "-t", f"{seconds:.3f}",
+                "-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p", tmp_path])
+    os.replace(tmp_path, path)
+    return path
+
+
+def make_clip_library(directory, count=12, seconds=8, width=1280, height=720, fps=25):
+    """
+    Generate ``count`` distinct clips in ``directory`` (reused between runs).
+
+    Returns:
+        list: Paths of the clips
+    """
+    return [make_clip(os.path.join(directory, f"clip_{index:03d}_{width}x{height}_{seconds}s.mp4"),
+                      seconds, width, height, fps, pattern=index)
+            for index in range(count)]
+
+
+def stub_tts(text, output_file, words_per_minute=WORDS_PER_MINUTE):
+    """
+    Stand-in for the TTS stage: a tone as long as ``text`` would take to speak.
+
+    Returns:
+        float: Length of the audio in seconds
+    """
+    seconds = max(1.0, len(text.split()) * 60.0 / words_per_minute)
+    run_ffmpeg(["-v", "error", "-f", "lavfi", "-i", f"sine=frequency=220:sample_rate=24000:duration={seconds:.3f}",
+                "-ac", "1", "-c:a", "libmp3lame", "-b:a", "48k", output_file])
+    return seconds
+
+
+def synthetic_script(minutes, seed=0):
+    """
+    A deterministic narration script that takes about ``minutes`` to speak
+    at WORDS_PER_MINUTE.
+    """
+    rng = random.Random(f"{seed}-{minutes}")
+    target = int(minutes * WORDS_PER_MINUTE)
+    sentences = []
+    words = 0
+    while words < target:
+        length = rng.randint(8, 18)
+        sentence = [rng.choice(VOCABULARY) if rng.random() < 0.35 else rng.choice(FILLER) for _ in range(length)]
+        sentences.append(" ".join(sentence).capitalize() + ".")
+        words += length
+    return " ".join(sentences)
+
+
+def clip_for_query(query, clip_count):
+    """Stable clip index for a search query, so the same query always finds the same footage."""
+    return int(hashlib.sha1(query.lower().encode("utf-8")).hexdigest(), 16) % clip_count
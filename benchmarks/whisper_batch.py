@@ -0,0 +1,115 @@
+"""
+Batched Whisper transcription benchmark: the 30-second windows of several
+narrations transcribed one at a time (batch size 1, as when every job
+transcribes its own narration) against batches shared by all narrations
+(utility.captions.batch_transcription).
+
+Both modes run the same model, decoding and alignment code on the CPU; only
+the batch size differs. Models are randomly initialized with the
+architecture of a released size, so nothing is downloaded (see
+benchmarks/whisper_cpu.py). The report lists the wall time and throughput
+(seconds of audio per wall second) of each mode and the speedup of batching.
+
+Requires openai-whisper.
+
+Usage (from the repository root):
+    python -m benchmarks.whisper_batch
+    python -m benchmarks.whisper_batch --size base --narrations 8 --seconds 45 --batch-size 8 --output batch.json
+"""
+
+import sys
+import json
+import time
+import platform
+import argparse
+
+import torch
+
+from utility.captions.whisper_cpu import (random_whisper_model, quantize_model, WHISPER_DIMENSIONS, WHISPER_DECODING,
+                                          SAMPLE_RATE)
+from utility.captions.batch_transcription import TranscriptionService, split_windows, WHISPER_BATCH_SIZE
+from utility.render.render_profiles import available_cpus
+from benchmarks.whisper_cpu import synthetic_audio
+
+
+def run_mode(name, model, audios, batch_size, profile):
+    with TranscriptionService(model, profile=profile, batch_size=batch_size, wait=0) as service:
+        start = time.perf_counter()
+        transcriptions = service.transcribe_many(audios)
+        seconds = time.perf_counter() - start
+        stats = dict(service.stats)
+    audio_seconds = sum(len(audio) for audio in audios) / SAMPLE_RATE
+    return {
+        "name": name,
+        "batch_size": batch_size,
+        "batches": stats["batches"],
+        "windows": stats["windows"],
+        "seconds": round(seconds, 3),
+        "audio_seconds": round(audio_seconds, 3),
+        "throughput": round(audio_seconds / seconds, 3) if seconds else None,
+        "words": [sum(len(segment["words"]) for segment in t["segments"]) for t in transcriptions]
+    }
+
+
+def format_report(report):
+    lines = [f"Whisper {report['size']} (random weights, {'int8' if report['quantized'] else 'fp32'}), "
+             f"{report['narrations']} narrations, {report['audio_seconds']:.0f}s of audio, {report['cpus']} CPUs",
+             f"{'mode':<12} {'batch':>5} {'batches':>7} {'seconds':>9} {'audio s/s':>9} {'speedup':>8}"]
+    for run in report["runs"]:
+        speedup = f"{run['speedup']:.2f}x" if run.get("speedup") else "-"
+        lines.append(f"{run['name']:<12} {run['batch_size']:>5} {run['batches']:>7} {run['seconds']:>9.2f} "
+                     f"{run['throughput']:>9.3f} {speedup:>8}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched against sequential Whisper transcription.")
+    parser.add_argument("--size", choices=sorted(WHISPER_DIMENSIONS), default="tiny", help="Model architecture")
+    parser.add_argument("--narrations", type=int, default=4, help="Number of narrations")
+    parser.add_argument("--seconds", type=float, default=40.0,
+                        help="Length of the longest narration; the others are spread down to half of it")
+    parser.add_argument("--batch-size", type=int, default=WHISPER_BATCH_SIZE, help="Windows per batch when batching")
+    parser.add_argument("--profile", choices=sorted(WHISPER_DECODING), default="standard",
+                        help="Render profile whose decoding settings to use")
+    parser.add_argument("--fp32", action="store_true", help="Keep the linear layers in full precision")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the weights and the audio")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    steps = max(1, args.narrations - 1)
+    audios = [synthetic_audio(args.seconds * (1 - 0.5 * i / steps), args.seed + i) for i in range(args.narrations)]
+    model = random_whisper_model(args.size, seed=args.seed)
+    if not args.fp32:
+        model = quantize_model(model)
+    # Warm up the mel filters, tokenizer and DTW before timing
+    run_mode("warmup", model, [synthetic_audio(2.0, args.seed)], 1, args.profile)
+
+    sequential = run_mode("sequential", model, audios, 1, args.profile)
+    batched = run_mode("batched", model, audios, args.batch_size, args.profile)
+    batched["speedup"] = round(sequential["seconds"] / batched["seconds"], 3) if batched["seconds"] else None
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "size": args.size,
+        "quantized": not args.fp32,
+        "profile": args.profile,
+        "narrations": args.narrations,
+        "windows": sum(len(split_windows(audio)) for audio in audios),
+        "audio_seconds": sequential["audio_seconds"],
+        "cpus": available_cpus(),
+        "runs": [sequential, batched]
+    }
+    print()
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
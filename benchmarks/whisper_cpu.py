@@ -0,0 +1,108 @@
+"""
+CPU Whisper benchmark: full precision with default threading against the
+CPU inference mode (int8 linear layers, threads matched to the CPUs this
+process may use).
+
+Models are randomly initialized with the architecture of a released size
+(``random_whisper_model``), so nothing is downloaded. A random model decodes
+gibberish up to the token limit of every 30-second window, so each
+configuration does the same amount of work. The report lists the realtime
+factor (wall seconds per second of audio) of each configuration and its
+speedup over the full-precision baseline.
+
+Requires openai-whisper and whisper-timestamped.
+
+Usage (from the repository root):
+    python -m benchmarks.whisper_cpu
+    python -m benchmarks.whisper_cpu --size base --seconds 60 --profiles standard final --output whisper.json
+"""
+
+import sys
+import json
+import time
+import platform
+import argparse
+
+import numpy as np
+import torch
+
+from utility.captions.whisper_cpu import (random_whisper_model, quantize_model, transcribe_cpu, WHISPER_DIMENSIONS,
+                                          WHISPER_DECODING, SAMPLE_RATE)
+from utility.render.render_profiles import available_cpus
+
+WARMUP_SECONDS = 2.0  # Audio transcribed once per model before timing, to load the tokenizer and mel filters
+
+
+def synthetic_audio(seconds, seed=0):
+    """Speech-band tones with noise at 16 kHz; only the length matters to the model's cost."""
+    rng = np.random.RandomState(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 140 + 40 * np.sin(2 * np.pi * 0.3 * t)
+    audio = 0.3 * np.sin(2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE) + 0.05 * rng.randn(len(t))
+    return audio.astype(np.float32)
+
+
+def run_configuration(name, size, audio, quantize, threads, profile, seed):
+    model = random_whisper_model(size, seed=seed)
+    if quantize:
+        model = quantize_model(model)
+    transcribe_cpu(model, synthetic_audio(WARMUP_SECONDS, seed), profile=profile, threads=threads)
+    result, stats = transcribe_cpu(model, audio, profile=profile, threads=threads)
+    stats.update(name=name, profile=profile, words=sum(len(segment.get("words", [])) for segment in result["segments"]))
+    return stats
+
+
+def format_report(report):
+    lines = [f"Whisper {report['size']} (random weights), {report['audio_seconds']:.0f}s of audio, "
+             f"{report['cpus']} CPUs available",
+             f"{'configuration':<28} {'profile':<10} {'threads':>7} {'seconds':>9} {'RTF':>7} {'speedup':>8}"]
+    for run in report["runs"]:
+        speedup = f"{run['speedup']:.2f}x" if run.get("speedup") else "-"
+        lines.append(f"{run['name']:<28} {run['profile']:<10} {run['threads']:>7} {run['seconds']:>9.2f} "
+                     f"{run['realtime_factor']:>7.3f} {speedup:>8}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CPU Whisper inference mode on a random model.")
+    parser.add_argument("--size", choices=sorted(WHISPER_DIMENSIONS), default="tiny", help="Model architecture")
+    parser.add_argument("--seconds", type=float, default=30.0, help="Length of the synthetic narration")
+    parser.add_argument("--profiles", nargs="+", choices=sorted(WHISPER_DECODING), default=["standard"],
+                        help="Render profiles whose decoding settings to measure")
+    parser.add_argument("--threads", type=int, help="Threads for the CPU mode (default: the CPUs available)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the weights and the audio")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    audio = synthetic_audio(args.seconds, args.seed)
+    default_threads = torch.get_num_threads()
+    cpu_threads = args.threads or available_cpus()
+    runs = []
+    for profile in args.profiles:
+        baseline = run_configuration("fp32, default threads", args.size, audio, False, default_threads, profile,
+                                     args.seed)
+        tuned = run_configuration("int8, tuned threads", args.size, audio, True, cpu_threads, profile, args.seed)
+        tuned["speedup"] = round(baseline["seconds"] / tuned["seconds"], 3) if tuned["seconds"] else None
+        runs += [baseline, tuned]
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "size": args.size,
+        "audio_seconds": args.seconds,
+        "cpus": available_cpus(),
+        "runs": runs
+    }
+    print()
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
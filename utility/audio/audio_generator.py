@@ -4,7 +4,10 @@ import os
 import subprocess
 import sys
 
-async def generate_audio(text, outputFilename):
+# Neural voice used when none is given
+DEFAULT_VOICE = "en-AU-WilliamNeural"
+
+async def generate_audio(text, outputFilename, voice=DEFAULT_VOICE):
     """
     Generate audio from text using edge_tts.
     Falls back to a silent audio file if text-to-speech fails.
@@ -12,16 +15,18 @@ async def generate_audio(text, outputFilename):
     Args:
         text (str): The text to convert to speech
         outputFilename (str): Filename to save the audio to
+        voice (str, optional): edge-tts voice name
         
     Returns:
-        None
+        bool: True if the file holds speech, False if it is the silent fallback
     """
     try:
         # Attempt to use edge_tts for text-to-speech
         print(f"Generating audio using edge-tts... ({len(text.split())} words)")
-        communicate = edge_tts.Communicate(text, "en-AU-WilliamNeural")
+        communicate = edge_tts.Communicate(text, voice or DEFAULT_VOICE)
         await communicate.save(outputFilename)
         print(f"Successfully generated audio with edge-tts: {outputFilename}")
+        return True
     
     except Exception as e:
         print(f"Error generating audio with edge_tts: {e}")
@@ -50,6 +55,7 @@ async def generate_audio(text, outputFilename):
             
             if result.returncode == 0:
                 print("Successfully created silent audio file as fallback.")
+                return False
             else:
                 print(f"Error creating silent audio file: {result.stderr}")
                 raise RuntimeError("Failed to create audio file")
@@ -81,6 +87,7 @@ async def generate_audio(text, outputFilename):
                 # Save as WAV
                 wavfile.write(outputFilename, sample_rate, samples)
                 print(f"Created emergency audio file: {outputFilename}")
+                return False
                 
             except Exception as final_error:
                 print(f"All audio generation methods failed: {final_error}")
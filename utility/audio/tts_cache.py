@@ -0,0 +1,98 @@
+"""
+Persistent cache of synthesized narration.
+
+Narration is stored under a key derived from the voice and the exact text,
+so a script that was already spoken (on this machine or, with a shared
+TTS_CACHE_DIR, on any other render node) is copied instead of synthesized
+again. A file lock per entry makes sure only one process synthesizes a given
+text at a time; entries are published atomically, and silent fallback audio
+is never cached.
+"""
+
+import os
+import shutil
+import hashlib
+
+from filelock import FileLock
+
+from utility.tracing import span
+
+# Cache settings
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "text-to-video", "tts"))
+
+
+def tts_cache_key(text, voice):
+    return hashlib.sha256(f"{voice}|{text}".encode("utf-8")).hexdigest()
+
+
+def _entry_path(key, directory):
+    return os.path.join(directory or TTS_CACHE_DIR, key[:2], key + ".mp3")
+
+
+def get_cached_audio(text, voice, directory=None):
+    """
+    Look up the narration previously synthesized for ``text``.
+
+    Returns:
+        str: Path of the cached audio, or None on a miss
+    """
+    path = _entry_path(tts_cache_key(text, voice), directory)
+    try:
+        if os.path.getsize(path) > 0:
+            return path
+    except OSError:
+        pass
+    return None
+
+
+def fetch_audio(text, voice, output_file, synthesize, directory=None):
+    """
+    Write the narration for ``text`` to ``output_file``, from the cache when
+    possible.
+
+    Args:
+        text (str): Narration text
+        voice (str): Voice name; part of the cache key
+        output_file (str): Where to write the audio
+        synthesize (callable): ``synthesize(path)`` writes the audio and
+            returns True for speech, False for a silent fallback
+        directory (str, optional): Cache directory; defaults to TTS_CACHE_DIR
+
+    Returns:
+        bool: True if ``output_file`` holds speech
+    """
+    with span("tts cache", category="io") as trace_args:
+        key = tts_cache_key(text, voice)
+        path = _entry_path(key, directory)
+        cached = get_cached_audio(text, voice, directory)
+        if cached is not None:
+            trace_args["cache"] = "hit"
+            shutil.copyfile(cached, output_file)
+            print(f"Using cached narration: {cached}")
+            return True
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            lock = FileLock(path + ".lock")
+        except OSError as e:
+            print(f"Warning: TTS cache unavailable: {str(e)}")
+            trace_args["cache"] = "off"
+            return bool(synthesize(output_file))
+
+        with lock:
+            # Another process may have synthesized it while we waited
+            cached = get_cached_audio(text, voice, directory)
+            if cached is not None:
+                trace_args["cache"] = "hit"
+                shutil.copyfile(cached, output_file)
+                return True
+            trace_args["cache"] = "miss"
+            if not synthesize(output_file):
+                return False
+            try:
+                tmp_path = path + ".tmp"
+                shutil.copyfile(output_file, tmp_path)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Warning: Could not write TTS cache entry: {str(e)}")
+            return True
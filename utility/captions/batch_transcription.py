@@ -0,0 +1,405 @@
+"""
+Batched Whisper transcription across narrations.
+
+Transcribing each narration on its own runs Whisper's encoder at batch size
+1, once per 30-second window, for every job. ``TranscriptionService`` instead
+collects the 30-second windows of every narration submitted to it (from any
+number of jobs running in threads) and runs them through the model in
+batches:
+
+- each narration is cut into windows of at most 30 seconds, at the quietest
+  moment near the end of each window so words are rarely cut in half,
+- a batch of windows is encoded in one encoder pass and decoded together,
+- word timings come from the cross-attention of one more decoder pass over
+  the whole batch (the alignment whisper's ``word_timestamps`` uses),
+- the words are shifted by their window's offset and returned per narration
+  in the transcription format of whisper_timestamped, ready for
+  ``getCaptionsWithTime``.
+
+A batch is run as soon as it is full, or ``WHISPER_BATCH_WAIT`` seconds
+after its oldest window arrived. Decoding follows the render profile like
+the CPU mode does (see utility.captions.whisper_cpu), except that there is no
+fallback to higher temperatures.
+
+    service = shared_service("base", profile="standard")
+    transcription = service.transcribe(audio)  # blocks until its windows are done
+"""
+
+import os
+import time
+import threading
+import collections
+from concurrent.futures import Future, InvalidStateError
+
+import numpy as np
+import torch
+
+from utility.tracing import span
+from utility.deadline import current_deadline, JobInterrupted, WATCH_INTERVAL
+from utility.captions.whisper_cpu import (decoding_options, set_cpu_threads, is_quantized, use_cpu_mode,
+                                          load_cpu_model, SAMPLE_RATE, _INFERENCE_LOCK)
+
+# Batching settings
+WHISPER_BATCH_SIZE = int(os.environ.get("WHISPER_BATCH_SIZE", "8"))  # Windows per encoder/decoder batch
+WHISPER_BATCH_WAIT = float(os.environ.get("WHISPER_BATCH_WAIT", "0.5"))  # Seconds a window waits for a fuller batch
+WINDOW_SECONDS = 30  # Whisper's input length
+SPLIT_SEARCH_SECONDS = 2.0  # A window is cut at the quietest point this close to its end
+SPLIT_FRAME = 320  # Samples per energy frame when looking for that point (20 ms)
+MEDFILT_WIDTH = 7  # Median filter over the alignment weights, as in whisper.timing
+PREPEND_PUNCTUATIONS = "\"'“¿([{-"
+APPEND_PUNCTUATIONS = "\"'.。,，!！?？:：”)]}、"
+
+_SERVICES = {}
+_SERVICES_LOCK = threading.Lock()
+
+
+def split_windows(audio, window_seconds=WINDOW_SECONDS):
+    """
+    Cut 16 kHz audio into windows of at most ``window_seconds``.
+
+    Returns:
+        list: (offset in samples, samples) pairs covering the audio in order
+    """
+    window = int(window_seconds * SAMPLE_RATE)
+    search = int(SPLIT_SEARCH_SECONDS * SAMPLE_RATE) // SPLIT_FRAME * SPLIT_FRAME
+    windows = []
+    start = 0
+    while len(audio) - start > window:
+        end = start + window
+        frames = audio[end - search:end].reshape(-1, SPLIT_FRAME)
+        cut = end - search + int(np.argmin((frames ** 2).mean(axis=1))) * SPLIT_FRAME
+        windows.append((start, audio[start:cut]))
+        start = cut
+    if len(audio) > start:
+        windows.append((start, audio[start:]))
+    return windows
+
+
+def _decoding(profile, language):
+    from whisper.decoding import DecodingOptions
+
+    # Timestamp tokens are decoded as whisper's transcribe does, then dropped:
+    # word timings come from the alignment
+    settings = decoding_options(profile)
+    temperature = settings["temperature"]
+    # One pass per batch: the first temperature of a fallback schedule
+    temperature = temperature[0] if isinstance(temperature, (tuple, list)) else temperature
+    return DecodingOptions(task="transcribe", language=language, temperature=temperature,
+                           beam_size=settings.get("beam_size"),
+                           best_of=settings.get("best_of") if temperature > 0 else None,
+                           fp16=False)
+
+
+def _align(model, tokenizer, audio_features, text_tokens, frames):
+    """
+    Word timings of several windows from one decoder pass.
+
+    Args:
+        audio_features (torch.Tensor): Encoder output of the windows
+        text_tokens (list): Decoded text tokens per window
+        frames (list): Mel frames of actual audio per window
+
+    Returns:
+        list: whisper.timing.WordTiming lists, relative to each window's start
+    """
+    from whisper.model import disable_sdpa
+    from whisper.timing import median_filter, dtw, merge_punctuations, WordTiming, TOKENS_PER_SECOND
+
+    prefix = [*tokenizer.sot_sequence, tokenizer.no_timestamps]
+    sequences = [prefix + tokens + [tokenizer.eot] for tokens in text_tokens]
+    # Padding goes after each sequence; the causal mask keeps it from affecting the tokens before it
+    length = max(len(sequence) for sequence in sequences)
+    tokens = torch.tensor([sequence + [tokenizer.eot] * (length - len(sequence)) for sequence in sequences],
+                          device=audio_features.device)
+
+    decoder = model.decoder
+    cross_qk = [None] * model.dims.n_text_layer
+    hooks = [block.cross_attn.register_forward_hook(lambda _, ins, outs, index=i: cross_qk.__setitem__(index, outs[-1]))
+             for i, block in enumerate(decoder.blocks)]
+    try:
+        with disable_sdpa():
+            # Only the cross-attention is needed, so the blocks are run without the vocabulary projection
+            x = (decoder.token_embedding(tokens) + decoder.positional_embedding[:length]).to(audio_features.dtype)
+            for block in decoder.blocks:
+                x = block(x, audio_features, mask=decoder.mask)
+    finally:
+        for hook in hooks:
+            hook.remove()
+
+    heads = model.alignment_heads.indices().T
+    alignments = []
+    for index, (window_tokens, num_frames) in enumerate(zip(text_tokens, frames)):
+        words, word_tokens = tokenizer.split_to_word_tokens(window_tokens + [tokenizer.eot])
+        if len(word_tokens) <= 1:
+            alignments.append([])
+            continue
+        size = len(sequences[index])
+        weights = torch.stack([cross_qk[layer][index, head, :size, :num_frames // 2] for layer, head in heads])
+        weights = weights.float().softmax(dim=-1)
+        std, mean = torch.std_mean(weights, dim=-2, keepdim=True, unbiased=False)
+        weights = median_filter((weights - mean) / std, MEDFILT_WIDTH)
+        matrix = weights.mean(dim=0)[len(tokenizer.sot_sequence):-1]
+        text_indices, time_indices = dtw(-matrix)
+
+        word_boundaries = np.pad(np.cumsum([len(t) for t in word_tokens[:-1]]), (1, 0))
+        jumps = np.pad(np.diff(text_indices), (1, 0), constant_values=1).astype(bool)
+        jump_times = time_indices[jumps] / TOKENS_PER_SECOND
+        alignment = [WordTiming(word, word_token, float(start), float(end), None)
+                     for word, word_token, start, end in zip(words, word_tokens, jump_times[word_boundaries[:-1]],
+                                                             jump_times[word_boundaries[1:]])]
+        merge_punctuations(alignment, PREPEND_PUNCTUATIONS, APPEND_PUNCTUATIONS)
+        alignments.append(alignment)
+    return alignments
+
+
+def transcribe_windows(model, windows, profile=None, language="en"):
+    """
+    Transcribe a batch of audio windows in one encoder pass.
+
+    Args:
+        model: Whisper model (quantized or not)
+        windows (list): Arrays of 16 kHz samples, at most 30 seconds each
+        profile (str or dict, optional): Render profile picking greedy or beam decoding
+
+    Returns:
+        list: Per window, its words as {"text", "start", "end"} dicts in
+            seconds from the window's start
+    """
+    from whisper.audio import log_mel_spectrogram, pad_or_trim, N_FRAMES, HOP_LENGTH
+    from whisper.tokenizer import get_tokenizer
+
+    tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages, language=language,
+                              task="transcribe")
+    with torch.inference_mode():
+        mel = torch.stack([log_mel_spectrogram(pad_or_trim(torch.from_numpy(np.asarray(samples, dtype=np.float32))),
+                                               model.dims.n_mels)[:, :N_FRAMES] for samples in windows])
+        audio_features = model.encoder(mel.to(model.device))
+        results = model.decode(audio_features, _decoding(profile, language))
+
+        text_tokens = [[token for token in result.tokens if token < tokenizer.eot] for result in results]
+        spoken = [index for index, tokens in enumerate(text_tokens) if tokens]
+        words = [[] for _ in windows]
+        if spoken:
+            alignments = _align(model, tokenizer, audio_features[spoken], [text_tokens[i] for i in spoken],
+                                [min(N_FRAMES, len(windows[i]) // HOP_LENGTH) for i in spoken])
+            for index, alignment in zip(spoken, alignments):
+                words[index] = [{"text": timing.word.strip(), "start": round(timing.start, 3),
+                                 "end": round(timing.end, 3)} for timing in alignment if timing.word.strip()]
+    return words
+
+
+def build_transcription(windows):
+    """
+    Join per-window words into one transcription in whisper_timestamped's
+    format (one segment per window), as ``getCaptionsWithTime`` expects.
+
+    Args:
+        windows (list): (offset in seconds, words) pairs in order
+    """
+    segments = []
+    for offset, words in windows:
+        if not words:
+            continue
+        shifted = [dict(word, start=round(offset + word["start"], 3), end=round(offset + word["end"], 3))
+                   for word in words]
+        segments.append({"id": len(segments), "start": shifted[0]["start"], "end": shifted[-1]["end"],
+                         "text": " ".join(word["text"] for word in shifted), "words": shifted})
+    return {"text": " ".join(segment["text"] for segment in segments), "segments": segments, "language": "en"}
+
+
+class _Request:
+    def __init__(self, windows):
+        self.future = Future()
+        self.offsets = [offset / SAMPLE_RATE for offset, _ in windows]
+        self.words = [None] * len(windows)
+        self.left = len(windows)
+
+
+class TranscriptionService:
+    """
+    Transcribes narrations submitted from any thread, batching the 30-second
+    windows of all of them through one model.
+
+    Args:
+        model: Whisper model, e.g. from load_cpu_model
+        profile (str or dict, optional): Render profile picking greedy or beam decoding
+        batch_size (int): Windows per batch
+        wait (float): Seconds a window waits for the batch to fill up
+        threads (int, optional): Intra-op threads (see whisper_cpu.set_cpu_threads)
+    """
+
+    def __init__(self, model, profile=None, batch_size=WHISPER_BATCH_SIZE, wait=WHISPER_BATCH_WAIT, language="en",
+                 threads=None):
+        self.model = model
+        self.profile = profile
+        self.batch_size = max(1, batch_size)
+        self.wait = wait
+        self.language = language
+        self.threads = threads
+        self.stats = {"batches": 0, "windows": 0, "audio_seconds": 0.0, "seconds": 0.0}
+        self._pending = collections.deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+        # Compile whisper's numba DTW here rather than on the batching thread:
+        # compiled there first, it keeps the interpreter from exiting
+        from whisper.timing import dtw
+        dtw(torch.zeros(2, 2))
+
+    def submit(self, audio):
+        """
+        Queue a narration (16 kHz samples).
+
+        Returns:
+            concurrent.futures.Future: Resolves to its transcription
+        """
+        windows = split_windows(audio)
+        request = _Request(windows)
+        if not windows:
+            request.future.set_result(build_transcription([]))
+            return request.future
+        queued = time.monotonic()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Transcription service is closed")
+            self._pending.extend((request, index, samples, queued) for index, (_, samples) in enumerate(windows))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="whisper-batches", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return request.future
+
+    def transcribe(self, audio):
+        """Transcribe a narration, waiting for its batches; gives up when the job's deadline passes."""
+        return _wait([self.submit(audio)])[0]
+
+    def transcribe_many(self, audios):
+        """Transcribe several narrations; their windows share batches. Gives up when the job's deadline passes."""
+        return _wait([self.submit(audio) for audio in audios])
+
+    def close(self):
+        """Finish the queued windows and stop the batching thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            # Wait for a full batch, but no longer than ``wait`` after the oldest window arrived
+            while self._pending and len(self._pending) < self.batch_size and not self._closed:
+                left = self._pending[0][3] + self.wait - time.monotonic()
+                if left <= 0:
+                    break
+                self._condition.wait(left)
+            return [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            # Windows of a narration that already failed are not transcribed
+            batch = [entry for entry in batch if not entry[0].future.done()]
+            if batch:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        windows = [samples for _, _, samples, _ in batch]
+        audio_seconds = sum(len(samples) for samples in windows) / SAMPLE_RATE
+        try:
+            with _INFERENCE_LOCK, span("transcribe batch", category="whisper") as trace_args:
+                threads = set_cpu_threads(self.threads)
+                start = time.perf_counter()
+                words = transcribe_windows(self.model, windows, self.profile, self.language)
+                seconds = time.perf_counter() - start
+                trace_args.update(windows=len(windows), audio_seconds=round(audio_seconds, 3),
+                                  seconds=round(seconds, 3), threads=threads, quantized=is_quantized(self.model))
+        except Exception as e:
+            print(f"Batch transcription of {len(windows)} windows failed: {str(e)}")
+            for request, _, _, _ in batch:
+                _resolve(request.future, exception=e)
+            return
+
+        self.stats["batches"] += 1
+        self.stats["windows"] += len(windows)
+        self.stats["audio_seconds"] += audio_seconds
+        self.stats["seconds"] += seconds
+        print(f"Transcribed a batch of {len(windows)} windows ({audio_seconds:.1f}s of audio) in {seconds:.1f}s: "
+              f"realtime factor {seconds / audio_seconds:.3f}")
+        for (request, index, _, _), window_words in zip(batch, words):
+            request.words[index] = window_words
+            request.left -= 1
+            if request.left == 0:
+                _resolve(request.future, result=build_transcription(list(zip(request.offsets, request.words))))
+
+
+def _wait(futures):
+    """
+    Wait for transcription futures, checking the job's deadline meanwhile.
+    When the job is interrupted the futures still pending are cancelled, so
+    the batching thread drops their remaining windows, and the interruption
+    is raised.
+
+    Returns:
+        list: The futures' results, in order
+    """
+    deadline = current_deadline()
+    try:
+        results = []
+        for future in futures:
+            while True:
+                try:
+                    results.append(future.result(timeout=WATCH_INTERVAL if deadline.bounded else None))
+                    break
+                except TimeoutError:
+                    deadline.check("captions")
+        return results
+    except JobInterrupted:
+        for future in futures:
+            future.cancel()
+        raise
+
+
+def _resolve(future, result=None, exception=None):
+    """Set a request's outcome unless it was cancelled (or failed) meanwhile."""
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+def shared_service(model_size="base", profile=None, inference=None):
+    """
+    The process's batching service for a model size and decoding profile,
+    so concurrent jobs share its batches. The model is loaded on first use.
+
+    Args:
+        inference (str, optional): "auto", "cpu" or "default" (see whisper_cpu.WHISPER_INFERENCE)
+    """
+    name = profile.get("name") if isinstance(profile, dict) else profile
+    cpu_mode = use_cpu_mode(inference)
+    key = (model_size, name, cpu_mode)
+    with _SERVICES_LOCK:
+        service = _SERVICES.get(key)
+        if service is None:
+            if cpu_mode:
+                model = load_cpu_model(model_size)
+            else:
+                from whisper_timestamped import load_model
+                print(f"Loading Whisper model ({model_size})...")
+                model = load_model(model_size)
+            service = _SERVICES[key] = TranscriptionService(model, profile=name)
+    return service
@@ -2,10 +2,13 @@ import whisper_timestamped as whisper
 from whisper_timestamped import load_model, transcribe_timestamped
 import re
 import os
+from bisect import bisect_left
 import numpy as np
 import soundfile as sf
 from .dummy_captions_generator import generate_dummy_captions
 from .audio_processor import preprocess_audio
+from .whisper_cpu import use_cpu_mode, load_cpu_model, transcribe_cpu
+from utility.deadline import JobInterrupted
 
 def validate_audio_file(audio_filename):
     """Validate that the audio file exists and is readable"""
@@ -21,9 +24,19 @@ def validate_audio_file(audio_filename):
     except Exception as e:
         raise ValueError(f"Invalid audio file: {str(e)}")
 
-def generate_timed_captions(audio_filename, model_size="base"):
-    """Generate timed captions from audio file with robust error handling"""
+def generate_timed_captions(audio_filename, model_size="base", profile=None, inference=None, transcriber=None):
+    """
+    Generate timed captions from audio file with robust error handling
+
+    Args:
+        profile (str, optional): Render profile; picks greedy or beam decoding in the CPU mode
+        inference (str, optional): "auto", "cpu" or "default" (see whisper_cpu.WHISPER_INFERENCE)
+        transcriber (TranscriptionService, optional): Batching service to transcribe
+            through (see batch_transcription); its model is used instead of loading one
+    """
     try:
+        cpu_mode = use_cpu_mode(inference)
+
         # Validate audio file first
         validate_audio_file(audio_filename)
         
@@ -35,8 +48,13 @@ def generate_timed_captions(audio_filename, model_size="base"):
         
         # Try to load the Whisper model
         try:
-            print(f"Loading Whisper model ({model_size})...")
-            WHISPER_MODEL = load_model(model_size)
+            if transcriber is not None:
+                WHISPER_MODEL = transcriber.model
+            elif cpu_mode:
+                WHISPER_MODEL = load_cpu_model(model_size)
+            else:
+                print(f"Loading Whisper model ({model_size})...")
+                WHISPER_MODEL = load_model(model_size)
             if WHISPER_MODEL is None:
                 raise ValueError("Failed to load Whisper model")
         except Exception as model_error:
@@ -46,13 +64,18 @@ def generate_timed_captions(audio_filename, model_size="base"):
         # Try to transcribe the audio
         try:
             print("Transcribing audio...")
-            gen = transcribe_timestamped(
-                WHISPER_MODEL, 
-                audio_data,  # Use preprocessed audio data
-                verbose=True,
-                fp16=False,
-                language="en"
-            )
+            if transcriber is not None:
+                gen = transcriber.transcribe(audio_data)
+            elif cpu_mode:
+                gen, _ = transcribe_cpu(WHISPER_MODEL, audio_data, profile=profile)
+            else:
+                gen = transcribe_timestamped(
+                    WHISPER_MODEL, 
+                    audio_data,  # Use preprocessed audio data
+                    verbose=True,
+                    fp16=False,
+                    language="en"
+                )
             
             # Validate transcription results
             if not gen or not isinstance(gen, dict):
@@ -60,6 +83,9 @@ def generate_timed_captions(audio_filename, model_size="base"):
             if 'segments' not in gen or not gen['segments']:
                 raise ValueError("No segments found in transcription")
                 
+        except JobInterrupted:
+            # A timed-out or cancelled job stops here instead of rendering dummy captions
+            raise
         except Exception as transcribe_error:
             print(f"Failed to transcribe audio: {str(transcribe_error)}")
             return generate_dummy_captions("", audio_filename, duration=30.0)
@@ -75,6 +101,8 @@ def generate_timed_captions(audio_filename, model_size="base"):
             print(f"Failed to process transcription: {str(process_error)}")
             return generate_dummy_captions("", audio_filename, duration=30.0)
             
+    except JobInterrupted:
+        raise
     except Exception as e:
         print(f"Unexpected error in caption generation: {str(e)}")
         print("Falling back to dummy captions...")
@@ -95,13 +123,15 @@ def splitWordsBySize(words, maxCaptionSize):
    
     halfCaptionSize = maxCaptionSize / 2
     captions = []
-    while words:
-        caption = words[0]
-        words = words[1:]
-        while words and len(caption + ' ' + words[0]) <= maxCaptionSize:
-            caption += ' ' + words[0]
-            words = words[1:]
-            if len(caption) >= halfCaptionSize and words:
+    # Walk the list with an index; slicing off the first word each time made this quadratic
+    i = 0
+    while i < len(words):
+        caption = words[i]
+        i += 1
+        while i < len(words) and len(caption + ' ' + words[i]) <= maxCaptionSize:
+            caption += ' ' + words[i]
+            i += 1
+            if len(caption) >= halfCaptionSize and i < len(words):
                 break
         captions.append(caption)
     return captions
@@ -131,6 +161,11 @@ def interpolateTimeFromDict(word_position, d):
 def getCaptionsWithTime(whisper_analysis, maxCaptionSize=15, considerPunctuation=False):
    
     wordLocationToTime = getTimestampMapping(whisper_analysis)
+    # The mapping's ranges are contiguous and in order, so the range holding a
+    # position is found by bisection instead of interpolateTimeFromDict's scan
+    # over every word (which made this quadratic in the transcript length)
+    locationEnds = [key[1] for key in wordLocationToTime]
+    locationTimes = list(wordLocationToTime.values())
     position = 0
     start_time = 0
     CaptionsPairs = []
@@ -145,7 +180,8 @@ def getCaptionsWithTime(whisper_analysis, maxCaptionSize=15, considerPunctuation
     
     for word in words:
         position += len(word) + 1
-        end_time = interpolateTimeFromDict(position, wordLocationToTime)
+        index = bisect_left(locationEnds, position)
+        end_time = locationTimes[index] if index < len(locationEnds) else None
         if end_time and word:
             CaptionsPairs.append(((start_time, end_time), word))
             start_time = end_time
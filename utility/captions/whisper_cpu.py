@@ -0,0 +1,204 @@
+"""
+CPU inference mode for Whisper.
+
+By default Whisper runs in full precision with torch's default threading,
+which makes transcription the slowest stage after rendering on hosts
+without a GPU. This mode:
+
+- quantizes the model's linear layers to int8 (dynamic quantization: int8
+  weights, activations quantized on the fly), where most of the CPU time goes,
+- sets torch's intra-op threads to the CPUs this worker may use
+  (``WHISPER_THREADS`` overrides),
+- decodes greedily or with beam search depending on the render profile
+  (``WHISPER_DECODING``),
+- reports the realtime factor (wall seconds per second of audio) of every
+  transcription, in the console and on its tracing span.
+
+``random_whisper_model`` builds a randomly initialized model with the
+architecture of a released size. Use it to exercise and benchmark the mode
+without downloading weights (see benchmarks/whisper_cpu.py).
+"""
+
+import os
+import time
+import threading
+import warnings
+
+import torch
+
+from utility.tracing import span
+from utility.render.render_profiles import available_cpus
+
+# CPU inference settings
+WHISPER_INFERENCE_MODES = ("auto", "cpu", "default")
+WHISPER_INFERENCE = os.environ.get("WHISPER_INFERENCE", "auto")  # "auto" uses the CPU mode when CUDA is unavailable
+WHISPER_QUANTIZE = os.environ.get("WHISPER_QUANTIZE", "1") != "0"  # int8 linear layers in the CPU mode
+WHISPER_THREADS = int(os.environ.get("WHISPER_THREADS", "0"))  # Intra-op threads; 0 uses every CPU this process may use
+SAMPLE_RATE = 16000  # Whisper's input rate
+
+# Decoding per render profile: greedy without temperature fallback until the
+# final render, which uses beam search
+WHISPER_DECODING = {
+    "draft": {"temperature": 0.0, "beam_size": None, "best_of": None},
+    "standard": {"temperature": 0.0, "beam_size": None, "best_of": None},
+    "final": {"temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0), "beam_size": 5, "best_of": 5}
+}
+DEFAULT_DECODING = "standard"
+
+# Architecture of the released checkpoints, for randomly initialized models
+WHISPER_DIMENSIONS = {
+    "tiny": {"n_audio_state": 384, "n_audio_head": 6, "n_audio_layer": 4,
+             "n_text_state": 384, "n_text_head": 6, "n_text_layer": 4},
+    "base": {"n_audio_state": 512, "n_audio_head": 8, "n_audio_layer": 6,
+             "n_text_state": 512, "n_text_head": 8, "n_text_layer": 6},
+    "small": {"n_audio_state": 768, "n_audio_head": 12, "n_audio_layer": 12,
+              "n_text_state": 768, "n_text_head": 12, "n_text_layer": 12}
+}
+SHARED_DIMENSIONS = {"n_mels": 80, "n_audio_ctx": 1500, "n_vocab": 51865, "n_text_ctx": 448}
+
+_MODELS = {}
+_MODELS_LOCK = threading.Lock()
+# whisper_timestamped hooks into the model while it transcribes, and one
+# transcription already uses every thread, so transcriptions run one at a time
+_INFERENCE_LOCK = threading.Lock()
+
+
+def use_cpu_mode(mode=None):
+    """
+    Whether to transcribe in the CPU mode.
+
+    Args:
+        mode (str, optional): "auto" (when CUDA is unavailable), "cpu" or
+            "default"; defaults to WHISPER_INFERENCE
+    """
+    mode = mode or WHISPER_INFERENCE
+    if mode not in WHISPER_INFERENCE_MODES:
+        raise ValueError(f"Unknown Whisper inference mode '{mode}', expected one of {WHISPER_INFERENCE_MODES}")
+    if mode == "auto":
+        return not torch.cuda.is_available()
+    return mode == "cpu"
+
+
+def set_cpu_threads(threads=None):
+    """
+    Set torch's intra-op threads: ``threads``, else WHISPER_THREADS, else the
+    CPUs this process may use. Returns the number set.
+    """
+    threads = threads or WHISPER_THREADS or available_cpus()
+    if torch.get_num_threads() != threads:
+        torch.set_num_threads(threads)
+    return threads
+
+
+def quantize_model(model):
+    """
+    Quantize a Whisper model's linear layers to int8 for CPU inference. The
+    model is modified in place and returned.
+    """
+    model = model.cpu().float().eval()
+    for module in model.modules():
+        # Whisper's Linear only adds a dtype cast to nn.Linear; quantize_dynamic
+        # matches exact types, so make them plain nn.Linear first
+        if isinstance(module, torch.nn.Linear) and type(module) is not torch.nn.Linear:
+            module.__class__ = torch.nn.Linear
+    with warnings.catch_warnings():
+        # torch flags eager-mode quantization as deprecated in favour of torchao
+        warnings.simplefilter("ignore")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def is_quantized(model):
+    return any(isinstance(module, torch.ao.nn.quantized.dynamic.Linear) for module in model.modules())
+
+
+def load_cpu_model(model_size="base", quantize=WHISPER_QUANTIZE):
+    """
+    Load a Whisper model for CPU inference, once per process.
+
+    Returns:
+        The model, with int8 linear layers if ``quantize``
+    """
+    key = (model_size, quantize)
+    with _MODELS_LOCK:
+        model = _MODELS.get(key)
+        if model is None:
+            from whisper_timestamped import load_model
+            print(f"Loading Whisper model ({model_size}) for CPU inference"
+                  f"{' with int8 linear layers' if quantize else ''}...")
+            model = load_model(model_size, device="cpu")
+            if quantize:
+                model = quantize_model(model)
+            _MODELS[key] = model
+    return model
+
+
+def random_whisper_model(size="tiny", seed=0, **dimensions):
+    """
+    A randomly initialized Whisper model, for tests and benchmarks that need
+    no weight download. Its transcripts are gibberish, but it does the same
+    work per second of audio as the real model of its size.
+
+    Args:
+        size (str): Architecture to copy, a key of WHISPER_DIMENSIONS
+        seed (int): Seed for the weights
+        dimensions: ModelDimensions fields to override, e.g. n_text_layer=1
+    """
+    from whisper.model import ModelDimensions, Whisper
+
+    settings = dict(SHARED_DIMENSIONS, **WHISPER_DIMENSIONS[size])
+    settings.update(dimensions)
+    with torch.random.fork_rng():
+        torch.manual_seed(seed)
+        model = Whisper(ModelDimensions(**settings))
+        # Left uninitialized by Whisper, which expects it from a checkpoint
+        torch.nn.init.normal_(model.decoder.positional_embedding, std=0.01)
+    return model.eval()
+
+
+def decoding_options(profile=None):
+    """transcribe_timestamped decoding arguments for a render profile (name or dict)."""
+    name = profile.get("name") if isinstance(profile, dict) else profile
+    return dict(WHISPER_DECODING.get(name or DEFAULT_DECODING, WHISPER_DECODING[DEFAULT_DECODING]))
+
+
+def transcribe_cpu(model, audio, profile=None, threads=None, language="en", **options):
+    """
+    Transcribe with word timestamps on the CPU.
+
+    Args:
+        model: Whisper model, e.g. from load_cpu_model or random_whisper_model
+        audio (numpy.ndarray): 16 kHz mono samples
+        profile (str or dict, optional): Render profile picking greedy or beam decoding
+        threads (int, optional): Intra-op threads (see set_cpu_threads)
+        language (str): Spoken language
+        options: Further transcribe_timestamped arguments, overriding the profile's
+
+    Returns:
+        tuple: (transcription, stats) where stats holds the wall ``seconds``,
+            ``audio_seconds``, ``realtime_factor``, ``threads`` and ``quantized``
+    """
+    from whisper_timestamped import transcribe_timestamped
+
+    settings = decoding_options(profile)
+    settings.update(options)
+    audio_seconds = len(audio) / SAMPLE_RATE
+    with _INFERENCE_LOCK, span("transcribe", category="whisper") as trace_args:
+        threads = set_cpu_threads(threads)
+        start = time.perf_counter()
+        with torch.inference_mode():
+            result = transcribe_timestamped(model, audio, language=language, fp16=False, verbose=None, **settings)
+        seconds = time.perf_counter() - start
+        stats = {
+            "seconds": round(seconds, 3),
+            "audio_seconds": round(audio_seconds, 3),
+            # Wall seconds per second of audio; below 1 is faster than real time
+            "realtime_factor": round(seconds / audio_seconds, 3) if audio_seconds else None,
+            "threads": threads,
+            "quantized": is_quantized(model),
+            "beam_size": settings.get("beam_size")
+        }
+        trace_args.update(stats)
+    decoding = f"beam {stats['beam_size']}" if stats["beam_size"] else "greedy"
+    print(f"Transcribed {audio_seconds:.1f}s of audio in {seconds:.1f}s on {threads} threads "
+          f"({'int8' if stats['quantized'] else 'fp32'}, {decoding}): realtime factor {stats['realtime_factor']}")
+    return result, stats
@@ -0,0 +1,202 @@
+"""
+Per-job deadlines and cooperative cancellation.
+
+A ``Deadline`` is the time budget of one job together with its cancel flag.
+The pipeline puts it in scope for the job with ``deadline_scope`` and every
+stage picks it up with ``current_deadline()``:
+
+- network calls shrink their timeouts to the time left (``timeout``),
+- retry loops only wait when the retry can still finish in time (``sleep``),
+- long loops call ``check``, which raises once time is up or the job was
+  cancelled,
+- ffmpeg subprocesses are terminated when either happens (``watch``),
+- render worker processes inherit the deadline (and the trace spool)
+  through ``pool_options``.
+
+Without a deadline in scope, ``current_deadline()`` never expires and is
+never cancelled, so all of the above behaves exactly as before.
+"""
+
+import time
+import threading
+import contextvars
+import multiprocessing
+from contextlib import contextmanager
+
+from utility.tracing import get_tracer
+
+WATCH_INTERVAL = 0.25  # Seconds between checks while a subprocess is watched
+MIN_TIMEOUT = 0.5  # Shortest network timeout handed out close to the deadline
+KILL_GRACE = 2.0  # Seconds a terminated subprocess gets to exit before it is killed
+
+
+class JobInterrupted(Exception):
+    """The job ran out of time or was cancelled."""
+
+    reason = "interrupted"
+
+    def __init__(self, stage=None):
+        self.stage = stage
+        super().__init__(f"{self.reason} during {stage}" if stage else self.reason)
+
+
+class DeadlineExceeded(JobInterrupted):
+    reason = "deadline exceeded"
+
+
+class JobCancelled(JobInterrupted):
+    reason = "job cancelled"
+
+
+class Deadline:
+    """
+    Time budget and cancel flag of one job.
+
+    Args:
+        seconds (float, optional): Budget from now; None for no time limit
+        expires (float, optional): ``time.time()`` at which the budget ends;
+            with ``seconds`` as well, whichever comes first
+    """
+
+    def __init__(self, seconds=None, expires=None, cancel_event=None):
+        if seconds is not None:
+            ends = time.time() + max(0.0, seconds)
+            expires = ends if expires is None else min(expires, ends)
+        self.expires = expires
+        # A multiprocessing event, so render worker processes see a cancel as well
+        self._cancel_event = cancel_event if cancel_event is not None else multiprocessing.Event()
+
+    @property
+    def bounded(self):
+        """False for the default deadline that neither expires nor gets cancelled."""
+        return self is not _NO_DEADLINE
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def expired(self):
+        """True once the budget is used up or the job was cancelled."""
+        return self.cancelled or (self.expires is not None and time.time() >= self.expires)
+
+    def remaining(self):
+        """Seconds left (never negative), or None without a time limit."""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.time())
+
+    def cancel(self):
+        """Ask every stage of the job to stop; running ffmpeg processes are terminated."""
+        self._cancel_event.set()
+
+    def check(self, stage=None):
+        """
+        Raises:
+            JobCancelled: If the job was cancelled
+            DeadlineExceeded: If the budget is used up
+        """
+        if self.cancelled:
+            raise JobCancelled(stage)
+        if self.expires is not None and time.time() >= self.expires:
+            raise DeadlineExceeded(stage)
+
+    def allows(self, seconds):
+        """True if ``seconds`` more work can still finish in time."""
+        if self.cancelled:
+            return False
+        remaining = self.remaining()
+        return remaining is None or remaining >= seconds
+
+    def timeout(self, default=None):
+        """``default`` (seconds, or None for no limit) shrunk to the time left."""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        remaining = max(MIN_TIMEOUT, remaining)
+        return remaining if default is None else min(default, remaining)
+
+    def sleep(self, seconds):
+        """
+        Wait before a retry, if there is time for it.
+
+        Returns:
+            bool: True after waiting; False, without waiting out the delay,
+                if the deadline would pass first or the job gets cancelled
+        """
+        if not self.allows(seconds):
+            return False
+        return not self._cancel_event.wait(seconds)
+
+    def budget(self, seconds):
+        """
+        A deadline for one stage: ``seconds`` from now, but no later than this
+        one, and cancelled together with it.
+        """
+        return Deadline(seconds, self.expires, self._cancel_event)
+
+    @contextmanager
+    def watch(self, process):
+        """
+        Terminate ``process`` (a Popen) if the deadline passes or the job is
+        cancelled within the block, and kill it if it does not exit soon after.
+        """
+        if not self.bounded:
+            yield
+            return
+        done = threading.Event()
+
+        def run():
+            while not done.wait(WATCH_INTERVAL):
+                if self.expired:
+                    if process.poll() is None:
+                        process.terminate()
+                        # ffmpeg may take its time finishing the output on SIGTERM
+                        if not done.wait(KILL_GRACE) and process.poll() is None:
+                            process.kill()
+                    return
+
+        watcher = threading.Thread(target=run, name="deadline-watch", daemon=True)
+        watcher.start()
+        try:
+            yield
+        finally:
+            done.set()
+            watcher.join()
+
+    def pool_options(self):
+        """
+        Keyword arguments for ProcessPoolExecutor that put this deadline in
+        scope in its workers and hand them the trace spool, if tracing is on.
+        """
+        trace_spool = get_tracer().worker_spool()
+        if not self.bounded and trace_spool is None:
+            return {}
+        cancel_event = self._cancel_event if self.bounded else None
+        return {"initializer": _enter_worker, "initargs": (self.expires, cancel_event, trace_spool)}
+
+
+_NO_DEADLINE = Deadline()
+_CURRENT = contextvars.ContextVar("deadline", default=_NO_DEADLINE)
+
+
+def current_deadline():
+    """The deadline of the job running in this thread (or task)."""
+    return _CURRENT.get()
+
+
+@contextmanager
+def deadline_scope(deadline):
+    """Make ``deadline`` the current deadline within the block."""
+    token = _CURRENT.set(deadline or _NO_DEADLINE)
+    try:
+        yield deadline
+    finally:
+        _CURRENT.reset(token)
+
+
+def _enter_worker(expires, cancel_event, trace_spool):
+    if cancel_event is not None:
+        _CURRENT.set(Deadline(expires=expires, cancel_event=cancel_event))
+    if trace_spool is not None:
+        get_tracer().enter_worker(trace_spool)
@@ -0,0 +1,311 @@
+"""
+Job queue for spreading render jobs over several machines.
+
+A job is a JSON payload (the script and the PipelineConfig settings, see
+utility.jobs.worker) with an ID. Submitting is idempotent: a job ID is
+derived from the payload unless one is given, and submitting an existing ID
+again returns the existing job instead of queueing a duplicate.
+
+Workers *lease* a job for a limited time and extend the lease with
+heartbeats while they work on it. A job whose worker stops heartbeating
+(crashed, killed, lost its network) becomes available again once its lease
+expires. A failed job is retried after a backoff until it has used up
+``max_attempts``. Cancelling a job marks it failed; a worker running it
+notices at its next heartbeat and stops.
+
+``JobQueue`` is the interface; ``SQLiteJobQueue`` implements it with one
+SQLite file, which is enough for several worker processes on one machine (or
+a filesystem whose locking SQLite trusts). Other brokers plug in through
+``register_queue_backend`` and are opened by URL with ``open_queue``.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import hashlib
+from dataclasses import dataclass
+
+# Job states
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+JOB_STATES = (QUEUED, LEASED, DONE, FAILED)
+
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_MAX_ATTEMPTS = 3
+SQLITE_TIMEOUT = 30  # Seconds to wait for another process's write transaction
+
+
+@dataclass
+class Job:
+    id: str
+    payload: dict
+    state: str = QUEUED
+    attempts: int = 0
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    lease_owner: str = None
+    lease_expires: float = None
+    available_at: float = 0.0
+    result: dict = None
+    error: str = None
+    created: float = None
+    updated: float = None
+
+
+def job_id_for(payload):
+    """Stable ID for a payload, so submitting the same job twice is a no-op."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class JobQueue:
+    """
+    Interface every queue backend implements.
+
+    Lease-holding calls (``heartbeat``, ``complete``, ``fail``) take the
+    worker ID and do nothing, returning False, when that worker no longer
+    holds the lease, so a job that was handed to another worker after a lost
+    lease is never completed twice.
+    """
+
+    def submit(self, payload, job_id=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Queue a job unless a job with its ID exists.
+
+        Returns:
+            str: The job ID
+        """
+        raise NotImplementedError
+
+    def lease(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """
+        Take the oldest available job.
+
+        Returns:
+            Job: The leased job (``attempts`` already counts this attempt), or None
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Extend a lease. Returns False if the worker lost it."""
+        raise NotImplementedError
+
+    def complete(self, job_id, worker_id, result=None):
+        """Mark a leased job done. Returns False if the worker lost the lease."""
+        raise NotImplementedError
+
+    def fail(self, job_id, worker_id, error, retry_delay=0):
+        """
+        Record a failed attempt: the job is queued again after ``retry_delay``
+        seconds, or marked failed once it has used up its attempts.
+
+        Returns:
+            bool: False if the worker lost the lease
+        """
+        raise NotImplementedError
+
+    def cancel(self, job_id):
+        """
+        Mark a queued or leased job failed. The worker holding the lease
+        loses it at its next heartbeat and stops the job.
+
+        Returns:
+            bool: False if there is no such job or it already finished
+        """
+        raise NotImplementedError
+
+    def get(self, job_id):
+        """Return the job with this ID, or None."""
+        raise NotImplementedError
+
+    def counts(self):
+        """Number of jobs per state."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Job queue in a SQLite database file.
+
+    Every call opens its own connection, so one queue object may be shared by
+    threads (e.g. a worker and its heartbeat thread).
+
+    Args:
+        path (str): Database file; created on first use
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT)
+        try:
+            # Readers do not block the writer (a worker taking a lease) and vice versa
+            connection.execute("PRAGMA journal_mode=WAL")
+        finally:
+            connection.close()
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    available_at REAL NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )""")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, available_at, created)")
+
+    def _connect(self, write=True):
+        connection = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return _Transaction(connection, write)
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        return Job(id=row["id"], payload=json.loads(row["payload"]), state=row["state"], attempts=row["attempts"],
+                   max_attempts=row["max_attempts"], lease_owner=row["lease_owner"],
+                   lease_expires=row["lease_expires"], available_at=row["available_at"],
+                   result=json.loads(row["result"]) if row["result"] else None, error=row["error"],
+                   created=row["created"], updated=row["updated"])
+
+    def submit(self, payload, job_id=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        job_id = job_id or job_id_for(payload)
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO jobs (id, payload, state, max_attempts, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, json.dumps(payload), QUEUED, max_attempts, now, now))
+        return job_id
+
+    def lease(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        now = time.time()
+        with self._connect() as connection:
+            # Leases that ran out without a heartbeat count as failed attempts
+            connection.execute(
+                "UPDATE jobs SET state = ?, error = 'lease expired', lease_owner = NULL, updated = ? "
+                "WHERE state = ? AND lease_expires < ? AND attempts >= max_attempts",
+                (FAILED, now, LEASED, now))
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE (state = ? AND available_at <= ?) OR (state = ? AND lease_expires < ?) "
+                "ORDER BY created LIMIT 1",
+                (QUEUED, now, LEASED, now)).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_owner = ?, lease_expires = ?, updated = ? "
+                "WHERE id = ?",
+                (LEASED, worker_id, now + lease_seconds, now, row["id"]))
+            return self._job(connection.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def _update_leased(self, job_id, worker_id, assignments, values):
+        with self._connect() as connection:
+            cursor = connection.execute(
+                f"UPDATE jobs SET {assignments}, updated = ? WHERE id = ? AND state = ? AND lease_owner = ?",
+                (*values, time.time(), job_id, LEASED, worker_id))
+            return cursor.rowcount == 1
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        return self._update_leased(job_id, worker_id, "lease_expires = ?", (time.time() + lease_seconds,))
+
+    def complete(self, job_id, worker_id, result=None):
+        return self._update_leased(job_id, worker_id, "state = ?, result = ?, error = NULL, lease_owner = NULL",
+                                   (DONE, json.dumps(result)))
+
+    def fail(self, job_id, worker_id, error, retry_delay=0):
+        job = self.get(job_id)
+        if job is None:
+            return False
+        if job.attempts >= job.max_attempts:
+            return self._update_leased(job_id, worker_id, "state = ?, error = ?, lease_owner = NULL",
+                                       (FAILED, str(error)))
+        return self._update_leased(job_id, worker_id, "state = ?, error = ?, lease_owner = NULL, available_at = ?",
+                                   (QUEUED, str(error), time.time() + retry_delay))
+
+    def cancel(self, job_id):
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET state = ?, error = 'cancelled', lease_owner = NULL, updated = ? "
+                "WHERE id = ? AND state IN (?, ?)",
+                (FAILED, time.time(), job_id, QUEUED, LEASED))
+            return cursor.rowcount == 1
+
+    def get(self, job_id):
+        with self._connect(write=False) as connection:
+            return self._job(connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def counts(self):
+        counts = {state: 0 for state in JOB_STATES}
+        with self._connect(write=False) as connection:
+            for row in connection.execute("SELECT state, COUNT(*) AS count FROM jobs GROUP BY state"):
+                counts[row["state"]] = row["count"]
+        return counts
+
+
+class _Transaction:
+    """
+    A connection used for one transaction, closed afterwards. Write
+    transactions take the database's write lock up front (BEGIN IMMEDIATE),
+    so two workers never lease the same job.
+    """
+
+    def __init__(self, connection, write=True):
+        self.connection = connection
+        self.write = write
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE" if self.write else "BEGIN")
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        finally:
+            self.connection.close()
+
+
+QUEUE_BACKENDS = {"sqlite": SQLiteJobQueue}
+
+
+def register_queue_backend(scheme, factory):
+    """
+    Make ``open_queue`` accept URLs starting with ``scheme://``.
+
+    Args:
+        factory (callable): Called with the rest of the URL; returns a JobQueue
+    """
+    QUEUE_BACKENDS[scheme] = factory
+
+
+def open_queue(url):
+    """
+    Open a job queue by URL: ``sqlite:///path/to/jobs.db`` or a plain path
+    (SQLite), or ``<scheme>://...`` for a registered backend.
+    """
+    scheme, separator, rest = url.partition("://")
+    if not separator:
+        return SQLiteJobQueue(url)
+    if scheme not in QUEUE_BACKENDS:
+        raise ValueError(f"Unknown job queue backend '{scheme}', expected one of {sorted(QUEUE_BACKENDS)}")
+    if scheme == "sqlite":
+        # sqlite:///abs/path keeps its leading slash, sqlite://rel/path is relative
+        return SQLiteJobQueue(rest)
+    return QUEUE_BACKENDS[scheme](rest)
@@ -0,0 +1,285 @@
+"""
+Render worker for the job queue.
+
+A worker leases jobs from a queue (see utility.jobs.job_queue), runs each one
+with utility.pipeline.generate_video and records the result, heartbeating
+while the job runs. Start one worker per render slot on every machine; with
+the caches on a shared filesystem (``--cache-dir``), any worker can pick up
+any job and reuse the narration, search results, clips and encoded
+background segments another machine already produced.
+
+With ``--concurrency N`` a worker runs N jobs at once in threads; add
+``--batch-captions`` so their Whisper caption timing shares encoder batches
+(see utility.captions.batch_transcription).
+
+A job submitted with ``--deadline`` degrades to stay within its time budget
+(see utility.pipeline). Cancelling a job, or a worker losing its lease, stops
+the job at once: searches and downloads give up and running ffmpeg processes
+are terminated.
+
+Usage:
+    python -m utility.jobs.worker submit --queue jobs.db --file script.txt --profile final
+    python -m utility.jobs.worker work --queue jobs.db --cache-dir /mnt/shared/text-to-video
+    python -m utility.jobs.worker status --queue jobs.db [JOB_ID]
+    python -m utility.jobs.worker cancel --queue jobs.db JOB_ID
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import traceback
+from dataclasses import asdict, fields
+
+from utility.jobs.job_queue import open_queue, default_worker_id, DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS
+from utility.pipeline import PipelineConfig, generate_video
+from utility.deadline import Deadline
+
+JOB_RETRY_DELAY = float(os.environ.get("JOB_RETRY_DELAY", "30"))  # Seconds before the first retry, doubled per attempt
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "2"))  # Seconds between polls of an empty queue
+JOB_WORK_ROOT = os.environ.get("JOB_WORK_ROOT", os.path.join(os.path.expanduser("~"), ".cache", "text-to-video", "jobs"))
+
+
+def job_payload(script, config=None, plan=None):
+    """
+    The queue payload for a job: the script and the settings that differ
+    from the defaults (the worker fills in its own cache and work locations).
+    """
+    settings = {key: value for key, value in asdict(config or PipelineConfig()).items() if value is not None}
+    payload = {"script": script, "config": settings}
+    if plan is not None:
+        payload["plan"] = plan
+    return payload
+
+
+def job_config(payload, base_config=None, work_dir=None):
+    """PipelineConfig for a payload: the worker's settings overridden by the job's."""
+    settings = {key: value for key, value in asdict(base_config or PipelineConfig()).items() if value is not None}
+    known = {field.name for field in fields(PipelineConfig)}
+    settings.update((key, value) for key, value in payload.get("config", {}).items() if key in known)
+    settings.setdefault("work_dir", work_dir)
+    return PipelineConfig(**settings)
+
+
+class Heartbeat:
+    """
+    Extends a job's lease in the background until stopped, and calls
+    ``on_lost`` if the lease is lost (taken over or the job cancelled).
+    """
+
+    def __init__(self, queue, job_id, worker_id, lease_seconds, on_lost=None):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.on_lost = on_lost
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{job_id[:8]}", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                if not self.queue.heartbeat(self.job_id, self.worker_id, self.lease_seconds):
+                    print(f"WARNING: Lost the lease on job {self.job_id} (cancelled or taken over); stopping it")
+                    self.lost = True
+                    if self.on_lost is not None:
+                        self.on_lost()
+                    return
+            except Exception as e:
+                # A missed heartbeat is retried; the lease only lapses after lease_seconds
+                print(f"Warning: Heartbeat for job {self.job_id} failed: {str(e)}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_job(queue, job, worker_id, base_config=None, work_root=JOB_WORK_ROOT, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    Run one leased job and record its outcome.
+
+    Returns:
+        bool: True if the job succeeded
+    """
+    print(f"\n=== Job {job.id} (attempt {job.attempts}/{job.max_attempts}) on {worker_id}")
+    started = time.time()
+    error = None
+    # Cancelled when the lease is lost, so the job stops instead of rendering for nobody
+    deadline = Deadline()
+    with Heartbeat(queue, job.id, worker_id, lease_seconds, on_lost=deadline.cancel) as heartbeat:
+        try:
+            config = job_config(job.payload, base_config, os.path.join(work_root, job.id))
+            if config.deadline_seconds is not None:
+                deadline = deadline.budget(config.deadline_seconds)
+            result = generate_video(job.payload["script"], config, plan=job.payload.get("plan"), deadline=deadline)
+            if not result.ok:
+                failed = [name for name, path in result.outputs.items() if not path] or ["video"]
+                error = f"Rendering failed: {', '.join(failed)}"
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+            traceback.print_exc()
+    if heartbeat.lost:
+        return False
+
+    if error is None:
+        queue.complete(job.id, worker_id, {
+            "outputs": result.outputs,
+            "audio_file": result.audio_file,
+            "work_dir": result.work_dir,
+            "metrics": result.metrics,
+            "worker": worker_id,
+            "seconds": round(time.time() - started, 3)
+        })
+        print(f"Job {job.id} done in {time.time() - started:.1f}s: {result.outputs}")
+        return True
+
+    retry_delay = JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+    queue.fail(job.id, worker_id, error, retry_delay=retry_delay)
+    if job.attempts < job.max_attempts:
+        print(f"Job {job.id} failed ({error}); retrying in {retry_delay:.1f}s")
+    else:
+        print(f"Job {job.id} failed after {job.attempts} attempts: {error}")
+    return False
+
+
+def run_worker(queue, base_config=None, worker_id=None, work_root=JOB_WORK_ROOT, lease_seconds=DEFAULT_LEASE_SECONDS,
+               poll_interval=JOB_POLL_INTERVAL, max_jobs=None, exit_when_idle=False, concurrency=1):
+    """
+    Lease and run jobs until ``max_jobs`` have run, or the queue is empty
+    with ``exit_when_idle``.
+
+    Args:
+        queue (JobQueue): Where jobs come from
+        base_config (PipelineConfig, optional): Settings of this worker
+            (cache directories, API keys); a job's own settings win
+        work_root (str): Each job works in ``work_root/<job id>`` unless it
+            sets its own work directory
+        concurrency (int): Jobs run at once, each in its own thread and
+            under its own worker ID (``<worker id>/<slot>``)
+
+    Returns:
+        int: Number of jobs run
+    """
+    worker_id = worker_id or default_worker_id()
+    print(f"Worker {worker_id} waiting for jobs...")
+    count = 0
+    count_lock = threading.Lock()
+
+    def take_slot():
+        nonlocal count
+        with count_lock:
+            if max_jobs is not None and count >= max_jobs:
+                return False
+            count += 1
+            return True
+
+    def give_back_slot():
+        nonlocal count
+        with count_lock:
+            count -= 1
+
+    def work(slot_id):
+        while take_slot():
+            job = queue.lease(slot_id, lease_seconds)
+            if job is None:
+                give_back_slot()
+                if exit_when_idle:
+                    break
+                time.sleep(poll_interval)
+                continue
+            run_job(queue, job, slot_id, base_config, work_root, lease_seconds)
+
+    if concurrency <= 1:
+        work(worker_id)
+        return count
+    slots = [threading.Thread(target=work, args=(f"{worker_id}/{slot}",), name=f"job-slot-{slot}")
+             for slot in range(concurrency)]
+    for slot in slots:
+        slot.start()
+    for slot in slots:
+        slot.join()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue video jobs and run render workers.")
+    parser.add_argument("--queue", required=True, help="Queue URL, e.g. jobs.db or sqlite:///srv/jobs.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="Queue a job")
+    submit.add_argument("--text", help="The script text")
+    submit.add_argument("--file", help="Path to a file containing the script")
+    submit.add_argument("--profile", choices=["draft", "standard", "final"])
+    submit.add_argument("--backend", choices=["moviepy", "ffmpeg"])
+    submit.add_argument("--incremental", action="store_true",
+                        help="Cache the encoded background for re-renders of this job's plan (ffmpeg backend)")
+    submit.add_argument("--formats", help="Comma-separated output formats")
+    submit.add_argument("--voice", help="edge-tts voice")
+    submit.add_argument("--captions", choices=["dummy", "whisper"], help="Caption timing")
+    submit.add_argument("--output", help="Output video path (default: in the job's work directory)")
+    submit.add_argument("--job-id", help="Job ID (default: derived from the job, so resubmitting is a no-op)")
+    submit.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    submit.add_argument("--deadline", type=float, help="Time budget of the job in seconds")
+
+    work = commands.add_parser("work", help="Run jobs")
+    work.add_argument("--cache-dir", help="Root of the caches shared with other workers")
+    work.add_argument("--work-root", default=JOB_WORK_ROOT, help="Where job work directories are created")
+    work.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS, help="Lease length in seconds")
+    work.add_argument("--max-jobs", type=int, help="Stop after this many jobs")
+    work.add_argument("--exit-when-idle", action="store_true", help="Stop once the queue is empty")
+    work.add_argument("--deadline", type=float, help="Time budget in seconds for jobs that do not set one")
+    work.add_argument("--concurrency", type=int, default=1, help="Jobs to run at once, in threads")
+    work.add_argument("--batch-captions", action="store_true",
+                      help="Batch the Whisper transcriptions of concurrent jobs together")
+
+    status = commands.add_parser("status", help="Show queue counts or one job")
+    status.add_argument("job_id", nargs="?")
+
+    cancel = commands.add_parser("cancel", help="Cancel a queued or running job")
+    cancel.add_argument("job_id")
+    args = parser.parse_args()
+
+    queue = open_queue(args.queue)
+    if args.command == "submit":
+        if not args.text and not args.file:
+            parser.error("submit needs --text or --file")
+        if args.file:
+            with open(args.file, "r", encoding="utf-8") as f:
+                script = f.read().strip()
+        else:
+            script = args.text
+        config = PipelineConfig(voice=args.voice, profile=args.profile, captions=args.captions or "dummy", backend=args.backend,
+                                incremental=args.incremental or None, output_file=args.output,
+                                output_formats=[f.strip() for f in args.formats.split(",") if f.strip()] if args.formats else None,
+                                deadline_seconds=args.deadline)
+        print(queue.submit(job_payload(script, config), job_id=args.job_id, max_attempts=args.max_attempts))
+    elif args.command == "work":
+        run_worker(queue, PipelineConfig(cache_dir=args.cache_dir, deadline_seconds=args.deadline,
+                                         whisper_batch=args.batch_captions or None),
+                   work_root=args.work_root, lease_seconds=args.lease, max_jobs=args.max_jobs,
+                   exit_when_idle=args.exit_when_idle, concurrency=args.concurrency)
+    elif args.command == "cancel":
+        if not queue.cancel(args.job_id):
+            print(f"Job {args.job_id} does not exist or already finished")
+            return 1
+        print(f"Cancelled job {args.job_id}")
+    elif args.job_id:
+        job = queue.get(args.job_id)
+        if job is None:
+            print(f"No job {args.job_id}")
+            return 1
+        print(json.dumps(asdict(job), indent=2))
+    else:
+        print(json.dumps(queue.counts()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
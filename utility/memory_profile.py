@@ -0,0 +1,304 @@
+"""
+Opt-in memory instrumentation.
+
+While a ``MemoryProfiler`` is running, a background thread samples the
+resident set size (RSS) of this process and of its child processes (ffmpeg
+encoders and decoders, render workers) every MEMORY_SAMPLE_INTERVAL seconds.
+The profiler listens to the pipeline's stage spans (see utility.tracing), so
+every stage gets its RSS at start and end, the peak RSS reached while it ran,
+and the largest number of live ffmpeg subprocesses and open clip decoders.
+With ``top_allocations`` set, a tracemalloc snapshot is taken at each stage
+boundary and the lines that allocated the most memory during the stage are
+listed.
+
+psutil is used when installed; otherwise process sizes are read from /proc
+(Linux). Where neither is available only the peak RSS of this process is
+reported.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+
+from utility.tracing import add_span_listener, remove_span_listener
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Seconds between samples; without psutil each sample scans /proc, so it samples less often
+MEMORY_SAMPLE_INTERVAL = float(os.environ.get("MEMORY_SAMPLE_INTERVAL", "0.05" if psutil is not None else "0.25"))
+MB = 1024 * 1024
+
+
+def _proc_rss(pid):
+    """RSS of a process in bytes from /proc, or None."""
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _proc_children(pid):
+    """(pid, name) of every descendant of ``pid``, from one pass over /proc."""
+    children_of = {}
+    names = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name is in parentheses and may itself contain spaces
+        name = stat[stat.find("(") + 1:stat.rfind(")")]
+        fields = stat[stat.rfind(")") + 2:].split()
+        children_of.setdefault(int(fields[1]), []).append(int(entry))
+        names[int(entry)] = name
+    children = []
+    frontier = [pid]
+    while frontier:
+        for child in children_of.get(frontier.pop(), ()):
+            children.append((child, names[child]))
+            frontier.append(child)
+    return children
+
+
+def process_memory():
+    """
+    Current memory use of this process and its descendants.
+
+    Returns:
+        dict: ``rss`` and ``children_rss`` in bytes (None if unknown),
+        ``children`` and ``ffmpeg_processes`` counts
+    """
+    if psutil is not None:
+        process = psutil.Process()
+        children = []
+        for child in process.children(recursive=True):
+            try:
+                children.append((child.memory_info().rss, child.name()))
+            except psutil.Error:
+                continue
+        rss = process.memory_info().rss
+    elif os.path.exists("/proc/self/statm"):
+        rss = _proc_rss(os.getpid())
+        children = [(_proc_rss(pid) or 0, name) for pid, name in _proc_children(os.getpid())]
+    else:
+        rss = None
+        children = []
+    return {
+        "rss": rss,
+        "children_rss": sum(size for size, _ in children) if children or rss is not None else None,
+        "children": len(children),
+        "ffmpeg_processes": sum(1 for _, name in children if "ffmpeg" in name.lower())
+    }
+
+
+def peak_rss():
+    """Peak RSS of this process over its lifetime in bytes, or None."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def open_clip_count():
+    """Open clip decoders in this process (moviepy backend)."""
+    try:
+        from utility.render.decoder_pool import live_decoder_count
+        return live_decoder_count()
+    except Exception:
+        return None
+
+
+class _StageRecord:
+    def __init__(self, name, sample, snapshot):
+        self.name = name
+        self.started = time.time()
+        self.rss_start = sample["rss"]
+        self.peak = dict(sample)
+        self.peak_total = (sample["rss"] or 0) + (sample["children_rss"] or 0)
+        self.open_clips = open_clip_count()
+        self.snapshot = snapshot
+
+    def update(self, sample, open_clips):
+        for key in ("rss", "children_rss", "children", "ffmpeg_processes"):
+            if sample[key] is not None and (self.peak[key] is None or sample[key] > self.peak[key]):
+                self.peak[key] = sample[key]
+        self.peak_total = max(self.peak_total, (sample["rss"] or 0) + (sample["children_rss"] or 0))
+        if open_clips is not None:
+            self.open_clips = max(self.open_clips or 0, open_clips)
+
+
+class MemoryProfiler:
+    """
+    Samples memory use and attributes peaks to pipeline stages.
+
+    Args:
+        interval (float): Seconds between samples
+        top_allocations (int): When greater than zero, list this many of the
+            source lines that allocated the most Python memory in each stage
+            (tracemalloc; slows Python allocations down noticeably)
+        category (str): Span category treated as a stage
+    """
+
+    def __init__(self, interval=MEMORY_SAMPLE_INTERVAL, top_allocations=0, category="stage"):
+        self.interval = interval
+        self.top_allocations = top_allocations
+        self.category = category
+        self.stages = []
+        self.samples = 0
+        self.job_peak = {"rss": None, "total": 0, "ffmpeg_processes": 0, "open_clips": 0}
+        self._open = {}  # id -> _StageRecord for stages that have not finished
+        self._serial = 0
+        self._by_name = {}  # (thread, name) -> stack of open ids
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._started_tracemalloc = False
+        self.started = None
+
+    def start(self):
+        if self.top_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self.started = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="memory-profiler", daemon=True)
+        self._thread.start()
+        add_span_listener(self)
+        return self
+
+    def stop(self):
+        remove_span_listener(self)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _sample(self):
+        sample = process_memory()
+        open_clips = open_clip_count()
+        with self._lock:
+            self.samples += 1
+            total = (sample["rss"] or 0) + (sample["children_rss"] or 0)
+            self.job_peak["total"] = max(self.job_peak["total"], total)
+            if sample["rss"] is not None:
+                self.job_peak["rss"] = max(self.job_peak["rss"] or 0, sample["rss"])
+            self.job_peak["ffmpeg_processes"] = max(self.job_peak["ffmpeg_processes"], sample["ffmpeg_processes"])
+            self.job_peak["open_clips"] = max(self.job_peak["open_clips"], open_clips or 0)
+            for record in self._open.values():
+                record.update(sample, open_clips)
+        return sample
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e:
+                print(f"Warning: Memory sampling failed: {str(e)}")
+                return
+
+    def span_started(self, name, category):
+        if category != self.category:
+            return
+        sample = self._sample()
+        snapshot = tracemalloc.take_snapshot() if self.top_allocations and tracemalloc.is_tracing() else None
+        with self._lock:
+            self._serial += 1
+            self._open[self._serial] = _StageRecord(name, sample, snapshot)
+            self._by_name.setdefault((threading.get_ident(), name), []).append(self._serial)
+
+    def span_finished(self, name, category, ok=True):
+        if category != self.category:
+            return
+        sample = self._sample()
+        with self._lock:
+            stack = self._by_name.get((threading.get_ident(), name))
+            if not stack:
+                return
+            record = self._open.pop(stack.pop())
+        row = {
+            "stage": name,
+            "seconds": round(time.time() - record.started, 3),
+            "rss_start": record.rss_start,
+            "rss_end": sample["rss"],
+            "peak_rss": record.peak["rss"],
+            "peak_children_rss": record.peak["children_rss"],
+            "peak_total_rss": record.peak_total,
+            "peak_ffmpeg_processes": record.peak["ffmpeg_processes"],
+            "ffmpeg_processes_at_end": sample["ffmpeg_processes"],
+            "peak_open_clips": record.open_clips,
+            "open_clips_at_end": open_clip_count()
+        }
+        if record.snapshot is not None and tracemalloc.is_tracing():
+            row["top_allocations"] = self._top_allocations(record.snapshot)
+        with self._lock:
+            self.stages.append(row)
+
+    def _top_allocations(self, before):
+        after = tracemalloc.take_snapshot()
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+        return [{
+            "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_diff": stat.size_diff,
+            "size": stat.size,
+            "count_diff": stat.count_diff
+        } for stat in stats[:self.top_allocations]]
+
+    def report(self):
+        """The job's memory report (JSON-serializable)."""
+        with self._lock:
+            stages = list(self.stages)
+            job_peak = dict(self.job_peak)
+        return {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seconds": round(time.time() - self.started, 3) if self.started else None,
+            "sample_interval": self.interval,
+            "samples": self.samples,
+            "source": "psutil" if psutil is not None else ("proc" if os.path.exists("/proc/self/statm") else "getrusage"),
+            "peak_rss": job_peak["rss"] if job_peak["rss"] is not None else peak_rss(),
+            "peak_total_rss": job_peak["total"],
+            "peak_ffmpeg_processes": job_peak["ffmpeg_processes"],
+            "peak_open_clips": job_peak["open_clips"],
+            "stages": stages
+        }
+
+    def save_report(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+        return path
+
+
+def format_memory_report(report):
+    """Format a ``MemoryProfiler.report()`` as a text table."""
+    def mb(value):
+        return f"{value / MB:.0f}" if value is not None else "?"
+
+    lines = [f"Peak RSS {mb(report['peak_rss'])} MB, with child processes {mb(report['peak_total_rss'])} MB; "
+             f"at most {report['peak_ffmpeg_processes']} ffmpeg processes and {report['peak_open_clips']} open clips",
+             f"{'stage':<22} {'seconds':>8} {'start MB':>9} {'end MB':>7} {'peak MB':>8} {'+children':>10} {'ffmpeg':>7} {'clips':>6}"]
+    for row in report["stages"]:
+        lines.append(f"{row['stage'][:22]:<22} {row['seconds']:>8.2f} {mb(row['rss_start']):>9} {mb(row['rss_end']):>7} "
+                     f"{mb(row['peak_rss']):>8} {mb(row['peak_total_rss']):>10} {row['peak_ffmpeg_processes']:>7} "
+                     f"{row['peak_open_clips'] if row['peak_open_clips'] is not None else '?':>6}")
+        for allocation in row.get("top_allocations", []):
+            lines.append(f"    {allocation['size_diff'] / 1024:>+10.0f} KB  {allocation['location']}")
+    return "\n".join(lines)
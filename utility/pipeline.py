@@ -0,0 +1,356 @@
+"""
+Library API: run the whole pipeline from Python.
+
+``generate_video(script, config)`` runs script handling, text-to-speech,
+caption timing, search query generation, video search and rendering for one
+job, and returns the paths it wrote together with per-stage timings. Unlike
+``app.py`` it installs nothing, leaves the environment and the working
+directory alone, and keeps every setting in the ``PipelineConfig`` it is
+given. Each job writes into its own work directory, so several jobs can run
+at once in threads or in a process pool:
+
+    from utility.pipeline import PipelineConfig, generate_video
+
+    result = generate_video("Clouds drift over the mountains...",
+                            PipelineConfig(profile="draft", work_dir="jobs/42"))
+    print(result.output_file, result.metrics["stages"])
+
+The on-disk caches (narration, clips, searches, background tracks,
+procedural backgrounds) are safe to share between concurrent jobs; point them elsewhere
+per job with ``cache_dir`` or the individual ``*_cache_dir`` settings.
+Tracing, memory profiling and progress events stay process-wide and opt-in
+(see utility.tracing, utility.memory_profile and utility.progress).
+
+``generate_video`` runs its own event loop for text-to-speech, so call it
+from a thread without a running asyncio loop (e.g. via ``run_in_executor``).
+
+With ``deadline_seconds`` (or a ``Deadline`` passed in, which can also be
+cancelled from another thread, see utility.deadline) the job degrades
+instead of overrunning: Whisper timing falls back to dummy timing, video
+search stops early and leaves the rest of the segments to procedural
+backgrounds, and the render switches to the draft profile when the chosen one
+would not finish in time. ``metrics["degraded"]`` lists what was given up.
+"""
+
+import os
+import time
+import asyncio
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from utility.tracing import span
+from utility.deadline import Deadline, JobCancelled, current_deadline, deadline_scope
+
+AUDIO_FILE_NAME = "narration.mp3"
+CAPTION_MODES = ("dummy", "whisper")
+WHISPER_SECONDS_PER_SECOND = 1.0  # Rough Whisper transcription time per second of narration
+DEGRADED_PROFILE = "draft"  # Rendered instead when the job's profile would miss the deadline
+
+
+@dataclass
+class PipelineConfig:
+    """
+    Settings for one job.
+
+    Args:
+        voice (str, optional): edge-tts voice; defaults to DEFAULT_VOICE
+        profile (str or dict, optional): Render profile (see render_profiles)
+        backend (str, optional): "moviepy" or "ffmpeg"; defaults to "ffmpeg"
+            with ``incremental``, otherwise to RENDER_BACKEND
+        incremental (bool, optional): Build and reuse a cached background
+            track, so re-rendering after a caption or narration edit only
+            redoes the caption overlay (ffmpeg backend; see
+            render.background_track). The first render encodes the background
+            twice. Defaults to INCREMENTAL_RENDER, which only reuses tracks
+            already built
+        output_formats (list, optional): Output formats to render, e.g.
+            ["landscape", "vertical"]; defaults to the profile's format
+        output_file (str, optional): Where to write the video; defaults to the
+            profile's file name inside ``work_dir``
+        work_dir (str, optional): Directory for the narration and other job
+            files; a new temporary directory by default
+        audio_file (str, optional): Where to write the narration; defaults to
+            AUDIO_FILE_NAME inside ``work_dir``
+        captions (str): "dummy" (timing spread over the narration) or
+            "whisper" (transcribed word timings)
+        whisper_model (str): Whisper model size for "whisper" captions
+        whisper_batch (bool, optional): Transcribe through the process's shared
+            batching service, so jobs running at the same time share Whisper
+            batches (see utility.captions.batch_transcription)
+        video_server (str): Stock video provider
+        pexels_key (str, optional): Pexels API key; defaults to PEXELS_KEY
+        pexels_api_url (str, optional): Pexels API base URL
+        cache_dir (str, optional): Root for every cache of this job; each
+            cache gets a subdirectory unless set on its own below
+        clip_cache_dir, search_cache_dir, track_cache_dir, procedural_cache_dir,
+            tts_cache_dir (str, optional): Individual cache directories
+        deadline_seconds (float, optional): Time budget of the job; stages
+            degrade to stay within it
+    """
+
+    voice: str = None
+    profile: object = None
+    backend: str = None
+    incremental: bool = None
+    output_formats: list = None
+    output_file: str = None
+    work_dir: str = None
+    audio_file: str = None
+    captions: str = "dummy"
+    whisper_model: str = "base"
+    whisper_batch: bool = None
+    video_server: str = "pexel"
+    pexels_key: str = None
+    pexels_api_url: str = None
+    cache_dir: str = None
+    clip_cache_dir: str = None
+    search_cache_dir: str = None
+    track_cache_dir: str = None
+    procedural_cache_dir: str = None
+    tts_cache_dir: str = None
+    deadline_seconds: float = None
+
+    def cache_dirs(self):
+        """Cache directories for this job; None entries use the shared defaults."""
+        def resolve(directory, name):
+            if directory:
+                return directory
+            return os.path.join(self.cache_dir, name) if self.cache_dir else None
+
+        return {
+            "clips": resolve(self.clip_cache_dir, "clips"),
+            "search": resolve(self.search_cache_dir, "search"),
+            "tracks": resolve(self.track_cache_dir, "tracks"),
+            "procedural": resolve(self.procedural_cache_dir, "procedural"),
+            "tts": resolve(self.tts_cache_dir, "tts")
+        }
+
+
+@dataclass
+class VideoResult:
+    """
+    What a job produced.
+
+    Attributes:
+        output_file (str): The video (the first format's when rendering several), or None
+        outputs (dict): Output format -> rendered video path (None where it failed)
+        audio_file (str): Narration
+        work_dir (str): The job's work directory
+        timed_captions (list): ((t1, t2), text) pairs
+        background_video_urls (list): ((t1, t2), video URL) pairs
+        metrics (dict): Per-stage seconds, total seconds, narration length,
+            counts and the degradations made to meet the deadline
+    """
+
+    output_file: str = None
+    outputs: dict = field(default_factory=dict)
+    audio_file: str = None
+    work_dir: str = None
+    timed_captions: list = field(default_factory=list)
+    background_video_urls: list = field(default_factory=list)
+    metrics: dict = field(default_factory=dict)
+
+    @property
+    def ok(self):
+        return bool(self.outputs) and all(self.outputs.values())
+
+
+class _StageTimer:
+    """Wall time per stage, also recorded as a tracing span; a cancelled job stops before the next stage."""
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        if self.deadline.cancelled:
+            raise JobCancelled(name)
+        start = time.perf_counter()
+        try:
+            with span(name):
+                yield
+        finally:
+            self.stages[name] = round(self.stages.get(name, 0) + time.perf_counter() - start, 3)
+
+
+def _narration(script, audio_file, voice, cache_dir=None):
+    from utility.audio.tts_cache import fetch_audio
+
+    def synthesize(path):
+        # Give up on speech that cannot be finished within the job's deadline
+        return asyncio.run(asyncio.wait_for(generate_audio(script, path, voice), current_deadline().timeout()))
+
+    try:
+        from utility.audio.audio_generator import generate_audio, DEFAULT_VOICE
+        voice = voice or DEFAULT_VOICE
+        fetch_audio(script, voice, audio_file, synthesize, directory=cache_dir)
+    except Exception as e:
+        # generate_audio already falls back to silence; this covers edge-tts missing or that fallback failing
+        print(f"Warning: Audio generation encountered issues: {str(e)}")
+        from utility.render.ffmpeg_tools import run_ffmpeg
+        run_ffmpeg(["-f", "lavfi", "-i", "anullsrc=r=44100:cl=mono", "-t", "10", "-q:a", "9",
+                    "-acodec", "libmp3lame", audio_file])
+
+
+def _captions(script, audio_file, mode, whisper_model, profile=None, batch=False):
+    from utility.captions.dummy_captions_generator import generate_dummy_captions
+
+    if mode == "whisper":
+        try:
+            from utility.captions.timed_captions_generator import generate_timed_captions
+            transcriber = None
+            if batch:
+                from utility.captions.batch_transcription import shared_service
+                transcriber = shared_service(whisper_model, profile)
+            return generate_timed_captions(audio_file, model_size=whisper_model, profile=profile,
+                                           transcriber=transcriber)
+        except ImportError as e:
+            print(f"Warning: Whisper captions unavailable ({str(e)}), using dummy captions")
+    return generate_dummy_captions(script, audio_file, duration=30.0)
+
+
+def generate_video(script, config=None, plan=None, deadline=None):
+    """
+    Turn a script into a video.
+
+    Args:
+        script (str): Narration script
+        config (PipelineConfig, optional): Job settings; defaults throughout
+        plan (dict, optional): A plan from utility.plan.timeline_plan.build_plan;
+            its timeline is used instead of timing captions and searching again
+        deadline (Deadline, optional): Time budget and cancel flag of the job;
+            defaults to one of ``config.deadline_seconds``
+
+    Returns:
+        VideoResult: Paths and metrics; ``result.ok`` is False if a format failed
+
+    Raises:
+        ValueError: If the script is empty or a setting is invalid
+        JobInterrupted: If the job was cancelled, or ran out of time in a
+            stage that has nothing to fall back to (text-to-speech, rendering)
+    """
+    from utility.script.script_generator import generate_script
+    from utility.video.video_search_query_generator import getVideoSearchQueriesTimed
+    from utility.video.background_video_generator import generate_video_url, merge_empty_intervals
+    from utility.render.render_engine import get_output_media, render_output_formats, RENDER_BACKEND
+    from utility.render.render_profiles import get_render_profile, apply_output_format, DEFAULT_OUTPUT_FORMAT
+    from utility.render.ffmpeg_tools import probe_duration
+    from utility.plan.timeline_plan import estimate_render_seconds
+
+    config = config or PipelineConfig()
+    if config.captions not in CAPTION_MODES:
+        raise ValueError(f"Unknown caption mode '{config.captions}', expected one of {CAPTION_MODES}")
+    output_formats = list(dict.fromkeys(config.output_formats or []))
+    profile = get_render_profile(config.profile)
+    cache_dirs = config.cache_dirs()
+    work_dir = config.work_dir or tempfile.mkdtemp(prefix="text_to_video_")
+    os.makedirs(work_dir, exist_ok=True)
+    audio_file = config.audio_file or os.path.join(work_dir, AUDIO_FILE_NAME)
+    output_file = config.output_file or os.path.join(work_dir, os.path.basename(
+        apply_output_format(profile, output_formats[0] if len(output_formats) == 1 else None)["output_file"]))
+    deadline = deadline or Deadline(config.deadline_seconds)
+    # The background track cache belongs to the ffmpeg backend
+    backend = config.backend or ("ffmpeg" if config.incremental else RENDER_BACKEND)
+
+    def search(search_terms, video_server):
+        return generate_video_url(search_terms, video_server, api_key=config.pexels_key,
+                                  api_url=config.pexels_api_url, search_cache_dir=cache_dirs["search"])
+
+    def fits(seconds):
+        return deadline.allows(seconds + render_reserve)
+
+    result = VideoResult(audio_file=audio_file, work_dir=work_dir)
+    timer = _StageTimer(deadline)
+    degraded = []
+    job_start = time.perf_counter()
+
+    with deadline_scope(deadline):
+        with timer.stage("script"):
+            script = generate_script(script)
+
+        print("\nGenerating audio...")
+        with timer.stage("tts"):
+            _narration(script, audio_file, config.voice, cache_dirs["tts"])
+        narration_seconds = probe_duration(audio_file)
+        # Time kept back for the cheapest render the job can still fall back to
+        render_reserve = estimate_render_seconds(narration_seconds or 0, get_render_profile(DEGRADED_PROFILE), backend)
+        remaining = deadline.remaining()
+        # Search may use the time not kept back for rendering
+        search_deadline = deadline if remaining is None else deadline.budget(remaining - render_reserve)
+
+        if plan is not None:
+            from utility.plan.timeline_plan import resolve_plan
+            with timer.stage("resolve plan"), deadline_scope(search_deadline):
+                timed_captions, background_video_urls = resolve_plan(plan, narration_seconds, search=search)
+        else:
+            caption_mode = config.captions
+            if caption_mode == "whisper" and not fits((narration_seconds or 0) * WHISPER_SECONDS_PER_SECOND):
+                print("Deadline: not enough time for Whisper, using dummy caption timing")
+                caption_mode = "dummy"
+                degraded.append("captions: dummy timing")
+            print("\nGenerating captions...")
+            with timer.stage("captions"):
+                timed_captions = _captions(script, audio_file, caption_mode, config.whisper_model, profile["name"],
+                                           batch=bool(config.whisper_batch))
+            print("\nGenerating video search terms...")
+            with timer.stage("search terms"):
+                search_terms = getVideoSearchQueriesTimed(script, timed_captions)
+            background_video_urls = None
+            if search_terms is not None:
+                print("\nFetching background videos...")
+                with timer.stage("background search"), deadline_scope(search_deadline):
+                    background_video_urls = search(search_terms, config.video_server)
+                if search_deadline.expired:
+                    degraded.append("background search: stopped early, procedural backgrounds")
+            if background_video_urls is None and timed_captions:
+                # No search terms or no usable provider (e.g. offline): procedural backgrounds fill every segment
+                print("No stock footage search available, using procedural backgrounds")
+                background_video_urls = [((t1, t2), None) for (t1, t2), _ in (search_terms or timed_captions)]
+                degraded.append("background search: unavailable, procedural backgrounds")
+            background_video_urls = merge_empty_intervals(background_video_urls)
+        result.timed_captions = timed_captions
+        result.background_video_urls = background_video_urls or []
+
+        if background_video_urls:
+            if (profile["name"] != DEGRADED_PROFILE and narration_seconds
+                    and not deadline.allows(estimate_render_seconds(narration_seconds, profile, backend))):
+                print(f"Deadline: rendering with the {DEGRADED_PROFILE} profile instead of {profile['name']}")
+                profile = get_render_profile(DEGRADED_PROFILE)
+                degraded.append(f"render: {DEGRADED_PROFILE} profile")
+            print("\nGenerating final video...")
+            with timer.stage("render"):
+                if len(output_formats) > 1:
+                    result.outputs = render_output_formats(audio_file, timed_captions, background_video_urls,
+                                                           config.video_server, output_formats, backend=backend,
+                                                           profile=profile, output_file=output_file,
+                                                           cache_dirs=cache_dirs, incremental=config.incremental)
+                else:
+                    output_format = output_formats[0] if output_formats else DEFAULT_OUTPUT_FORMAT
+                    rendered = get_output_media(audio_file, timed_captions, background_video_urls, config.video_server,
+                                                backend=backend, profile=profile, output_file=output_file,
+                                                output_format=output_format, cache_dirs=cache_dirs,
+                                                incremental=config.incremental)
+                    result.outputs = {output_format: rendered}
+                if not result.ok:
+                    # A render stopped by the deadline or a cancel shows up as a failed output
+                    deadline.check("render")
+            result.output_file = next(iter(result.outputs.values()), None)
+        else:
+            print("No background videos available to generate final video")
+
+    total_seconds = time.perf_counter() - job_start
+    result.metrics = {
+        "stages": timer.stages,
+        "total_seconds": round(total_seconds, 3),
+        "narration_seconds": narration_seconds,
+        # Wall seconds spent per second of narration
+        "realtime_factor": round(total_seconds / narration_seconds, 3) if narration_seconds else None,
+        "captions": len(timed_captions),
+        "segments": len(result.background_video_urls),
+        "segments_with_video": sum(1 for _, url in result.background_video_urls if url),
+        "deadline_seconds": config.deadline_seconds,
+        "degraded": degraded
+    }
+    return result
@@ -0,0 +1,195 @@
+"""
+Plan-only mode: a serializable timeline (EDL) with a cost estimate.
+
+``build_plan`` runs only the cheap stages of the pipeline: script handling,
+caption timing against an estimated narration length, search query
+generation and lookups in the local search and clip caches. No text-to-speech,
+video API calls or downloads happen. The resulting document lists every
+segment with its query, the clip chosen for it (when the search cache knows
+one) and whether that clip is already downloaded, plus the captions and an
+estimate of API calls, download bytes and render time.
+
+The document is plain JSON and can be rendered later, on another machine,
+with ``app.py --from-plan``; see ``resolve_plan``.
+"""
+
+import json
+import time
+
+from utility.captions.dummy_captions_generator import generate_dummy_captions
+from utility.video.video_search_query_generator import getVideoSearchQueriesTimed
+from utility.video.search_cache import search_query, get_cached_search
+from utility.video.clip_cache import get_clip_cache
+from utility.render.render_profiles import get_render_profile, apply_output_format
+
+PLAN_VERSION = 1
+
+# Estimation constants; rough figures for sizing jobs, not guarantees
+NARRATION_WORDS_PER_SECOND = 2.5  # Typical neural TTS speaking rate
+AVERAGE_CLIP_BYTES = 20 * 1024 * 1024  # A 1080p stock clip of 10-20 s
+DOWNLOAD_BYTES_PER_SECOND = 5 * 1024 * 1024
+# Render seconds per second of 1080p25 output on one CPU core
+RENDER_SECONDS_PER_SECOND = {"moviepy": 4.0, "ffmpeg": 0.8}
+REFERENCE_PIXEL_RATE = 1920 * 1080 * 25
+
+
+def estimate_narration_seconds(script):
+    """Narration length estimated from the script's word count."""
+    return max(1.0, len(script.split()) / NARRATION_WORDS_PER_SECOND)
+
+
+def estimate_render_seconds(duration, profile, backend):
+    """Rough wall time to render ``duration`` seconds of video in one format."""
+    pixel_rate = profile["width"] * profile["height"] * profile["fps"] / REFERENCE_PIXEL_RATE
+    seconds = duration * RENDER_SECONDS_PER_SECOND[backend] * pixel_rate
+    if backend == "ffmpeg":
+        # Only the ffmpeg backend spreads its work over the available CPUs
+        seconds /= max(1, profile["threads"])
+    return seconds
+
+
+def build_plan(script, video_server="pexel", profile=None, backend="moviepy", output_formats=None):
+    """
+    Plan a job without running any of its expensive stages.
+
+    Args:
+        script (str): Narration script
+        video_server (str): Stock video provider
+        profile (str, optional): Render profile name
+        backend (str): Render backend the estimate is for
+        output_formats (list, optional): Output formats to render
+
+    Returns:
+        dict: The plan document (JSON-serializable)
+    """
+    profile = get_render_profile(profile)
+    output_formats = output_formats or [profile.get("output_format", "landscape")]
+    narration_seconds = estimate_narration_seconds(script)
+    timed_captions = generate_dummy_captions(script, None, duration=narration_seconds)
+    search_terms = getVideoSearchQueriesTimed(script, timed_captions) or []
+    clip_cache = get_clip_cache()
+
+    segments = []
+    queries = {}  # Query -> cached URL (None on a miss), each looked up once
+    for (t1, t2), term in search_terms:
+        query = search_query(term)
+        if query not in queries:
+            queries[query] = get_cached_search(query, video_server)
+        url = queries[query]
+        segments.append({
+            "start": float(t1),
+            "end": float(t2),
+            "query": query,
+            "url": url,
+            "search": "hit" if url else "miss",
+            "clip": ("hit" if clip_cache.contains(url) else "miss") if url else "unknown"
+        })
+
+    search_misses = sum(1 for url in queries.values() if url is None)
+    clips_to_download = {segment["url"] for segment in segments if segment["clip"] == "miss"}
+    # A query that still has to be searched will most likely need its clip downloaded too
+    download_count = len(clips_to_download) + search_misses
+    if profile["cached_clips_only"]:
+        download_count = 0
+    download_bytes = download_count * AVERAGE_CLIP_BYTES
+    render_seconds = sum(estimate_render_seconds(narration_seconds, apply_output_format(profile, output_format), backend)
+                         for output_format in output_formats)
+
+    return {
+        "version": PLAN_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "script": script,
+        "video_server": video_server,
+        "render": {
+            "backend": backend,
+            "profile": profile["name"],
+            "output_formats": output_formats
+        },
+        "narration": {
+            "words": len(script.split()),
+            "estimated_seconds": round(narration_seconds, 3)
+        },
+        "captions": [{"start": float(t1), "end": float(t2), "text": text} for (t1, t2), text in timed_captions],
+        "segments": segments,
+        "estimate": {
+            "api_calls": {"tts": 1, "video_search": search_misses},
+            "downloads": download_count,
+            "download_bytes": download_bytes,
+            "download_seconds": round(download_bytes / DOWNLOAD_BYTES_PER_SECOND, 1),
+            "render_seconds": round(render_seconds, 1)
+        }
+    }
+
+
+def save_plan(plan, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2)
+    return path
+
+
+def load_plan(path):
+    """
+    Read a plan document.
+
+    Raises:
+        ValueError: If the file is not a plan this version understands
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    if not isinstance(plan, dict) or plan.get("version") != PLAN_VERSION:
+        raise ValueError(f"{path} is not a version {PLAN_VERSION} plan")
+    for key in ("script", "captions", "segments"):
+        if key not in plan:
+            raise ValueError(f"Plan {path} has no '{key}'")
+    return plan
+
+
+def resolve_plan(plan, narration_seconds=None, search=None):
+    """
+    Turn a plan into the inputs of the render stage.
+
+    The plan was timed against an estimated narration length; when the real
+    length is known every caption and segment is scaled to it. Segments whose
+    search missed when the plan was made are searched now.
+
+    Args:
+        plan (dict): Plan document
+        narration_seconds (float, optional): Actual narration length
+        search (callable, optional): ``search(search_terms, video_server)``
+            returning ((t1, t2), url) pairs, e.g. generate_video_url
+
+    Returns:
+        tuple: (timed_captions, background_video_data)
+    """
+    estimated = plan.get("narration", {}).get("estimated_seconds")
+    scale = narration_seconds / estimated if narration_seconds and estimated else 1.0
+    timed_captions = [((c["start"] * scale, c["end"] * scale), c["text"]) for c in plan["captions"]]
+    background_video_data = [((s["start"] * scale, s["end"] * scale), s.get("url")) for s in plan["segments"]]
+
+    missing = [index for index, segment in enumerate(plan["segments"]) if not segment.get("url")]
+    if missing and search is not None:
+        print(f"Searching for {len(missing)} segments the plan has no clip for...")
+        found = search([(background_video_data[index][0], plan["segments"][index]["query"]) for index in missing],
+                       plan.get("video_server", "pexel")) or []
+        for index, (_, url) in zip(missing, found):
+            background_video_data[index] = (background_video_data[index][0], url)
+    return timed_captions, background_video_data
+
+
+def format_plan_summary(plan):
+    """Human-readable summary of a plan."""
+    estimate = plan["estimate"]
+    segments = plan["segments"]
+    lines = [
+        f"Narration: {plan['narration']['words']} words, ~{plan['narration']['estimated_seconds']:.1f}s",
+        f"Captions: {len(plan['captions'])}",
+        f"Segments: {len(segments)} "
+        f"(search cache {sum(s['search'] == 'hit' for s in segments)} hit / {sum(s['search'] == 'miss' for s in segments)} miss, "
+        f"clip cache {sum(s['clip'] == 'hit' for s in segments)} hit / {sum(s['clip'] == 'miss' for s in segments)} miss)",
+        f"API calls: {estimate['api_calls']['tts']} TTS, {estimate['api_calls']['video_search']} video search",
+        f"Downloads: {estimate['downloads']} clips, ~{estimate['download_bytes'] / (1024 * 1024):.0f} MB "
+        f"(~{estimate['download_seconds']:.0f}s)",
+        f"Render: ~{estimate['render_seconds']:.0f}s ({plan['render']['backend']}, {plan['render']['profile']}, "
+        f"{', '.join(plan['render']['output_formats'])})"
+    ]
+    return "\n".join(lines)
@@ -0,0 +1,294 @@
+"""
+Structured progress events.
+
+The pipeline reports its progress as typed events rather than only as
+printed lines, so a service wrapping it can show progress and an ETA
+without scraping stdout:
+
+- StageStarted / StageFinished for every pipeline stage (the stage spans of
+  utility.tracing)
+- ItemProgress for per-item loops (segments, captions, video searches)
+- BytesDownloaded while a clip downloads
+- FramesEncoded from the encoder's own frame counter (moviepy's frame loop,
+  or ffmpeg's ``-progress`` output)
+
+Events go to a sink: any callable taking one event. ``NullSink`` (the
+default) drops them, ``JsonLinesSink`` writes one JSON object per line.
+Progress events carry an ETA computed from the throughput measured so far.
+Events are emitted in the process that does the work; stages run inside
+the per-format worker processes of a multi-format render are not forwarded.
+"""
+
+import sys
+import json
+import time
+import threading
+from dataclasses import dataclass, field, asdict
+
+from utility.tracing import add_span_listener, remove_span_listener
+from utility.deadline import current_deadline
+
+
+@dataclass
+class ProgressEvent:
+    time: float = field(default_factory=time.time, init=False)
+
+    @property
+    def kind(self):
+        return type(self).__name__
+
+    def to_dict(self):
+        return dict(asdict(self), kind=self.kind)
+
+
+@dataclass
+class StageStarted(ProgressEvent):
+    stage: str
+
+
+@dataclass
+class StageFinished(ProgressEvent):
+    stage: str
+    seconds: float
+    ok: bool = True
+
+
+@dataclass
+class ItemProgress(ProgressEvent):
+    stage: str
+    done: int
+    total: int
+    item: str = None
+    eta_seconds: float = None
+
+
+@dataclass
+class BytesDownloaded(ProgressEvent):
+    url: str
+    done_bytes: int
+    total_bytes: int = None
+    bytes_per_second: float = None
+    eta_seconds: float = None
+
+
+@dataclass
+class FramesEncoded(ProgressEvent):
+    stage: str
+    frames: int
+    total_frames: int = None
+    frames_per_second: float = None
+    eta_seconds: float = None
+
+
+class NullSink:
+    """Drops every event."""
+
+    def __call__(self, event):
+        pass
+
+
+class JsonLinesSink:
+    """
+    Writes each event as one JSON object per line.
+
+    Args:
+        target (str or file): Path to append to, or an open text stream
+            ("-" for stderr)
+    """
+
+    def __init__(self, target):
+        self._owns_stream = isinstance(target, str) and target != "-"
+        if target == "-":
+            self.stream = sys.stderr
+        elif self._owns_stream:
+            self.stream = open(target, "a", encoding="utf-8")
+        else:
+            self.stream = target
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event.to_dict())
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def close(self):
+        if self._owns_stream:
+            self.stream.close()
+
+
+class Throughput:
+    """Units per second measured since the first update, and the ETA it implies."""
+
+    def __init__(self):
+        self.start = None
+        self.start_done = 0
+
+    def update(self, done, total=None):
+        """
+        Returns:
+            tuple: (rate, eta_seconds); either may be None until measurable
+        """
+        now = time.time()
+        if self.start is None:
+            self.start, self.start_done = now, done
+            return None, None
+        elapsed = now - self.start
+        if elapsed <= 0 or done <= self.start_done:
+            return None, None
+        rate = (done - self.start_done) / elapsed
+        eta = max(0.0, (total - done) / rate) if total else None
+        return rate, eta
+
+
+class ProgressReporter:
+    """
+    Emits progress events to a sink and tracks throughput for ETAs.
+
+    Args:
+        sink (callable, optional): Receives every event; NullSink by default
+    """
+
+    def __init__(self, sink=None):
+        self.sink = sink or NullSink()
+        self._throughput = {}
+        self._stage_starts = {}
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return not isinstance(self.sink, NullSink)
+
+    def emit(self, event):
+        try:
+            self.sink(event)
+        except Exception as e:
+            print(f"Warning: Progress sink failed: {str(e)}")
+
+    def _rate(self, key, done, total):
+        with self._lock:
+            if done == 0 or key not in self._throughput:
+                self._throughput[key] = Throughput()
+            return self._throughput[key].update(done, total)
+
+    def stage_started(self, stage):
+        with self._lock:
+            self._stage_starts.setdefault(stage, []).append(time.time())
+        self.emit(StageStarted(stage))
+
+    def stage_finished(self, stage, ok=True):
+        with self._lock:
+            starts = self._stage_starts.get(stage)
+            start = starts.pop() if starts else time.time()
+        self.emit(StageFinished(stage, round(time.time() - start, 3), ok))
+
+    def item(self, stage, done, total, item=None):
+        """Item number ``done`` of ``total`` in a stage has been reached."""
+        if not self.active:
+            return
+        _, eta = self._rate(("item", stage), done, total)
+        self.emit(ItemProgress(stage, done, total, None if item is None else str(item), eta))
+
+    def bytes(self, url, done_bytes, total_bytes=None):
+        if not self.active:
+            return
+        rate, eta = self._rate(("bytes", url), done_bytes, total_bytes)
+        self.emit(BytesDownloaded(url, done_bytes, total_bytes, rate, eta))
+
+    def frames(self, stage, frames, total_frames=None):
+        if not self.active:
+            return
+        rate, eta = self._rate(("frames", stage), frames, total_frames)
+        self.emit(FramesEncoded(stage, frames, total_frames, rate, eta))
+
+    # Span listener interface (see utility.tracing.add_span_listener)
+    def span_started(self, name, category):
+        if category == "stage":
+            self.stage_started(name)
+
+    def span_finished(self, name, category, ok=True):
+        if category == "stage":
+            self.stage_finished(name, ok)
+
+
+_REPORTER = ProgressReporter()
+
+
+def get_progress():
+    """Return the process-wide progress reporter."""
+    return _REPORTER
+
+
+def set_progress_sink(sink):
+    """
+    Send this process's progress events to ``sink`` (None to stop).
+
+    Returns:
+        ProgressReporter: The process-wide reporter
+    """
+    remove_span_listener(_REPORTER)
+    _REPORTER.sink = sink or NullSink()
+    if sink is not None:
+        add_span_listener(_REPORTER)
+    return _REPORTER
+
+
+def moviepy_logger(stage="encode", total_frames=None):
+    """
+    A proglog logger for ``write_videofile`` that reports encoded frames and
+    stops the encode once the job's deadline passes or it is cancelled, or
+    None (moviepy's silent default) while there is neither a sink nor a
+    deadline.
+    """
+    deadline = current_deadline()
+    if not _REPORTER.active and not deadline.bounded:
+        return None
+    from proglog import ProgressBarLogger
+
+    class FrameLogger(ProgressBarLogger):
+        def bars_callback(self, bar, attr, value, old_value=None):
+            # moviepy's frame loop is the "t" bar ("chunk" is the audio); its
+            # index is the number of frames already written
+            if bar == "t" and attr == "index" and _REPORTER.active:
+                _REPORTER.frames(stage, value, self.bars[bar].get("total") or total_frames)
+            # Raising here is the only way out of moviepy's write loop
+            deadline.check(stage)
+
+    return FrameLogger()
+
+
+def frame_counter(stage, total_frames=None, offset=0):
+    """
+    A ``progress(frames)`` callback for run_ffmpeg reporting encoded frames
+    (plus ``offset`` already done), or None while no sink is set.
+    """
+    if not _REPORTER.active:
+        return None
+    return lambda frames: _REPORTER.frames(stage, offset + frames, total_frames)
+
+
+def ffmpeg_progress_args():
+    """Arguments making ffmpeg write machine-readable progress to stdout."""
+    return ["-progress", "pipe:1", "-nostats"]
+
+
+def parse_ffmpeg_progress(lines, callback):
+    """
+    Call ``callback(frames)`` for every progress block ffmpeg writes with
+    ``-progress pipe:1``.
+
+    Args:
+        lines (iterable): Lines of ffmpeg's stdout (bytes or str)
+    """
+    frames = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        key, _, value = line.strip().partition("=")
+        if key == "frame":
+            try:
+                frames = int(value)
+            except ValueError:
+                frames = None
+        elif key == "progress" and frames is not None:
+            callback(frames)
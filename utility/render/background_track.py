@@ -0,0 +1,422 @@
+"""
+Persistent background-only video track for incremental re-renders.
+
+Each background segment is encoded once, at the render profile's final
+quality and with a fixed GOP, into a cache keyed by what it shows (source
+clip, offset, frame count) and how it is encoded (size, frame rate, encoder
+settings). The segments are joined by stream copy into a background track
+keyed by the whole plan. A render then only burns in the captions and muxes
+the narration on top of that track, so:
+
+* a caption or narration change reuses the whole track and only pays for the
+  overlay pass;
+* a change to one segment's clip re-encodes just that segment and splices
+  the track together again without re-encoding the others.
+
+Building a track costs a second encode on a cold render: every segment is
+encoded once into the cache, then the whole track again to burn in the
+captions. Use it when iterating on captions or narration; a one-off render
+is faster without it (see INCREMENTAL_RENDER in render_engine).
+
+Segments and tracks are published under per-entry file locks, and eviction
+skips entries whose lock is held, so the cache may be shared between
+processes and between the threads of one process.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from contextlib import nullcontext, contextmanager, ExitStack
+from concurrent.futures import ProcessPoolExecutor
+
+from filelock import FileLock, Timeout
+
+from utility.render.ffmpeg_tools import run_ffmpeg, probe_duration
+from utility.render.prenormalize import normalize_filter, TARGET_PIX_FMT
+from utility.render.ffmpeg_backend import (build_background_sequence, write_ass_subtitles, quote_concat_path,
+                                           OUTPUT_AUDIO_ARGS)
+from utility.render.render_profiles import encoder_args, caption_layout
+from utility.render.procedural_backgrounds import procedural_clip
+from utility.progress import get_progress, frame_counter
+from utility.deadline import current_deadline
+
+# Cache settings
+BACKGROUND_TRACK_DIR = os.environ.get("BACKGROUND_TRACK_DIR", os.path.join(os.path.expanduser("~"), ".cache", "text-to-video", "tracks"))
+BACKGROUND_TRACK_MAX_BYTES = int(os.environ.get("BACKGROUND_TRACK_MAX_BYTES", 5 * 1024 ** 3))  # 5 GB
+SEGMENT_GOP_SECONDS = 2
+
+
+def segment_frames(sequence, fps):
+    """
+    Quantize a background sequence to whole frames.
+
+    Boundaries are rounded on the absolute timeline, so the frame counts of
+    the segments always add up to the frame count of the whole track.
+
+    Args:
+        sequence (list): (duration, clip) pairs laid end to end from 0
+
+    Returns:
+        list: (frame_count, clip) pairs, without empty segments
+    """
+    frames = []
+    position = 0.0
+    for duration, clip in sequence:
+        start = int(round(position * fps))
+        position += duration
+        count = int(round(position * fps)) - start
+        if count > 0:
+            frames.append((count, clip))
+    return frames
+
+
+def profile_signature(profile):
+    """The parts of a render profile that change how background pixels are encoded."""
+    return f"{profile['width']}x{profile['height']}@{profile['fps']}|{' '.join(encoder_args(profile))}|gop{SEGMENT_GOP_SECONDS}"
+
+
+def segment_key(clip, frame_count, profile):
+    """
+    Cache key of one encoded segment.
+
+    Args:
+        clip (tuple or None): (source file, offset) or None for a black filler
+        frame_count (int): Length of the segment in frames
+        profile (dict): Resolved render profile
+    """
+    if clip is None:
+        content = "filler"
+    else:
+        source, offset = clip
+        # Clip cache paths are content addressed; the size catches a replaced file
+        content = f"{os.path.abspath(source)}|{os.path.getsize(source)}|{offset:.3f}"
+    key = f"{content}|{frame_count}|{profile_signature(profile)}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def encode_segment(clip, output, frame_count, width, height, fps, video_codec_args, threads=1):
+    """
+    Encode one background segment with a keyframe-only-at-GOP layout that can
+    be joined to the others by stream copy.
+
+    Returns:
+        str: ``output`` on success, None on failure
+    """
+    if clip is None:
+        inputs = ["-f", "lavfi", "-i", f"color=c=black:s={width}x{height}:r={fps}"]
+    else:
+        source, offset = clip
+        inputs = ["-stream_loop", "-1", "-ss", f"{offset:.3f}", "-i", os.path.abspath(source)]
+    gop = max(1, int(round(SEGMENT_GOP_SECONDS * fps)))
+    tmp_output = output + ".tmp.mp4"
+    try:
+        run_ffmpeg([
+            "-v", "error",
+            *inputs,
+            "-an",
+            "-vf", normalize_filter(width, height, fps, TARGET_PIX_FMT),
+            "-frames:v", str(frame_count),
+            *video_codec_args,
+            "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0", "-bf", "0",
+            "-threads", str(threads),
+            tmp_output
+        ])
+        os.replace(tmp_output, output)
+        return output
+    except Exception as e:
+        print(f"ERROR encoding background segment: {str(e)}")
+        if os.path.exists(tmp_output):
+            os.remove(tmp_output)
+        return None
+
+
+def _encode_segment_job(job):
+    return encode_segment(**job)
+
+
+class BackgroundTrackCache:
+    """
+    On-disk cache of encoded background segments and assembled tracks.
+
+    Args:
+        directory (str): Cache root, may be shared between processes
+        max_bytes (int): Size the cache is trimmed to, least recently used first
+        procedural_dir (str, optional): Procedural background cache used for
+            gaps; defaults to PROCEDURAL_CACHE_DIR
+    """
+
+    def __init__(self, directory=BACKGROUND_TRACK_DIR, max_bytes=BACKGROUND_TRACK_MAX_BYTES, procedural_dir=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.procedural_dir = procedural_dir
+        self.segments_dir = os.path.join(directory, "segments")
+        self.tracks_dir = os.path.join(directory, "tracks")
+        self.locks_dir = os.path.join(directory, "locks")
+        for path in (self.segments_dir, self.tracks_dir, self.locks_dir):
+            os.makedirs(path, exist_ok=True)
+        self.segment_hits = 0
+        self.segment_misses = 0
+
+    def _segment_lock(self, key):
+        return FileLock(os.path.join(self.locks_dir, f"segment-{key}.lock"))
+
+    def _track_lock(self, key):
+        return FileLock(os.path.join(self.locks_dir, f"{key}.lock"))
+
+    def _entry_lock(self, path):
+        key = os.path.basename(path)[:-len(".mp4")]
+        if os.path.dirname(path) == self.segments_dir:
+            return self._segment_lock(key)
+        return self._track_lock(key)
+
+    def _touch(self, path):
+        try:
+            # Modification time doubles as the LRU clock
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _plan(self, background_segments, total_duration, profile):
+        width, height, fps = profile["width"], profile["height"], profile["fps"]
+        frames = segment_frames(build_background_sequence(background_segments, total_duration), fps)
+        # Gaps show the procedural background; black if it cannot be rendered
+        background = procedural_clip(width, height, fps, directory=self.procedural_dir) if any(clip is None for _, clip in frames) else None
+        if background is not None:
+            frames = [(count, (background, 0) if clip is None else clip) for count, clip in frames]
+        keys = [segment_key(clip, count, profile) for count, clip in frames]
+        track_key = hashlib.sha1("|".join(keys).encode("utf-8")).hexdigest()
+        return frames, keys, track_key
+
+    @contextmanager
+    def open_track(self, background_segments, total_duration, profile, workers=1, build=True):
+        """
+        Provide the background-only track of a segment plan for the duration
+        of the block, encoding only the segments that are not cached yet.
+
+        The track's lock is held until the block ends, so eviction (in any
+        process) cannot remove the track while it is being read.
+
+        Args:
+            background_segments (list): ((t1, t2), (source file, offset)) pairs
+            total_duration (float): Length of the track; gaps are black
+            profile (dict): Resolved render profile
+            workers (int): Segments encoded at once
+            build (bool): Build the track if it is not cached; otherwise yield None
+
+        Yields:
+            str: Path of the track, or None if it is not cached (and ``build``
+                is False) or a segment failed to encode
+        """
+        frames, keys, track_key = self._plan(background_segments, total_duration, profile)
+        track_path = os.path.join(self.tracks_dir, track_key + ".mp4")
+        with self._track_lock(track_key):
+            if os.path.exists(track_path):
+                self.segment_hits += len(keys)
+                self._touch(track_path)
+                print(f"Reusing cached background track ({len(keys)} segments)")
+            elif not build:
+                track_path = None
+            else:
+                track_path = self._build(frames, keys, track_key, track_path, profile, workers)
+            yield track_path
+        self.evict()
+
+    def _build(self, frames, keys, track_key, track_path, profile, workers):
+        width, height, fps = profile["width"], profile["height"], profile["fps"]
+        segment_paths = [os.path.join(self.segments_dir, key + ".mp4") for key in keys]
+        with ExitStack() as locks:
+            # Segments are shared between tracks, and between jobs; their locks are
+            # taken in key order, so processes wanting overlapping sets cannot deadlock,
+            # and held until the track is joined, so eviction leaves them alone
+            for key in sorted(set(keys)):
+                locks.enter_context(self._segment_lock(key))
+
+            jobs = []
+            pending = set()
+            for path, (count, clip) in zip(segment_paths, frames):
+                if os.path.exists(path):
+                    self.segment_hits += 1
+                    self._touch(path)
+                elif path not in pending:
+                    pending.add(path)
+                    self.segment_misses += 1
+                    jobs.append({
+                        "clip": clip,
+                        "output": path,
+                        "frame_count": count,
+                        "width": width,
+                        "height": height,
+                        "fps": fps,
+                        "video_codec_args": encoder_args(profile)
+                    })
+
+            print(f"Background track: {len(keys) - len(jobs)} segments cached, encoding {len(jobs)}")
+            if jobs:
+                workers = max(1, min(workers, len(jobs)))
+                threads = max(1, profile.get("threads", 1) // workers)
+                for job in jobs:
+                    job["threads"] = threads
+                progress = get_progress()
+                total_frames = sum(job["frame_count"] for job in jobs)
+                encoded_frames = 0
+                outputs = []
+                pool_options = current_deadline().pool_options()  # Workers stop their ffmpeg on the job's deadline
+                with ProcessPoolExecutor(max_workers=workers, **pool_options) if workers > 1 else nullcontext() as executor:
+                    results = executor.map(_encode_segment_job, jobs) if executor else map(_encode_segment_job, jobs)
+                    for job, output in zip(jobs, results):
+                        outputs.append(output)
+                        encoded_frames += job["frame_count"]
+                        progress.frames("encode segments", encoded_frames, total_frames)
+                if None in outputs:
+                    return None
+
+            concat_list = os.path.join(self.tracks_dir, track_key + ".txt")
+            with open(concat_list, "w", encoding="utf-8") as f:
+                f.write("".join(f"file {quote_concat_path(path)}\n" for path in segment_paths))
+            tmp_track = track_path + ".tmp.mp4"
+            try:
+                run_ffmpeg(["-v", "error", "-f", "concat", "-safe", "0", "-i", concat_list,
+                            "-c", "copy", tmp_track])
+                os.replace(tmp_track, track_path)
+            finally:
+                for path in (concat_list, tmp_track):
+                    if os.path.exists(path):
+                        os.remove(path)
+        with open(os.path.join(self.tracks_dir, track_key + ".json"), "w", encoding="utf-8") as f:
+            json.dump({"segments": keys, "created": time.time()}, f)
+        return track_path
+
+    def entries(self):
+        """(path, size, last used) of every cached segment and track."""
+        entries = []
+        for folder in (self.segments_dir, self.tracks_dir):
+            for name in os.listdir(folder):
+                if not name.endswith(".mp4") or name.endswith(".tmp.mp4"):
+                    continue
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def evict(self):
+        """Remove least-recently-used segments and tracks until the cache fits in ``max_bytes``."""
+        if not self.max_bytes:
+            return 0
+        removed = 0
+        with FileLock(os.path.join(self.locks_dir, "evict.lock")):
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+                if total <= self.max_bytes:
+                    break
+                lock = self._entry_lock(path)
+                try:
+                    # Skip entries being encoded, joined into a track or read by a render
+                    lock.acquire(timeout=0)
+                except Timeout:
+                    continue
+                try:
+                    for stale in (path, path[:-len(".mp4")] + ".json"):
+                        try:
+                            os.remove(stale)
+                        except FileNotFoundError:
+                            pass
+                finally:
+                    lock.release()
+                total -= size
+                removed += 1
+        return removed
+
+
+def overlay_and_mux(track_path, audio_file_path, timed_captions, output_file, work_dir, profile, total_duration,
+                    workers=1):
+    """
+    Burn captions onto a background track and mux the narration.
+
+    Without captions the track is stream-copied, so only the audio is encoded.
+    With ``workers`` > 1 the captioned track is encoded in GOP-aligned chunks
+    in parallel (see parallel_render).
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    video_args = ["-c:v", "copy"]
+    if timed_captions:
+        font_size, caption_top = caption_layout(profile)
+        if workers > 1:
+            from utility.render.parallel_render import render_parallel
+            return render_parallel(audio_file_path, timed_captions, [(total_duration, track_path)], output_file,
+                                   work_dir, total_duration, width=profile["width"], height=profile["height"],
+                                   fps=profile["fps"], caption_top=caption_top, font_size=font_size, workers=workers,
+                                   video_codec_args=encoder_args(profile),
+                                   wrap_captions=profile.get("wrap_captions", False), threads=profile.get("threads"))
+        write_ass_subtitles(timed_captions, os.path.join(work_dir, "captions.ass"), profile["width"], profile["height"],
+                            font_size=font_size, caption_top=caption_top, wrap=profile.get("wrap_captions", False))
+        # Relative path avoids filtergraph escaping; ffmpeg runs inside work_dir
+        video_args = ["-vf", "subtitles=captions.ass", *encoder_args(profile),
+                      "-threads", str(profile.get("threads", 1))]
+    run_ffmpeg([
+        "-v", "error",
+        "-i", os.path.abspath(track_path),
+        "-i", os.path.abspath(audio_file_path),
+        "-map", "0:v:0", "-map", "1:a:0",
+        *video_args,
+        *OUTPUT_AUDIO_ARGS,
+        "-t", f"{total_duration:.3f}",
+        "-movflags", "+faststart",
+        os.path.abspath(output_file)
+    ], cwd=work_dir, progress=frame_counter("encode", int(round(total_duration * profile["fps"]))))
+    return output_file
+
+
+def render_incremental(audio_file_path, timed_captions, background_segments, output_file, work_dir, profile,
+                       workers=1, cache=None, build=True):
+    """
+    Render through the background track cache.
+
+    Args:
+        audio_file_path (str): Narration; sets the video length
+        timed_captions (list): ((t1, t2), text) pairs
+        background_segments (list): ((t1, t2), (source file, offset)) pairs
+        output_file (str): Path of the rendered video
+        work_dir (str): Scratch directory for the subtitles
+        profile (dict): Resolved render profile
+        workers (int): Background segments, then caption chunks, encoded at once
+        cache (BackgroundTrackCache, optional): Defaults to the shared cache
+        build (bool): Build the track if it is not cached yet; otherwise only
+            render when it is
+
+    Returns:
+        str: ``output_file``, or None if there is no track (not cached and
+            ``build`` is False, or it could not be built)
+    """
+    cache = cache or get_background_track_cache()
+    total_duration = probe_duration(audio_file_path)
+    if not total_duration:
+        total_duration = max([t2 for (_, t2), _ in background_segments] + [t2 for (_, t2), _ in timed_captions] + [0])
+    if total_duration <= 0:
+        raise ValueError("Nothing to render: timeline is empty")
+
+    with cache.open_track(background_segments, total_duration, profile, workers=workers, build=build) as track_path:
+        if track_path is None:
+            return None
+        print(f"Overlaying {len(timed_captions)} captions and narration on the background track...")
+        return overlay_and_mux(track_path, audio_file_path, timed_captions, output_file, work_dir, profile,
+                               total_duration, workers=workers)
+
+
+_DEFAULT_CACHE = None
+_DEFAULT_CACHE_LOCK = threading.Lock()
+
+
+def get_background_track_cache():
+    """Return the process-wide background track cache, creating it on first use."""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        with _DEFAULT_CACHE_LOCK:
+            if _DEFAULT_CACHE is None:
+                _DEFAULT_CACHE = BackgroundTrackCache()
+    return _DEFAULT_CACHE
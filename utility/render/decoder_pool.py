@@ -0,0 +1,165 @@
+"""
+Lazy background clips for the moviepy backend.
+
+A ``VideoFileClip`` starts an ffmpeg reader the moment it is created, so
+building the whole timeline up front keeps one decoder (and its pipe buffers)
+alive per segment for the entire render. The clips here only hold a file
+path and the metadata moviepy needs to lay out the timeline; their reader is
+opened through a shared ``DecoderPool`` the first time a frame is requested,
+and closed again once playback has moved past the last segment that uses it.
+The pool also caps how many readers are open at once, evicting the least
+recently used one when the cap is reached.
+"""
+
+import os
+import weakref
+import threading
+from collections import OrderedDict
+
+from moviepy.video.VideoClip import VideoClip
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader, ffmpeg_parse_infos
+
+from utility.tracing import span
+
+# Maximum number of ffmpeg readers open at the same time
+MAX_LIVE_DECODERS = int(os.environ.get("MAX_LIVE_DECODERS", "4"))
+
+# Every pool in this process, for reporting how many readers are open
+_POOLS = weakref.WeakSet()
+
+
+def probe_video(path):
+    """
+    Read a video's size, frame rate and duration without starting a decoder.
+
+    Returns:
+        dict: ``size`` ([width, height]), ``fps`` and ``duration``
+    """
+    infos = ffmpeg_parse_infos(path)
+    return {
+        "size": infos["video_size"],
+        "fps": infos["video_fps"],
+        "duration": infos["duration"]
+    }
+
+
+class DecoderPool:
+    """
+    Bounded, least-recently-used set of open ffmpeg readers keyed by file path.
+
+    Args:
+        max_live (int): Maximum number of readers open at once
+    """
+
+    def __init__(self, max_live=None):
+        self.max_live = max(1, max_live or MAX_LIVE_DECODERS)
+        self._readers = OrderedDict()  # Path -> FFMPEG_VideoReader, least recently used first
+        self._release_at = {}  # Path -> timeline time after which no clip needs it
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.peak_live = 0
+        _POOLS.add(self)
+
+    def register(self, path, end):
+        """Record that a clip reads ``path`` until ``end`` seconds into the timeline."""
+        with self._lock:
+            self._release_at[path] = max(end, self._release_at.get(path, 0))
+
+    def acquire(self, path):
+        """Return an open reader for ``path``, opening it (and evicting others) if needed."""
+        with self._lock:
+            reader = self._readers.get(path)
+            if reader is not None:
+                self._readers.move_to_end(path)
+                return reader
+            while len(self._readers) >= self.max_live:
+                _, oldest = self._readers.popitem(last=False)
+                self._close(oldest)
+            with span("decoder open", category="decode", path=os.path.basename(path)):
+                reader = FFMPEG_VideoReader(path)
+            self._readers[path] = reader
+            self.opened += 1
+            self.peak_live = max(self.peak_live, len(self._readers))
+            return reader
+
+    def release_finished(self, t):
+        """Close the readers of every file whose last registered use ends before ``t``."""
+        with self._lock:
+            for path in [path for path in self._readers if self._release_at.get(path, float("inf")) <= t]:
+                self._close(self._readers.pop(path))
+
+    def live_count(self):
+        with self._lock:
+            return len(self._readers)
+
+    def close_all(self):
+        with self._lock:
+            while self._readers:
+                _, reader = self._readers.popitem()
+                self._close(reader)
+
+    @staticmethod
+    def _close(reader):
+        try:
+            reader.close()
+        except Exception as e:
+            print(f"Warning: Could not close video reader: {str(e)}")
+
+
+class LazyVideoClip(VideoClip):
+    """
+    Video clip backed by a file whose reader is borrowed from a DecoderPool.
+
+    Args:
+        pool (DecoderPool): Pool that owns the reader
+        path (str): Video file
+        offset (float): Where in the file the clip starts
+        duration (float): Length of the clip
+        info (dict, optional): Result of ``probe_video(path)``, to avoid probing again
+        loop (bool): Wrap around to the start of the file when it runs out
+    """
+
+    def __init__(self, pool, path, offset=0, duration=None, info=None, loop=False):
+        VideoClip.__init__(self)
+        info = info or probe_video(path)
+        self.pool = pool
+        self.filename = path
+        self.source_duration = info["duration"]
+        self.size = tuple(info["size"])
+        self.fps = info["fps"]
+        if duration is None:
+            duration = self.source_duration - offset
+        self.duration = self.end = duration
+
+        def make_frame(t):
+            source_t = offset + t
+            if loop and self.source_duration:
+                source_t %= self.source_duration
+            return pool.acquire(path).get_frame(source_t)
+
+        self.make_frame = make_frame
+
+    def close(self):
+        """Readers belong to the pool; see DecoderPool.close_all."""
+
+
+def live_decoder_count():
+    """Number of ffmpeg readers currently open across all decoder pools in this process."""
+    return sum(pool.live_count() for pool in list(_POOLS))
+
+
+def release_behind(clip, pool):
+    """
+    Make ``clip`` close finished readers as its frames are rendered.
+
+    Wraps the composite's frame function so every frame first releases the
+    readers of segments that ended before it.
+    """
+    make_frame = clip.make_frame
+
+    def release_then_make_frame(t):
+        pool.release_finished(t)
+        return make_frame(t)
+
+    clip.make_frame = release_then_make_frame
+    return clip
@@ -0,0 +1,238 @@
+"""
+ffmpeg render backend.
+
+Renders the whole timeline in a single ffmpeg invocation instead of
+compositing frames in Python: the normalized background segments are joined
+with the concat demuxer, captions are burned in with the libass
+``subtitles`` filter and the narration is muxed as the audio track.
+"""
+
+import os
+from functools import partial
+
+from utility.render.ffmpeg_tools import run_ffmpeg, probe_duration
+from utility.render.prenormalize import INTERMEDIATE_CODEC_ARGS, TARGET_PIX_FMT
+from utility.render.procedural_backgrounds import procedural_clip
+from utility.progress import frame_counter
+
+# Caption style, matching the moviepy backend's TextClip settings at 1080p
+CAPTION_FONT = "Arial"
+CAPTION_FONT_SIZE = 100
+CAPTION_STROKE_WIDTH = 3
+CAPTION_TOP = 800  # Top edge of the caption, in pixels from the top of a 1080p frame
+CAPTION_WRAP_MARGIN = 0.05  # Side margin of wrapped captions, as a fraction of the width
+
+# Final encode settings, matching the moviepy backend
+OUTPUT_CODEC_ARGS = ["-c:v", "libx264", "-preset", "ultrafast", "-b:v", "2000k", "-pix_fmt", TARGET_PIX_FMT]
+OUTPUT_AUDIO_ARGS = ["-c:a", "aac"]
+MIN_SPAN = 0.001  # Seconds; shorter gaps and overlaps are ignored
+
+
+def format_ass_time(seconds):
+    """Format seconds as an ASS timestamp (H:MM:SS.cc)."""
+    centiseconds = int(round(max(seconds, 0) * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+
+def escape_ass_text(text):
+    """Escape caption text for an ASS Dialogue line."""
+    text = str(text).replace("\\", "\\\\").replace("{", "\\{").replace("}", "\\}")
+    return text.replace("\r", "").replace("\n", "\\N")
+
+
+def write_ass_subtitles(timed_captions, path, width=1920, height=1080, font_size=CAPTION_FONT_SIZE,
+                        caption_top=CAPTION_TOP, stroke_width=CAPTION_STROKE_WIDTH, wrap=False):
+    """
+    Write captions as an ASS subtitle file.
+
+    Captions are centred horizontally with their top edge at ``caption_top``
+    pixels, white with a black outline, like the moviepy TextClip captions.
+    With ``wrap`` long captions are broken over several lines inside a 5%
+    side margin instead of running off narrow frames.
+    """
+    margin = int(round(width * CAPTION_WRAP_MARGIN)) if wrap else 0
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        f"WrapStyle: {0 if wrap else 2}",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+        "Alignment, MarginL, MarginR, MarginV, Encoding",
+        f"Style: Caption,{CAPTION_FONT},{font_size},&H00FFFFFF,&H00FFFFFF,&H00000000,&H00000000,"
+        f"0,0,0,0,100,100,0,0,1,{stroke_width},0,8,{margin},{margin},{caption_top},1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+    for (t1, t2), text in timed_captions:
+        lines.append(f"Dialogue: 0,{format_ass_time(t1)},{format_ass_time(t2)},Caption,,0,0,0,,{escape_ass_text(text)}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+def make_filler_clip(duration, path, width, height, fps, procedural_dir=None):
+    """
+    Make the clip used where the timeline has no background video: the cached
+    procedural background (from ``procedural_dir``), looped to ``duration``,
+    or black if it is unavailable.
+    """
+    background = procedural_clip(width, height, fps, directory=procedural_dir)
+    if background is not None:
+        run_ffmpeg(["-v", "error", "-stream_loop", "-1", "-i", background, "-t", f"{duration:.3f}", "-c", "copy", path])
+        return path
+    run_ffmpeg([
+        "-v", "error",
+        "-f", "lavfi", "-i", f"color=c=black:s={width}x{height}:r={fps}",
+        "-t", f"{duration:.3f}",
+        "-pix_fmt", TARGET_PIX_FMT,
+        *INTERMEDIATE_CODEC_ARGS,
+        path
+    ])
+    return path
+
+
+def build_background_sequence(background_segments, total_duration):
+    """
+    Lay background segments end to end over ``[0, total_duration)``.
+
+    Args:
+        background_segments (list): ((t1, t2), path) pairs; path may be None
+        total_duration (float): Length of the final video
+
+    Returns:
+        list: (duration, path) pairs in playback order, where path is None for
+        gaps that need a filler clip
+    """
+    sequence = []
+    cursor = 0.0
+    for (t1, t2), path in sorted(background_segments, key=lambda segment: segment[0][0]):
+        t1 = max(float(t1), cursor)
+        t2 = min(float(t2), total_duration)
+        if t2 - t1 < MIN_SPAN:
+            continue
+        if t1 - cursor >= MIN_SPAN:
+            sequence.append((t1 - cursor, None))
+        sequence.append((t2 - t1, path))
+        cursor = t2
+    if total_duration - cursor >= MIN_SPAN:
+        sequence.append((total_duration - cursor, None))
+    return sequence
+
+
+def quote_concat_path(path):
+    return "'" + os.path.abspath(path).replace("'", "'\\''") + "'"
+
+
+def resolve_fillers(sequence, work_dir, width, height, fps, filler=make_filler_clip):
+    """Replace the gaps (None paths) in a background sequence with rendered filler clips."""
+    resolved = []
+    for index, (duration, clip_path) in enumerate(sequence):
+        if clip_path is None:
+            clip_path = filler(duration, os.path.join(work_dir, f"filler_{index:04d}.mp4"), width, height, fps)
+        resolved.append((duration, clip_path))
+    return resolved
+
+
+def write_concat_list(entries, path):
+    """
+    Write an ffmpeg concat demuxer list.
+
+    Args:
+        entries (list): (clip path, inpoint, outpoint) tuples in playback order
+        path (str): Where to write the list
+    """
+    lines = []
+    for clip_path, inpoint, outpoint in entries:
+        lines.append(f"file {quote_concat_path(clip_path)}")
+        if inpoint > 0:
+            lines.append(f"inpoint {inpoint:.3f}")
+        lines.append(f"outpoint {outpoint:.3f}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+def render_with_ffmpeg(audio_file_path, timed_captions, background_segments, output_file, work_dir,
+                       width=1920, height=1080, fps=25, caption_top=None, font_size=None, workers=1,
+                       video_codec_args=None, threads=None, wrap_captions=False, procedural_dir=None):
+    """
+    Render the final video with a single ffmpeg command.
+
+    Args:
+        audio_file_path (str): Narration track; sets the video length
+        timed_captions (list): ((t1, t2), text) pairs
+        background_segments (list): ((t1, t2), path) pairs of normalized clips
+        output_file (str): Path of the rendered video
+        work_dir (str): Scratch directory for the concat list, subtitles and fillers
+        width, height, fps: Output format; background clips must already match it
+        caption_top (int, optional): Top edge of the captions in output pixels;
+            defaults to CAPTION_TOP scaled to ``height``
+        font_size (int, optional): Caption size; defaults to CAPTION_FONT_SIZE
+            scaled to ``height``
+        workers (int): Render GOP-aligned chunks in this many processes and
+            join them losslessly (see parallel_render); 1 renders in one pass
+        video_codec_args (list, optional): ffmpeg video encoder arguments;
+            defaults to OUTPUT_CODEC_ARGS
+        threads (int, optional): Encoder threads, split between the chunks of a
+            parallel render
+        wrap_captions (bool): Wrap long captions (for narrow output formats)
+        procedural_dir (str, optional): Procedural background cache for gaps
+
+    Returns:
+        str: ``output_file``
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    if caption_top is None:
+        caption_top = int(round(CAPTION_TOP * height / 1080))
+    if font_size is None:
+        font_size = int(round(CAPTION_FONT_SIZE * height / 1080))
+    video_codec_args = video_codec_args or OUTPUT_CODEC_ARGS
+    total_duration = probe_duration(audio_file_path)
+    if not total_duration:
+        total_duration = max([t2 for (_, t2), _ in background_segments] + [t2 for (_, t2), _ in timed_captions] + [0])
+    if total_duration <= 0:
+        raise ValueError("Nothing to render: timeline is empty")
+
+    sequence = resolve_fillers(build_background_sequence(background_segments, total_duration), work_dir, width, height, fps,
+                               filler=partial(make_filler_clip, procedural_dir=procedural_dir))
+    if workers > 1:
+        from utility.render.parallel_render import render_parallel
+        return render_parallel(audio_file_path, timed_captions, sequence, output_file, work_dir, total_duration,
+                               width=width, height=height, fps=fps, caption_top=caption_top, font_size=font_size,
+                               workers=workers, video_codec_args=video_codec_args, wrap_captions=wrap_captions,
+                               threads=threads)
+    concat_list = write_concat_list([(clip_path, 0, duration) for duration, clip_path in sequence],
+                                    os.path.join(work_dir, "background.txt"))
+
+    filters = [f"fps={fps}", f"format={TARGET_PIX_FMT}"]
+    if timed_captions:
+        write_ass_subtitles(timed_captions, os.path.join(work_dir, "captions.ass"), width, height,
+                            font_size=font_size, caption_top=caption_top, wrap=wrap_captions)
+        # Relative path avoids filtergraph escaping; ffmpeg runs inside work_dir
+        filters.append("subtitles=captions.ass")
+
+    print(f"Rendering {total_duration:.2f}s with ffmpeg ({len(sequence)} background clips, {len(timed_captions)} captions)...")
+    run_ffmpeg([
+        "-v", "error",
+        "-f", "concat", "-safe", "0", "-i", os.path.abspath(concat_list),
+        "-i", os.path.abspath(audio_file_path),
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-vf", ",".join(filters),
+        "-t", f"{total_duration:.3f}",
+        *video_codec_args,
+        *(["-threads", str(threads)] if threads else []),
+        *OUTPUT_AUDIO_ARGS,
+        "-max_muxing_queue_size", "1024",
+        "-movflags", "+faststart",
+        os.path.abspath(output_file)
+    ], cwd=work_dir, progress=frame_counter("encode", int(round(total_duration * fps))))
+    return output_file
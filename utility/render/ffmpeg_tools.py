@@ -0,0 +1,91 @@
+"""
+Helpers for running ffmpeg directly from the render pipeline.
+"""
+
+import os
+import tempfile
+import subprocess
+
+from utility.tracing import span
+from utility.deadline import current_deadline
+from utility.progress import ffmpeg_progress_args, parse_ffmpeg_progress
+
+
+def get_ffmpeg_binary():
+    """
+    Locate the ffmpeg executable.
+
+    Prefers the FFMPEG_BINARY environment variable, then the binary bundled
+    with imageio-ffmpeg (the one moviepy uses), then ffmpeg on the PATH.
+    """
+    binary = os.environ.get("FFMPEG_BINARY")
+    if binary and binary != "auto-detect":
+        return binary
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+
+def run_ffmpeg(args, timeout=None, cwd=None, progress=None):
+    """
+    Run ffmpeg with the given arguments (without the binary itself).
+
+    ffmpeg is terminated if the current job's deadline passes or the job is
+    cancelled while it runs (see utility.deadline).
+
+    Args:
+        progress (callable, optional): Called as ``progress(frames)`` with
+            ffmpeg's output frame counter while it runs
+
+    Raises:
+        RuntimeError: If ffmpeg exits with an error, including the tail of its stderr
+        JobInterrupted: If ffmpeg was terminated for the deadline or a cancel
+    """
+    deadline = current_deadline()
+    deadline.check("ffmpeg")
+    cmd = [get_ffmpeg_binary(), "-hide_banner", "-nostdin", "-y"] + [str(arg) for arg in args]
+    with span("ffmpeg", category="ffmpeg", output=os.path.basename(str(args[-1])) if args else None):
+        if progress is None and not deadline.bounded:
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout, cwd=cwd)
+        else:
+            if progress is not None:
+                cmd = cmd[:1] + ffmpeg_progress_args() + cmd[1:]
+            result = _run_watched(cmd, progress, timeout, cwd, deadline)
+    if result.returncode != 0:
+        deadline.check("ffmpeg")
+        stderr = result.stderr.decode("utf-8", errors="replace").strip().splitlines()
+        raise RuntimeError(f"ffmpeg failed ({result.returncode}): {' | '.join(stderr[-5:])}")
+    return result
+
+
+def _run_watched(cmd, progress, timeout, cwd, deadline):
+    # stderr goes to a file so a chatty ffmpeg cannot block on a full pipe while stdout is read
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE if progress else subprocess.DEVNULL,
+                                   stderr=stderr, cwd=cwd)
+        try:
+            with deadline.watch(process):
+                if progress is not None:
+                    parse_ffmpeg_progress(process.stdout, progress)
+                process.wait(timeout=timeout)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            if process.stdout is not None:
+                process.stdout.close()
+        stderr.seek(0)
+        return subprocess.CompletedProcess(cmd, process.returncode, b"", stderr.read())
+
+
+def probe_duration(path):
+    """Return the duration of a media file in seconds, or None if unknown."""
+    try:
+        from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+        return ffmpeg_parse_infos(path).get("duration")
+    except Exception as e:
+        print(f"Warning: Could not read duration of {path}: {str(e)}")
+        return None
@@ -0,0 +1,203 @@
+"""
+Decoded-frame cache for short background clips in the moviepy backend.
+
+A clip shorter than its segment is looped, and a clip shared by several
+segments is read once per segment; each pass normally seeks back in the file
+and decodes it again. Short sources are instead decoded once by ffmpeg,
+already scaled and cropped to the output size and resampled to the output
+frame rate, into a memory-mapped uint8 array. Every later frame is a slice of
+that array.
+
+The cache is capped in bytes. When it is full, entries are evicted in order
+of the decode time they save per byte (decode seconds times uses, divided
+by size), so cheap-to-rebuild, rarely used clips go first.
+
+The cache only applies to segments built from their sources, that is with
+PRENORMALIZE_CLIPS=0 or for segments whose pre-normalization failed. With
+the default PRENORMALIZE_CLIPS=1, looped and shared short sources are
+instead decoded once by prenormalize, which normalizes each of them into a
+base clip at the output format and cuts the segments from that clip.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import subprocess
+
+import numpy as np
+from moviepy.video.VideoClip import VideoClip
+
+from utility.render.ffmpeg_tools import get_ffmpeg_binary
+from utility.render.prenormalize import normalize_filter
+from utility.tracing import span
+
+# Cache settings
+FRAME_CACHE_MAX_BYTES = int(os.environ.get("FRAME_CACHE_MAX_BYTES", 2 * 1024 ** 3))  # 2 GB
+FRAME_CACHE_MAX_SECONDS = float(os.environ.get("FRAME_CACHE_MAX_SECONDS", "10"))  # Longer sources are streamed
+
+
+class CachedFrames:
+    """Frames of one source, decoded at a fixed size and frame rate into a memory map."""
+
+    def __init__(self, path, frames, fps, decode_seconds):
+        self.path = path
+        self.frames = frames
+        self.fps = fps
+        self.decode_seconds = decode_seconds
+        self.uses = 0
+
+    @property
+    def count(self):
+        return len(self.frames)
+
+    @property
+    def duration(self):
+        return self.count / self.fps
+
+    @property
+    def nbytes(self):
+        return self.frames.nbytes
+
+    def saving(self):
+        """Decode seconds saved per byte of cache; the eviction priority."""
+        return self.decode_seconds * max(1, self.uses) / max(1, self.nbytes)
+
+    def frame_at(self, t, loop=False):
+        index = int(t * self.fps + 1e-6)
+        if loop:
+            index %= self.count
+        return self.frames[min(max(index, 0), self.count - 1)]
+
+
+class FrameCache:
+    """
+    Byte-capped cache of decoded short clips, backed by files in ``directory``.
+
+    Args:
+        directory (str, optional): Where the memory-mapped files live; a
+            temporary directory (removed by ``close``) by default
+        max_bytes (int): Total size of all decoded clips
+        max_seconds (float): Sources longer than this are not cached
+    """
+
+    def __init__(self, directory=None, max_bytes=FRAME_CACHE_MAX_BYTES, max_seconds=FRAME_CACHE_MAX_SECONDS):
+        self.owns_directory = directory is None
+        self.directory = directory or tempfile.mkdtemp(prefix="frame_cache_")
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.entries = {}  # (source, width, height, fps) -> CachedFrames
+        self.hits = 0
+        self.misses = 0
+        self._serial = 0
+
+    def size(self):
+        return sum(entry.nbytes for entry in self.entries.values())
+
+    def eligible(self, duration, width, height, fps):
+        """Whether a source of ``duration`` seconds is short and small enough to cache."""
+        if not duration or duration > self.max_seconds:
+            return False
+        return (int(duration * fps) + 2) * width * height * 3 <= self.max_bytes
+
+    def get(self, source, duration, width, height, fps):
+        """
+        Decoded frames of ``source`` at the given size and frame rate, decoding
+        them on the first request.
+
+        Returns:
+            CachedFrames: The frames, or None if the source is not eligible or
+            could not be decoded
+        """
+        key = (os.path.abspath(source), width, height, fps)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            entry.uses += 1
+            return entry
+        if not self.eligible(duration, width, height, fps):
+            return None
+        self.misses += 1
+        with span("frame cache decode", category="decode", source=os.path.basename(source)):
+            entry = self._decode(source, duration, width, height, fps)
+        if entry is None:
+            return None
+        entry.uses = 1
+        self.entries[key] = entry
+        self.evict(keep=key)
+        return entry
+
+    def _decode(self, source, duration, width, height, fps):
+        frame_bytes = width * height * 3
+        capacity = int(duration * fps) + 2
+        self._serial += 1
+        name = os.path.join(self.directory, f"{self._serial:06d}_{width}x{height}.rgb")
+        frames = np.memmap(name, dtype=np.uint8, mode="w+", shape=(capacity, height, width, 3))
+        start = time.time()
+        cmd = [get_ffmpeg_binary(), "-hide_banner", "-nostdin", "-v", "error", "-i", source, "-an",
+               "-vf", normalize_filter(width, height, fps, "rgb24"),
+               "-f", "rawvideo", "-pix_fmt", "rgb24", "-"]
+        count = 0
+        try:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=frame_bytes)
+            try:
+                while count < capacity:
+                    data = process.stdout.read(frame_bytes)
+                    if len(data) < frame_bytes:
+                        break
+                    frames[count] = np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+                    count += 1
+            finally:
+                process.stdout.close()
+                process.wait()
+        except Exception as e:
+            print(f"Warning: Could not decode {source} into the frame cache: {str(e)}")
+            count = 0
+        if count == 0:
+            del frames
+            os.remove(name)
+            return None
+        frames.flush()
+        return CachedFrames(source, frames[:count], fps, time.time() - start)
+
+    def evict(self, keep=None):
+        """Drop the entries saving the least decode time per byte until the cache fits in ``max_bytes``."""
+        total = self.size()
+        candidates = sorted((key for key in self.entries if key != keep), key=lambda key: self.entries[key].saving())
+        for key in candidates:
+            if total <= self.max_bytes:
+                break
+            entry = self.entries.pop(key)
+            total -= entry.nbytes
+            filename = entry.frames.filename
+            # Clips still holding the array keep their mapping; the file is only unlinked
+            del entry
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    def close(self):
+        self.entries.clear()
+        if self.owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class CachedVideoClip(VideoClip):
+    """
+    Video clip that plays frames from a CachedFrames array.
+
+    Args:
+        frames (CachedFrames): Decoded source
+        offset (float): Where in the source the clip starts
+        duration (float): Length of the clip
+        loop (bool): Wrap around to the start of the source when it runs out
+    """
+
+    def __init__(self, frames, offset=0, duration=None, loop=False):
+        VideoClip.__init__(self)
+        self.size = (frames.frames.shape[2], frames.frames.shape[1])
+        self.fps = frames.fps
+        self.duration = self.end = frames.duration - offset if duration is None else duration
+        self.make_frame = lambda t: frames.frame_at(offset + t, loop)
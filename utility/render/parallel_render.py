@@ -0,0 +1,209 @@
+"""
+Segment-parallel rendering for the ffmpeg backend.
+
+The timeline is split into chunks whose boundaries fall on keyframes, each
+chunk is encoded by its own ffmpeg process with a fixed GOP, and the chunks
+are joined with stream-copy concatenation. The narration is muxed once, in
+the final join, so audio never has to be split.
+"""
+
+import os
+import math
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
+from utility.render.ffmpeg_tools import run_ffmpeg
+from utility.deadline import current_deadline
+from utility.progress import get_progress
+from utility.render.ffmpeg_backend import (write_ass_subtitles, OUTPUT_CODEC_ARGS,
+                                           OUTPUT_AUDIO_ARGS, CAPTION_TOP, CAPTION_FONT_SIZE, MIN_SPAN)
+from utility.render.prenormalize import TARGET_PIX_FMT
+
+# Chunking settings
+GOP_SECONDS = 2  # Keyframe interval; chunk boundaries are multiples of it
+MIN_CHUNK_SECONDS = 10  # Shorter chunks cost more in process start-up than they save
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", os.cpu_count() or 1))
+
+
+def plan_chunks(total_duration, fps, workers, gop_seconds=None, min_chunk_seconds=None):
+    """
+    Split ``[0, total_duration)`` into GOP-aligned chunks, roughly one per worker.
+
+    Returns:
+        list: (start_frame, frame_count) pairs covering every output frame
+    """
+    gop_seconds = gop_seconds or GOP_SECONDS
+    min_chunk_seconds = MIN_CHUNK_SECONDS if min_chunk_seconds is None else min_chunk_seconds
+    gop = max(1, int(round(gop_seconds * fps)))
+    total_frames = max(1, int(round(total_duration * fps)))
+    total_gops = math.ceil(total_frames / gop)
+    min_chunk_gops = max(1, math.ceil(min_chunk_seconds * fps / gop))
+    chunk_gops = max(math.ceil(total_gops / max(1, workers)), min_chunk_gops)
+
+    chunks = []
+    start = 0
+    while start < total_frames:
+        count = min(chunk_gops * gop, total_frames - start)
+        chunks.append((start, count))
+        start += count
+    return chunks
+
+
+def slice_sequence(sequence, start, end):
+    """
+    Cut the part of a background sequence that plays during ``[start, end)``.
+
+    Args:
+        sequence (list): (duration, path) pairs laid end to end from 0
+
+    Returns:
+        list: (path, inpoint, outpoint) entries for the concat demuxer
+    """
+    entries = []
+    position = 0.0
+    for duration, path in sequence:
+        clip_start, clip_end = position, position + duration
+        position = clip_end
+        if clip_end <= start + MIN_SPAN or clip_start >= end - MIN_SPAN:
+            continue
+        inpoint = max(start, clip_start) - clip_start
+        outpoint = min(end, clip_end) - clip_start
+        entries.append((path, inpoint, outpoint))
+    return entries
+
+
+def slice_captions(timed_captions, start, end):
+    """Captions visible during ``[start, end)``, re-timed relative to ``start``."""
+    sliced = []
+    for (t1, t2), text in timed_captions:
+        if t2 <= start or t1 >= end:
+            continue
+        sliced.append(((max(t1, start) - start, min(t2, end) - start), text))
+    return sliced
+
+
+def render_chunk(entries, output, frame_count, fps, width, height, captions_file=None, threads=1,
+                 video_codec_args=OUTPUT_CODEC_ARGS):
+    """
+    Encode one chunk, video only, with a closed, fixed-length GOP so chunks can
+    be concatenated without re-encoding.
+
+    Each background entry is opened as its own input with an accurate seek,
+    since a chunk usually starts in the middle of a clip's GOP, and the inputs
+    are joined with the concat filter.
+    """
+    gop = max(1, int(round(GOP_SECONDS * fps)))
+    inputs = []
+    for clip_path, inpoint, outpoint in entries:
+        inputs += ["-ss", f"{inpoint:.3f}", "-t", f"{outpoint - inpoint:.3f}", "-i", os.path.abspath(clip_path)]
+    filters = [f"fps={fps}", f"format={TARGET_PIX_FMT}"]
+    if captions_file:
+        filters.append(f"subtitles={os.path.basename(captions_file)}")
+    graph = "".join(f"[{index}:v]" for index in range(len(entries)))
+    graph += f"concat=n={len(entries)}:v=1:a=0," + ",".join(filters) + "[v]"
+    run_ffmpeg([
+        "-v", "error",
+        *inputs,
+        "-filter_complex", graph,
+        "-map", "[v]",
+        "-frames:v", str(frame_count),
+        *video_codec_args,
+        "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0", "-bf", "0",
+        "-threads", str(threads),
+        os.path.abspath(output)
+    ], cwd=os.path.dirname(os.path.abspath(output)))
+    return output
+
+
+def _render_chunk_job(job):
+    return render_chunk(**job)
+
+
+def concat_chunks(chunk_files, audio_file_path, output_file, total_duration, work_dir):
+    """Join encoded chunks with stream copy and mux the narration once."""
+    concat_list = os.path.join(work_dir, "chunks.txt")
+    with open(concat_list, "w", encoding="utf-8") as f:
+        for chunk in chunk_files:
+            f.write("file '" + os.path.abspath(chunk).replace("'", "'\\''") + "'\n")
+    run_ffmpeg([
+        "-v", "error",
+        "-f", "concat", "-safe", "0", "-i", concat_list,
+        "-i", os.path.abspath(audio_file_path),
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-c:v", "copy",
+        *OUTPUT_AUDIO_ARGS,
+        "-t", f"{total_duration:.3f}",
+        "-movflags", "+faststart",
+        os.path.abspath(output_file)
+    ])
+    return output_file
+
+
+def render_parallel(audio_file_path, timed_captions, sequence, output_file, work_dir, total_duration,
+                    width=1920, height=1080, fps=25, caption_top=CAPTION_TOP, font_size=CAPTION_FONT_SIZE,
+                    workers=RENDER_WORKERS, video_codec_args=OUTPUT_CODEC_ARGS, wrap_captions=False, threads=None):
+    """
+    Render a background sequence plus captions in GOP-aligned chunks, in parallel.
+
+    Args:
+        audio_file_path (str): Narration, muxed once after the chunks are joined
+        timed_captions (list): ((t1, t2), text) pairs on the full timeline
+        sequence (list): (duration, path) background clips laid end to end
+        output_file (str): Path of the rendered video
+        work_dir (str): Scratch directory
+        total_duration (float): Length of the final video
+        workers (int): Number of chunk encoders running at once
+        video_codec_args (list): ffmpeg video encoder arguments for every chunk
+        wrap_captions (bool): Wrap long captions (for narrow output formats)
+        threads (int, optional): Encoder threads shared by the chunks running
+            at once (the profile's ``threads``); defaults to the CPUs available
+
+    Returns:
+        str: ``output_file``
+    """
+    from utility.render.render_profiles import available_cpus
+
+    chunks = plan_chunks(total_duration, fps, workers)
+    chunk_dir = os.path.join(work_dir, "chunks")
+    os.makedirs(chunk_dir, exist_ok=True)
+    threads = max(1, (threads or available_cpus()) // min(workers, len(chunks)))
+
+    jobs = []
+    for index, (start_frame, frame_count) in enumerate(chunks):
+        start = start_frame / fps
+        end = (start_frame + frame_count) / fps
+        captions = slice_captions(timed_captions, start, end)
+        captions_file = None
+        if captions:
+            captions_file = write_ass_subtitles(captions, os.path.join(chunk_dir, f"chunk_{index:04d}.ass"),
+                                                width, height, font_size=font_size, caption_top=caption_top,
+                                                wrap=wrap_captions)
+        jobs.append({
+            "entries": slice_sequence(sequence, start, end),
+            "output": os.path.join(chunk_dir, f"chunk_{index:04d}.mp4"),
+            "frame_count": frame_count,
+            "fps": fps,
+            "width": width,
+            "height": height,
+            "captions_file": captions_file,
+            "threads": threads,
+            "video_codec_args": video_codec_args
+        })
+
+    print(f"Rendering {total_duration:.2f}s as {len(jobs)} chunks with {min(workers, len(jobs))} workers...")
+    progress = get_progress()
+    total_frames = sum(job["frame_count"] for job in jobs)
+    encoded_frames = 0
+    chunk_files = []
+    parallel = len(jobs) > 1 and workers > 1
+    pool_options = current_deadline().pool_options()  # Workers stop their ffmpeg on the job's deadline
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), **pool_options) if parallel else nullcontext() as executor:
+        results = executor.map(_render_chunk_job, jobs) if executor else map(_render_chunk_job, jobs)
+        # Frames are counted as each chunk is done
+        for job, chunk_file in zip(jobs, results):
+            chunk_files.append(chunk_file)
+            encoded_frames += job["frame_count"]
+            progress.frames("encode", encoded_frames, total_frames)
+
+    print("Joining chunks and adding narration...")
+    return concat_chunks(chunk_files, audio_file_path, output_file, total_duration, work_dir)
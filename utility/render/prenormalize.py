@@ -0,0 +1,178 @@
+"""
+Pre-render normalization of background clips.
+
+Before compositing, each segment's span is cut out of its source clip with
+ffmpeg, scaled and cropped to the target resolution and converted to a
+constant frame rate and pixel format. The jobs run in a process pool, so the
+final composition only has to read short, uniform inputs.
+
+A short source that is looped, or shared by several segments, would be
+decoded and scaled again for every loop and every segment. Such a source is
+instead normalized once, whole, into a base clip at the target format, and
+its segments are cut from that clip. The base clip is cheap to decode and
+needs no scaling.
+"""
+
+import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+from utility.render.ffmpeg_tools import run_ffmpeg
+from utility.deadline import current_deadline
+
+# Target format for normalized segments
+TARGET_WIDTH = 1920
+TARGET_HEIGHT = 1080
+TARGET_FPS = 25
+TARGET_PIX_FMT = "yuv420p"
+PRENORMALIZE_WORKERS = int(os.environ.get("PRENORMALIZE_WORKERS", os.cpu_count() or 1))
+# Looped or shared sources up to this long are normalized once and cut from there
+BASE_CLIP_MAX_SECONDS = float(os.environ.get("PRENORMALIZE_BASE_MAX_SECONDS", "10"))
+
+# Fast-to-encode, fast-to-decode intermediate
+INTERMEDIATE_CODEC_ARGS = ["-c:v", "libx264", "-preset", "ultrafast", "-tune", "fastdecode", "-crf", "18"]
+
+
+def normalize_filter(width, height, fps, pix_fmt=TARGET_PIX_FMT):
+    """ffmpeg video filter that fills ``width``x``height`` (cropping overflow) at a constant frame rate."""
+    return (f"scale={width}:{height}:force_original_aspect_ratio=increase,"
+            f"crop={width}:{height},setsar=1,fps={fps},format={pix_fmt}")
+
+
+def normalized_name(source, offset, duration, width, height, fps, pix_fmt=TARGET_PIX_FMT):
+    """Deterministic file name for a normalized segment."""
+    key = f"{os.path.abspath(source)}|{offset:.3f}|{duration:.3f}|{width}x{height}|{fps}|{pix_fmt}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest() + ".mp4"
+
+
+def normalize_segment(source, output, offset, duration, width=TARGET_WIDTH, height=TARGET_HEIGHT,
+                      fps=TARGET_FPS, pix_fmt=TARGET_PIX_FMT):
+    """
+    Cut ``duration`` seconds starting at ``offset`` out of ``source`` and
+    conform it to the target resolution, frame rate and pixel format.
+
+    Sources shorter than the requested span are looped.
+
+    Returns:
+        str: ``output`` on success, None on failure
+    """
+    tmp_output = output + ".tmp.mp4"
+    try:
+        run_ffmpeg([
+            "-v", "error",
+            "-stream_loop", "-1",
+            "-ss", f"{offset:.3f}",
+            "-i", source,
+            "-t", f"{duration:.3f}",
+            "-an",
+            "-vf", normalize_filter(width, height, fps, pix_fmt),
+            *INTERMEDIATE_CODEC_ARGS,
+            tmp_output
+        ])
+        os.replace(tmp_output, output)
+        return output
+    except Exception as e:
+        print(f"ERROR normalizing segment from {source}: {str(e)}")
+        if os.path.exists(tmp_output):
+            os.remove(tmp_output)
+        return None
+
+
+def _normalize_job(job):
+    return normalize_segment(**job)
+
+
+def _run_jobs(jobs, workers):
+    """Run normalize_segment jobs, in a process pool when there are several workers."""
+    workers = max(1, min(workers, len(jobs)))
+    if workers == 1:
+        return [_normalize_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers, **current_deadline().pool_options()) as executor:
+        return list(executor.map(_normalize_job, jobs))
+
+
+def prenormalize_segments(segments, output_dir, width=TARGET_WIDTH, height=TARGET_HEIGHT, fps=TARGET_FPS,
+                          pix_fmt=TARGET_PIX_FMT, workers=PRENORMALIZE_WORKERS):
+    """
+    Normalize many segments in parallel.
+
+    Args:
+        segments (list): Dicts with ``source``, ``offset`` and ``duration``
+            keys, and optionally ``source_duration``; short sources with a
+            known duration that are looped or shared are decoded only once
+        output_dir (str): Directory for the normalized clips; clips already
+            present there are reused
+        width, height, fps, pix_fmt: Target format
+        workers (int): Size of the process pool
+
+    Returns:
+        list: Path of each normalized segment (None where it failed), in order;
+            identical segments share a path
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results = [None] * len(segments)
+    # Segments with the same source, offset and duration share one output, so each is normalized once
+    indexes_by_output = {}
+    jobs = []
+    for index, segment in enumerate(segments):
+        output = os.path.join(output_dir, normalized_name(segment["source"], segment["offset"], segment["duration"],
+                                                           width, height, fps, pix_fmt))
+        if os.path.exists(output):
+            results[index] = output
+            continue
+        if output in indexes_by_output:
+            indexes_by_output[output].append(index)
+            continue
+        indexes_by_output[output] = [index]
+        jobs.append((output, {
+            "source": segment["source"],
+            "output": output,
+            "offset": segment["offset"],
+            "duration": segment["duration"],
+            "width": width,
+            "height": height,
+            "fps": fps,
+            "pix_fmt": pix_fmt
+        }))
+
+    if not jobs:
+        return results
+
+    # Short sources that are looped or cut more than once get a base clip
+    source_durations = {segment["source"]: segment.get("source_duration") for segment in segments}
+    source_jobs = {}
+    for _, job in jobs:
+        source_jobs.setdefault(job["source"], []).append(job)
+    base_jobs = []
+    for source, shared in source_jobs.items():
+        source_duration = source_durations.get(source)
+        if not source_duration or source_duration > BASE_CLIP_MAX_SECONDS:
+            continue
+        if len(shared) < 2 and shared[0]["duration"] <= source_duration:
+            continue
+        base = os.path.join(output_dir, normalized_name(source, 0, source_duration, width, height, fps, pix_fmt))
+        base_jobs.append((source, dict(shared[0], output=base, offset=0, duration=source_duration)))
+    pending = [job for _, job in base_jobs if not os.path.exists(job["output"])]
+    if pending:
+        print(f"Normalizing {len(pending)} looped or shared sources once...")
+        _run_jobs(pending, workers)
+    for source, job in base_jobs:
+        # Without a base clip the segments are cut from the source
+        if os.path.exists(job["output"]):
+            for shared in source_jobs[source]:
+                shared["source"] = job["output"]
+    # A segment spanning a whole source is its base clip
+    for path, _ in jobs:
+        if os.path.exists(path):
+            for index in indexes_by_output[path]:
+                results[index] = path
+    jobs = [(path, job) for path, job in jobs if not os.path.exists(path)]
+    if not jobs:
+        return results
+
+    print(f"Normalizing {len(jobs)} segments to {width}x{height}@{fps} with {max(1, min(workers, len(jobs)))} workers...")
+    outputs = _run_jobs([job for _, job in jobs], workers)
+    for (path, _), output in zip(jobs, outputs):
+        for index in indexes_by_output[path]:
+            results[index] = output
+    return results
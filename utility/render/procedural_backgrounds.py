@@ -0,0 +1,136 @@
+"""
+Procedural backgrounds for segments without stock footage.
+
+Segments whose URL is missing, is the "DEFAULT" placeholder from
+use_default_video(), or could not be downloaded get a generated background
+instead of a gap. Frames are computed with NumPy at a tiny resolution and
+upscaled by ffmpeg, which keeps gradients smooth at almost no CPU cost. Each
+clip is a seamless loop, rendered once per style, palette and output format
+and kept in a cache directory, so later renders need neither the network nor
+any rendering for it.
+"""
+
+import os
+import math
+import subprocess
+
+import numpy as np
+from filelock import FileLock
+
+from utility.render.ffmpeg_tools import get_ffmpeg_binary
+from utility.render.prenormalize import INTERMEDIATE_CODEC_ARGS, TARGET_PIX_FMT
+from utility.tracing import span
+
+# Generator settings
+PROCEDURAL_CACHE_DIR = os.environ.get("PROCEDURAL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "text-to-video", "procedural"))
+PROCEDURAL_STYLES = ("solid", "gradient", "animated")
+PROCEDURAL_STYLE = os.environ.get("PROCEDURAL_BACKGROUND", "animated")
+PROCEDURAL_CLIP_SECONDS = 8  # Length of one loop
+PROCEDURAL_RESOLUTION = 64  # Long side of the frames computed in NumPy before upscaling
+PLACEHOLDER_URLS = (None, "DEFAULT")
+
+# Dark (start, end) colour pairs, so white captions stay readable
+PALETTES = [
+    ((18, 32, 64), (72, 42, 112)),
+    ((14, 52, 62), (28, 112, 102)),
+    ((62, 24, 42), (132, 62, 58)),
+    ((26, 26, 32), (72, 72, 88)),
+    ((40, 22, 70), (18, 72, 120))
+]
+
+
+def is_placeholder(video_url):
+    """Whether a background URL stands for "no stock footage"."""
+    return video_url in PLACEHOLDER_URLS
+
+
+def background_frames(style, palette, width, height, frame_count):
+    """
+    Yield the frames of a procedural background at a small resolution.
+
+    The animated style rotates and shifts a two-colour gradient with a period
+    of exactly ``frame_count`` frames, so the clip loops without a seam.
+
+    Yields:
+        numpy.ndarray: (height, width, 3) uint8 frames
+    """
+    start, end = (np.array(color, dtype=np.float32) for color in palette)
+    if style == "solid":
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[:] = ((start + end) / 2).astype(np.uint8)
+        for _ in range(frame_count):
+            yield frame
+        return
+
+    aspect = width / height
+    x, y = np.meshgrid(np.linspace(-aspect / 2, aspect / 2, width, dtype=np.float32),
+                       np.linspace(-0.5, 0.5, height, dtype=np.float32))
+    for index in range(frame_count):
+        phase = 2 * math.pi * index / frame_count if style == "animated" else 0.0
+        angle = math.pi / 4 + phase
+        u = x * math.cos(angle) + y * math.sin(angle)
+        if style == "animated":
+            mix = 0.5 + 0.5 * np.sin(2 * math.pi * 0.8 * u + phase)
+        else:
+            mix = np.clip(u + 0.5, 0, 1)
+        frame = start + (end - start) * mix[..., None]
+        yield frame.astype(np.uint8)
+
+
+def procedural_clip(width, height, fps, style=None, palette_index=0, directory=None):
+    """
+    Path of a cached procedural background loop at the given format,
+    rendering it first if needed.
+
+    Args:
+        width, height, fps: Output format of the clip
+        style (str, optional): One of PROCEDURAL_STYLES; defaults to PROCEDURAL_STYLE
+        palette_index (int): Picks a colour pair from PALETTES (wraps around),
+            so neighbouring segments can differ
+        directory (str, optional): Cache directory; defaults to PROCEDURAL_CACHE_DIR
+
+    Returns:
+        str: Path to the clip, or None if it could not be rendered
+    """
+    style = style or PROCEDURAL_STYLE
+    if style not in PROCEDURAL_STYLES:
+        print(f"WARNING: Unknown procedural background style '{style}', using 'gradient'")
+        style = "gradient"
+    palette_index %= len(PALETTES)
+    directory = directory or PROCEDURAL_CACHE_DIR
+    os.makedirs(directory, exist_ok=True)
+    name = f"{style}_{palette_index}_{width}x{height}_{fps}_{PROCEDURAL_CLIP_SECONDS}s"
+    path = os.path.join(directory, name + ".mp4")
+    if os.path.exists(path):
+        return path
+
+    with FileLock(os.path.join(directory, name + ".lock")):
+        if os.path.exists(path):
+            return path
+        with span("procedural background", category="render", style=style, size=f"{width}x{height}"):
+            scale = PROCEDURAL_RESOLUTION / max(width, height)
+            small_width, small_height = max(2, round(width * scale)), max(2, round(height * scale))
+            frame_count = max(1, int(round(PROCEDURAL_CLIP_SECONDS * fps)))
+            tmp_path = path + ".tmp.mp4"
+            cmd = [get_ffmpeg_binary(), "-hide_banner", "-nostdin", "-y", "-v", "error",
+                   "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{small_width}x{small_height}", "-r", str(fps), "-i", "-",
+                   "-vf", f"scale={width}:{height}:flags=bicubic,setsar=1,format={TARGET_PIX_FMT}",
+                   *INTERMEDIATE_CODEC_ARGS, tmp_path]
+            try:
+                process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                try:
+                    for frame in background_frames(style, PALETTES[palette_index], small_width, small_height, frame_count):
+                        process.stdin.write(frame.tobytes())
+                finally:
+                    process.stdin.close()
+                    stderr = process.stderr.read().decode("utf-8", errors="replace")
+                    process.wait()
+                if process.returncode != 0:
+                    raise RuntimeError(stderr.strip().splitlines()[-1] if stderr.strip() else f"exit code {process.returncode}")
+                os.replace(tmp_path, path)
+                return path
+            except Exception as e:
+                print(f"ERROR rendering procedural background: {str(e)}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return None
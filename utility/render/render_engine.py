@@ -1,15 +1,47 @@
 import time
 import os
+import math
+import shutil
 import tempfile
 import zipfile
 import platform
 import subprocess
-from moviepy.editor import (AudioFileClip, CompositeVideoClip, CompositeAudioClip, ImageClip,
-                            TextClip, VideoFileClip)
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from moviepy.editor import (AudioFileClip, CompositeAudioClip, ImageClip,
+                            TextClip)
 from moviepy.audio.fx.audio_loop import audio_loop
 from moviepy.audio.fx.audio_normalize import audio_normalize
-import requests
+from moviepy.config import change_settings
 import torch
+from utility.video.download_manager import get_download_manager
+from utility.video.clip_cache import ClipCache, get_clip_cache
+from utility.render.ffmpeg_tools import probe_duration
+from utility.render.prenormalize import prenormalize_segments
+from utility.render.render_profiles import (get_render_profile, apply_output_format, format_output_file,
+                                            encoder_args, caption_layout, OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT)
+from utility.render.ffmpeg_backend import render_with_ffmpeg
+from utility.render.parallel_render import RENDER_WORKERS
+from utility.render.decoder_pool import DecoderPool, LazyVideoClip, probe_video, release_behind
+from utility.render.timeline import IndexedCompositeVideoClip
+from utility.render.frame_cache import FrameCache, CachedVideoClip
+from utility.render.procedural_backgrounds import procedural_clip, is_placeholder
+from utility.render.background_track import BackgroundTrackCache, render_incremental, BACKGROUND_TRACK_DIR
+from utility.tracing import span
+from utility.progress import get_progress, moviepy_logger
+from utility.deadline import current_deadline
+
+# Trim, scale and conform background clips with ffmpeg before compositing
+PRENORMALIZE_CLIPS = os.environ.get("PRENORMALIZE_CLIPS", "1") == "1"
+
+# "moviepy" composites frames in Python; "ffmpeg" renders the timeline in one ffmpeg call
+RENDER_BACKENDS = ("moviepy", "ffmpeg")
+RENDER_BACKEND = os.environ.get("RENDER_BACKEND", "moviepy")
+
+# Background track cache for ffmpeg renders (see background_track): "1" builds
+# and reuses tracks (a cold render then encodes the background twice), "auto"
+# only renders through a track an earlier render already built, "0" never does
+INCREMENTAL_RENDER = os.environ.get("INCREMENTAL_RENDER", "auto")
 
 # Check for GPU availability
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
@@ -19,18 +51,8 @@ else:
     print("No GPU detected. Using CPU for video rendering")
 
 def download_file(url, filename):
-    try:
-        with open(filename, 'wb') as f:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            }
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()  # Raise an error for bad status codes
-            f.write(response.content)
-            return True
-    except Exception as e:
-        print(f"ERROR downloading video: {str(e)}")
-        return False
+    """Download a video with the shared streaming download manager."""
+    return get_download_manager().download(url, filename)
 
 def search_program(program_name):
     try: 
@@ -43,91 +65,323 @@ def get_program_path(program_name):
     program_path = search_program(program_name)
     return program_path
 
-def get_output_media(audio_file_path, timed_captions, background_video_data, video_server):
-    OUTPUT_FILE_NAME = "rendered_video.mp4"
-    magick_path = get_program_path("magick")
-    print(f"ImageMagick path: {magick_path}")
-    if magick_path:
-        os.environ['IMAGEMAGICK_BINARY'] = magick_path
-    else:
-        os.environ['IMAGEMAGICK_BINARY'] = '/usr/bin/convert'
-    
+# ImageMagick for moviepy's TextClip, resolved once: the setting is process-wide,
+# so it is not rewritten by each of the jobs a worker runs in threads
+IMAGEMAGICK_BINARY = get_program_path("magick") or "/usr/bin/convert"
+print(f"ImageMagick path: {IMAGEMAGICK_BINARY}")
+change_settings({"IMAGEMAGICK_BINARY": IMAGEMAGICK_BINARY})
+
+def incremental_mode(incremental=None):
+    """INCREMENTAL_RENDER mode ("1", "auto" or "0") for a job's ``incremental`` setting."""
+    if incremental is None:
+        return INCREMENTAL_RENDER
+    if isinstance(incremental, bool):
+        return "1" if incremental else "0"
+    return str(incremental)
+
+def next_source_offset(cursor, source_duration, segment_duration):
+    """
+    Choose where a segment starts inside a source shared by several segments.
+
+    Each use continues from where the previous one stopped so repeated
+    segments show different footage, wrapping to the start once the source
+    runs out.
+    """
+    if cursor + segment_duration > source_duration:
+        return 0
+    return cursor
+
+def fill_frame(clip, width, height):
+    """Scale a clip to cover ``width``x``height`` and centre-crop the overflow."""
+    scale = max(width / clip.w, height / clip.h)
+    clip = clip.resize(newsize=(max(width, math.ceil(clip.w * scale)), max(height, math.ceil(clip.h * scale))))
+    if tuple(clip.size) == (width, height):
+        return clip
+    return clip.crop(x_center=clip.w / 2, y_center=clip.h / 2, width=width, height=height)
+
+def job_clip_cache(cache_dirs=None):
+    """The clip cache in ``cache_dirs["clips"]``, or the process-wide one."""
+    if cache_dirs and cache_dirs.get("clips"):
+        return ClipCache(cache_dirs["clips"])
+    return get_clip_cache()
+
+def job_track_cache(cache_dirs=None):
+    """
+    A background track cache for ``cache_dirs["tracks"]`` (gaps filled from
+    ``cache_dirs["procedural"]``), or None for the process-wide one.
+    """
+    if cache_dirs and (cache_dirs.get("tracks") or cache_dirs.get("procedural")):
+        return BackgroundTrackCache(cache_dirs.get("tracks") or BACKGROUND_TRACK_DIR,
+                                    procedural_dir=cache_dirs.get("procedural"))
+    return None
+
+def get_output_media(audio_file_path, timed_captions, background_video_data, video_server, backend=None,
+                     profile=None, output_file=None, output_format=None, cache_dirs=None, incremental=None):
+    """
+    Render the final video from the narration, captions and background segments.
+
+    Args:
+        audio_file_path (str): Narration audio
+        timed_captions (list): ((t1, t2), text) pairs
+        background_video_data (list): ((t1, t2), video URL) pairs
+        video_server (str): Video provider the URLs come from
+        backend (str, optional): "moviepy" (composite frames in Python) or
+            "ffmpeg" (single filtergraph invocation); defaults to RENDER_BACKEND
+        profile (str or dict, optional): Render profile (see render_profiles);
+            defaults to DEFAULT_RENDER_PROFILE
+        output_file (str, optional): Where to write the video; defaults to the
+            profile's output file
+        output_format (str, optional): Aspect ratio and caption placement (see
+            OUTPUT_FORMATS); defaults to DEFAULT_OUTPUT_FORMAT
+        cache_dirs (dict, optional): Cache directories for this job: "clips",
+            "tracks" and "procedural"; missing entries use the shared caches
+        incremental (bool or str, optional): Background track cache of the
+            ffmpeg backend: True (or "1") builds and reuses tracks, "auto" only
+            reuses tracks already built, False (or "0") never uses the cache;
+            defaults to INCREMENTAL_RENDER
+
+    Returns:
+        str: Path of the rendered video, or None on failure
+    """
+    cache_dirs = cache_dirs or {}
+    incremental = incremental_mode(incremental)
+    try:
+        profile = get_render_profile(profile)
+        if "output_format" not in profile or output_format:
+            profile = apply_output_format(profile, output_format)
+    except ValueError as e:
+        print(f"ERROR: {str(e)}")
+        return None
+    OUTPUT_FILE_NAME = output_file or profile["output_file"]
+    backend = backend or RENDER_BACKEND
+    if backend not in RENDER_BACKENDS:
+        print(f"ERROR: Unknown render backend '{backend}', expected one of {RENDER_BACKENDS}")
+        return None
     visual_clips = []
+    sources = {}  # Downloaded file -> probed size, fps and duration, shared by every segment using it
+    decoder_pool = DecoderPool(profile.get("max_live_decoders"))
+    clip_lease = None
+    frame_cache = None  # Short looped or shared sources, decoded once (moviepy backend, un-normalized segments only)
+    source_cursors = {}  # Downloaded file -> end of the span used by its previous segment
+    normalized_dir = None
     
+    print(f"Using render profile '{profile['name']}' ({profile['output_format']}): "
+          f"{profile['width']}x{profile['height']} @ {profile['fps']} fps, "
+          f"preset {profile['preset']}, CRF {profile['crf']}, {profile['threads']} threads")
     print(f"Processing {len(background_video_data)} background video segments...")
     
-    # Track downloaded files for cleanup
-    downloaded_files = []
-    
     try:
+        # Checked between segments and captions; the encode itself stops through its logger
+        deadline = current_deadline()
+
+        # Fetch each unique video once, up front, through the persistent clip cache;
+        # cache misses are downloaded in parallel, hits skip the network entirely
+        clip_cache = job_clip_cache(cache_dirs)
+        unique_urls = list(dict.fromkeys(video_url for _, video_url in background_video_data if not is_placeholder(video_url)))
+        # Eviction leaves this render's clips alone until it is finished
+        clip_lease = clip_cache.lease(unique_urls)
+        source_files = {}
+        with span("fetch clips", videos=len(unique_urls)):
+            if unique_urls and profile["cached_clips_only"]:
+                # Draft renders never wait on the network
+                for video_url in unique_urls:
+                    path = clip_cache.lookup(video_url)
+                    if path is not None:
+                        source_files[video_url] = path
+                print(f"Using {len(source_files)}/{len(unique_urls)} videos already in the clip cache")
+            elif unique_urls:
+                print(f"Fetching {len(unique_urls)} unique videos for {len(background_video_data)} segments "
+                      f"with {clip_cache.download_manager.workers} parallel workers...")
+                # The counters are process-wide, so this render's share is the difference
+                stats_before = clip_cache.download_manager.stats.as_dict()
+                hits_before, misses_before = clip_cache.hits, clip_cache.misses
+                fetch_start = time.time()
+                for video_url, path in zip(unique_urls, clip_cache.fetch_many(unique_urls)):
+                    if path is not None:
+                        source_files[video_url] = path
+                stats = clip_cache.download_manager.stats.since(stats_before, time.time() - fetch_start)
+                print(f"Clip cache: {clip_cache.hits - hits_before} hits, {clip_cache.misses - misses_before} misses")
+                print(f"Downloaded {stats['bytes'] / (1024 * 1024):.1f} MB in {stats['wall_seconds']:.1f}s "
+                      f"({stats['throughput_bytes_per_second'] / (1024 * 1024):.2f} MB/s)")
+
+        # Plan which span of which source each segment uses. Later uses of a
+        # shared source continue where the previous one stopped.
+        with span("plan segments", segments=len(background_video_data)):
+            segment_sources = {}  # Segment index -> (downloaded file, offset in it)
+            source_durations = {}
+            for index, ((t1, t2), video_url) in enumerate(background_video_data):
+                video_filename = source_files.get(video_url)
+                if video_filename is None:
+                    # No stock footage: generate a background instead of leaving a gap
+                    video_filename = procedural_clip(profile["width"], profile["height"], profile["fps"], palette_index=index,
+                                                     directory=cache_dirs.get("procedural"))
+                    if video_filename is None:
+                        continue
+                    if not is_placeholder(video_url):
+                        print(f"Using a procedural background for segment {t1:.2f}-{t2:.2f} (clip unavailable)")
+                if video_filename not in source_durations:
+                    source_durations[video_filename] = probe_duration(video_filename)
+                source_duration = source_durations[video_filename]
+                if not source_duration or source_duration < (t2 - t1):
+                    segment_sources[index] = (video_filename, 0)
+                    continue
+                offset = next_source_offset(source_cursors.get(video_filename, 0), source_duration, t2 - t1)
+                source_cursors[video_filename] = offset + (t2 - t1)
+                segment_sources[index] = (video_filename, offset)
+
+        if backend == "ffmpeg" and incremental in ("auto", "1"):
+            # Only segments whose clip changed since an earlier render are encoded
+            normalized_dir = tempfile.mkdtemp(prefix="normalized_segments_")
+            build = incremental == "1"
+            with span("incremental render", segments=len(segment_sources)):
+                result = render_incremental(
+                    audio_file_path, timed_captions,
+                    [(background_video_data[index][0], segment_sources[index]) for index in segment_sources],
+                    OUTPUT_FILE_NAME, normalized_dir, profile, workers=min(RENDER_WORKERS, profile["threads"]),
+                    cache=job_track_cache(cache_dirs), build=build)
+            if result is not None:
+                print("Video rendering completed successfully!")
+                return OUTPUT_FILE_NAME
+            if build:
+                print("WARNING: Could not build the background track, rendering without it")
+
+        # Trim, scale and conform every segment with ffmpeg in a process pool
+        normalized_files = {}
+        if (PRENORMALIZE_CLIPS or backend == "ffmpeg") and segment_sources:
+            normalized_dir = normalized_dir or tempfile.mkdtemp(prefix="normalized_segments_")
+            indexes = list(segment_sources)
+            with span("prenormalize", segments=len(indexes)):
+                outputs = prenormalize_segments(
+                    [{"source": segment_sources[index][0],
+                      "offset": segment_sources[index][1],
+                      "duration": background_video_data[index][0][1] - background_video_data[index][0][0],
+                      "source_duration": source_durations.get(segment_sources[index][0])}
+                     for index in indexes],
+                    normalized_dir, width=profile["width"], height=profile["height"], fps=profile["fps"],
+                    workers=profile["threads"])
+            for index, output in zip(indexes, outputs):
+                if output is not None:
+                    normalized_files[index] = output
+            print(f"Normalized {len(normalized_files)}/{len(indexes)} segments")
+
+        font_size, caption_top = caption_layout(profile)
+        if backend == "ffmpeg":
+            if normalized_dir is None:
+                normalized_dir = tempfile.mkdtemp(prefix="normalized_segments_")
+            with span("encode", backend="ffmpeg", output=OUTPUT_FILE_NAME):
+                render_with_ffmpeg(
+                    audio_file_path, timed_captions,
+                    [(background_video_data[index][0], path) for index, path in normalized_files.items()],
+                    OUTPUT_FILE_NAME, os.path.join(normalized_dir, "render"),
+                    width=profile["width"], height=profile["height"], fps=profile["fps"],
+                    caption_top=caption_top, font_size=font_size,
+                    workers=min(RENDER_WORKERS, profile["threads"]), video_codec_args=encoder_args(profile),
+                    threads=profile["threads"], wrap_captions=profile["wrap_captions"],
+                    procedural_dir=cache_dirs.get("procedural"))
+            print("Video rendering completed successfully!")
+            return OUTPUT_FILE_NAME
+
+        frame_cache = FrameCache()
+        source_uses = Counter(video_filename for video_filename, _ in segment_sources.values())
+
         # Process videos in smaller batches to reduce memory usage
         BATCH_SIZE = 5  # Process 5 segments at a time
-        for batch_start in range(0, len(background_video_data), BATCH_SIZE):
-            batch_end = min(batch_start + BATCH_SIZE, len(background_video_data))
-            batch = background_video_data[batch_start:batch_end]
+        with span("build clips", segments=len(background_video_data)):
+            for batch_start in range(0, len(background_video_data), BATCH_SIZE):
+                batch_end = min(batch_start + BATCH_SIZE, len(background_video_data))
+                batch = background_video_data[batch_start:batch_end]
             
-            print(f"\nProcessing batch {batch_start//BATCH_SIZE + 1}/{(len(background_video_data) + BATCH_SIZE - 1)//BATCH_SIZE}")
+                print(f"\nProcessing batch {batch_start//BATCH_SIZE + 1}/{(len(background_video_data) + BATCH_SIZE - 1)//BATCH_SIZE}")
             
-            # Process each segment in the batch
-            for i, ((t1, t2), video_url) in enumerate(batch):
-                try:
-                    print(f"Processing segment {batch_start + i + 1}/{len(background_video_data)}: {t1:.2f}-{t2:.2f}")
-                    
-                    if video_url is None:
-                        print(f"WARNING: No video URL for segment {t1:.2f}-{t2:.2f}, skipping")
-                        continue
+                # Process each segment in the batch
+                for i, ((t1, t2), video_url) in enumerate(batch):
+                    deadline.check("build clips")
+                    try:
+                        print(f"Processing segment {batch_start + i + 1}/{len(background_video_data)}: {t1:.2f}-{t2:.2f}")
+                        get_progress().item("build clips", batch_start + i + 1, len(background_video_data))
                     
-                    # Download the video file
-                    video_filename = tempfile.NamedTemporaryFile(delete=False).name
-                    print(f"Downloading video for segment {t1:.2f}-{t2:.2f}...")
+                        # Use the normalized segment when pre-normalization succeeded
+                        normalized = normalized_files.get(batch_start + i)
+                        if normalized is not None:
+                            try:
+                                video_clip = LazyVideoClip(decoder_pool, normalized, duration=t2 - t1)
+                                decoder_pool.register(normalized, t2)
+                                video_clip = video_clip.set_start(t1)
+                                video_clip = video_clip.set_end(t2)
+                                visual_clips.append(video_clip)
+                                del video_clip
+                                continue
+                            except Exception as e:
+                                print(f"WARNING: Could not open normalized segment {t1:.2f}-{t2:.2f}, using source: {str(e)}")
                     
-                    if not download_file(video_url, video_filename):
-                        print(f"Failed to download video for segment {t1:.2f}-{t2:.2f}, skipping")
-                        continue
-                        
-                    downloaded_files.append(video_filename)
+                        # Use the video downloaded for this segment's URL
+                        if batch_start + i not in segment_sources:
+                            print(f"No background available for segment {t1:.2f}-{t2:.2f}, skipping")
+                            continue
+                        video_filename, offset = segment_sources[batch_start + i]
                     
-                    # Validate video file before processing
-                    if not os.path.exists(video_filename) or os.path.getsize(video_filename) == 0:
-                        print(f"ERROR: Invalid video file for segment {t1:.2f}-{t2:.2f}, skipping")
-                        continue
+                        # Validate video file before processing
+                        if not os.path.exists(video_filename) or os.path.getsize(video_filename) == 0:
+                            print(f"ERROR: Invalid video file for segment {t1:.2f}-{t2:.2f}, skipping")
+                            continue
         
-                    # Create VideoFileClip from the downloaded file
-                    print(f"Creating clip for segment {t1:.2f}-{t2:.2f}...")
-                    try:
-                        video_clip = VideoFileClip(video_filename)
+                        try:
+                            # Probe each source once; its reader is only opened while the timeline plays it
+                            if video_filename not in sources:
+                                print(f"Creating clip for segment {t1:.2f}-{t2:.2f}...")
+                                sources[video_filename] = probe_video(video_filename)
+                            else:
+                                print(f"Reusing clip source for segment {t1:.2f}-{t2:.2f}...")
+                            source = sources[video_filename]
                         
-                        # Validate video clip
-                        if video_clip is None or video_clip.size is None:
-                            print(f"ERROR: Invalid video clip for segment {t1:.2f}-{t2:.2f}, skipping")
-                            continue
+                            # Validate video clip
+                            if not source.get("size") or not source.get("duration"):
+                                print(f"ERROR: Invalid video clip for segment {t1:.2f}-{t2:.2f}, skipping")
+                                continue
                             
-                        # Handle videos that are shorter than needed
-                        if video_clip.duration < (t2 - t1):
-                            print(f"WARNING: Video is shorter than needed segment ({video_clip.duration}s < {t2-t1}s)")
-                            repeat = int((t2 - t1) / video_clip.duration) + 1
-                            video_clip = video_clip.loop(n=repeat)
+                            # Handle videos that are shorter than needed
+                            looped = source["duration"] < (t2 - t1)
+                            if looped:
+                                print(f"WARNING: Video is shorter than needed segment ({source['duration']}s < {t2-t1}s)")
+                            # Loops and shared sources replay decoded frames instead of decoding again
+                            # (only reached with PRENORMALIZE_CLIPS=0 or when normalizing this segment failed)
+                            cached_frames = None
+                            if looped or source_uses[video_filename] > 1:
+                                cached_frames = frame_cache.get(video_filename, source["duration"], profile["width"],
+                                                                profile["height"], profile["fps"])
+                            if cached_frames is not None:
+                                video_clip = CachedVideoClip(cached_frames, offset=0 if looped else offset,
+                                                             duration=t2 - t1, loop=looped)
+                            elif looped:
+                                video_clip = LazyVideoClip(decoder_pool, video_filename, duration=t2 - t1, info=source, loop=True)
+                                decoder_pool.register(video_filename, t2)
+                            else:
+                                video_clip = LazyVideoClip(decoder_pool, video_filename, offset=offset,
+                                                           duration=min(t2 - t1, source["duration"] - offset), info=source)
+                                decoder_pool.register(video_filename, t2)
+                            if tuple(video_clip.size) != (profile["width"], profile["height"]):
+                                video_clip = fill_frame(video_clip, profile["width"], profile["height"])
                         
-                        video_clip = video_clip.set_start(t1)
-                        video_clip = video_clip.set_end(t2)
-                        visual_clips.append(video_clip)
+                            video_clip = video_clip.set_start(t1)
+                            video_clip = video_clip.set_end(t2)
+                            visual_clips.append(video_clip)
     
-                        # Clear memory after each clip
-                        del video_clip
+                            # Clear memory after each clip
+                            del video_clip
                         
+                        except Exception as e:
+                            print(f"ERROR creating video clip for segment {t1:.2f}-{t2:.2f}: {str(e)}")
+                            continue
+                    
                     except Exception as e:
-                        print(f"ERROR creating video clip for segment {t1:.2f}-{t2:.2f}: {str(e)}")
+                        print(f"ERROR processing video segment {t1:.2f}-{t2:.2f}: {str(e)}")
                         continue
-                    
-                except Exception as e:
-                    print(f"ERROR processing video segment {t1:.2f}-{t2:.2f}: {str(e)}")
-                    continue
             
-            # Clear memory after each batch
-            if batch_start + BATCH_SIZE < len(background_video_data):
-                print("Clearing memory after batch...")
-                import gc
-                gc.collect()
+                # Clear memory after each batch
+                if batch_start + BATCH_SIZE < len(background_video_data):
+                    print("Clearing memory after batch...")
+                    import gc
+                    gc.collect()
         
         print("Creating audio track...")
         audio_clips = []
@@ -136,13 +390,21 @@ def get_output_media(audio_file_path, timed_captions, background_video_data, vid
 
         print("Adding captions...")
         for i, ((t1, t2), text) in enumerate(timed_captions):
+            deadline.check("captions")
             try:
                 if i % 10 == 0:  # Print progress every 10 captions
                     print(f"Processing caption {i+1}/{len(timed_captions)}...")
-                text_clip = TextClip(txt=text, fontsize=100, color="white", stroke_width=3, stroke_color="black", method="label")
+                get_progress().item("captions", i + 1, len(timed_captions))
+                with span("caption rasterize", category="caption", index=i):
+                    if profile["wrap_captions"]:
+                        text_clip = TextClip(txt=text, fontsize=font_size, color="white", stroke_width=3,
+                                             stroke_color="black", method="caption", size=(int(profile["width"] * 0.9), None))
+                    else:
+                        text_clip = TextClip(txt=text, fontsize=font_size, color="white",
+                                             stroke_width=3, stroke_color="black", method="label")
                 text_clip = text_clip.set_start(t1)
                 text_clip = text_clip.set_end(t2)
-                text_clip = text_clip.set_position(["center", 800])
+                text_clip = text_clip.set_position(["center", caption_top])
                 visual_clips.append(text_clip)
             except Exception as e:
                 print(f"ERROR processing caption at {t1:.2f}-{t2:.2f}: {str(e)}")
@@ -153,7 +415,9 @@ def get_output_media(audio_file_path, timed_captions, background_video_data, vid
             return None
             
         print("Compositing video clips...")
-        video = CompositeVideoClip(visual_clips)
+        with span("composite", clips=len(visual_clips)):
+            video = IndexedCompositeVideoClip(visual_clips, size=(profile["width"], profile["height"]))
+            video = release_behind(video, decoder_pool)
         
         if audio_clips:
             print("Adding audio to video...")
@@ -165,46 +429,104 @@ def get_output_media(audio_file_path, timed_captions, background_video_data, vid
         print("This may take some time depending on video length and complexity.")
         print("Progress indicators will appear below:")
         
-        # Use GPU acceleration if available
-        try:
-            if torch.cuda.is_available():
-                print("GPU acceleration enabled for video rendering")
-                os.environ['CUDA_VISIBLE_DEVICES'] = '0'
-            else:
-                print("GPU not available, using CPU for rendering")
-        except ImportError:
-            print("PyTorch not available, using CPU for rendering")
-        
         # Optimize rendering settings for Google Colab
-        video.write_videofile(
-            OUTPUT_FILE_NAME, 
-            codec='libx264', 
-            audio_codec='aac', 
-            fps=25, 
-            preset='ultrafast',  # Fastest rendering
-            threads=4,  # Use multiple threads
-            logger=None,  # Use default logger
-            bitrate='2000k',  # Lower bitrate for smaller file size
-            ffmpeg_params=['-max_muxing_queue_size', '1024']  # Prevent queue overflow
-        )
+        with span("encode", backend="moviepy", output=OUTPUT_FILE_NAME):
+            video.write_videofile(
+                OUTPUT_FILE_NAME, 
+                codec='libx264', 
+                audio_codec='aac', 
+                fps=profile["fps"], 
+                preset=profile["preset"],
+                threads=profile["threads"],  # Sized to the available CPUs
+                logger=moviepy_logger("encode", int(video.duration * profile["fps"])),  # Reports encoded frames, silent without a sink
+                ffmpeg_params=['-crf', str(profile["crf"]), '-max_muxing_queue_size', '1024']  # Prevent queue overflow
+            )
         
-        print("Video rendering completed successfully!")
+        print(f"Video rendering completed successfully! ({decoder_pool.opened} decoders opened, "
+              f"at most {decoder_pool.peak_live} live; frame cache {frame_cache.hits} hits, {frame_cache.misses} misses)")
         
     except Exception as e:
         print(f"CRITICAL ERROR during video rendering: {str(e)}")
         return None
     finally:
-        # Clean up downloaded files
-        print("Cleaning up temporary files...")
-        for filename in downloaded_files:
-            try:
-                if os.path.exists(filename):
-                    os.remove(filename)
-            except Exception as e:
-                print(f"Warning: Could not remove temporary file {filename}: {str(e)}")
+        # Release any readers still open, then the clips they read
+        decoder_pool.close_all()
+        if clip_lease is not None:
+            clip_lease.release()
+        if frame_cache is not None:
+            frame_cache.close()
+        if normalized_dir is not None:
+            shutil.rmtree(normalized_dir, ignore_errors=True)
         
         # Clear memory
         import gc
         gc.collect()
 
     return OUTPUT_FILE_NAME
+
+def _render_format_job(job):
+    with span("render", output_format=job["profile"]["output_format"]):
+        return get_output_media(**job)
+
+def render_output_formats(audio_file_path, timed_captions, background_video_data, video_server, output_formats,
+                          backend=None, profile=None, output_file=None, cache_dirs=None, incremental=None):
+    """
+    Render the same video in several output formats at once.
+
+    The narration, captions and background clips are shared: clips are
+    fetched into the clip cache once, then every format is rendered in its
+    own process, with the CPUs split between them.
+
+    Args:
+        output_formats (list): Keys of OUTPUT_FORMATS, e.g. ["landscape", "vertical"]
+        Other arguments are as for get_output_media.
+
+    Returns:
+        dict: Output format -> path of the rendered video (None where it failed)
+    """
+    try:
+        profile = get_render_profile(profile)
+        for output_format in output_formats:
+            if output_format not in OUTPUT_FORMATS:
+                raise ValueError(f"Unknown output format '{output_format}', expected one of {sorted(OUTPUT_FORMATS)}")
+    except ValueError as e:
+        print(f"ERROR: {str(e)}")
+        return {output_format: None for output_format in output_formats}
+    output_formats = list(dict.fromkeys(output_formats))
+
+    workers = len(output_formats)
+    jobs = []
+    for output_format in output_formats:
+        format_profile = apply_output_format(profile, output_format)
+        format_profile["threads"] = max(1, profile["threads"] // workers)
+        if output_file:
+            format_profile["output_file"] = (output_file if output_format == DEFAULT_OUTPUT_FORMAT
+                                             else format_output_file(output_file, output_format))
+        jobs.append({
+            "audio_file_path": audio_file_path,
+            "timed_captions": timed_captions,
+            "background_video_data": background_video_data,
+            "video_server": video_server,
+            "backend": backend,
+            "profile": format_profile,
+            "cache_dirs": cache_dirs,
+            "incremental": incremental
+        })
+
+    # Download every clip once before the formats start competing for it, and
+    # keep the clips from eviction until every format is rendered
+    unique_urls = list(dict.fromkeys(video_url for _, video_url in background_video_data if not is_placeholder(video_url)))
+    clip_cache = job_clip_cache(cache_dirs)
+    with clip_cache.lease(unique_urls):
+        if unique_urls and not profile["cached_clips_only"]:
+            print(f"Fetching {len(unique_urls)} unique videos shared by {len(output_formats)} output formats...")
+            with span("fetch clips", videos=len(unique_urls)):
+                clip_cache.fetch_many(unique_urls)
+
+        print(f"Rendering {len(jobs)} output formats: {', '.join(output_formats)}")
+        if workers == 1:
+            outputs = [_render_format_job(job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, **current_deadline().pool_options()) as executor:
+                outputs = list(executor.map(_render_format_job, jobs))
+    return dict(zip(output_formats, outputs))
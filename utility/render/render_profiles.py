@@ -0,0 +1,173 @@
+"""
+Named render profiles.
+
+A profile fixes the output resolution, frame rate, x264 preset and quality,
+and the number of encoder threads. ``draft`` is meant for reviewing timing:
+it renders small and choppy, and only uses clips that are already in the
+clip cache so it never waits on the network.
+"""
+
+import os
+
+from utility.render.ffmpeg_backend import CAPTION_FONT_SIZE, CAPTION_TOP
+
+RENDER_PROFILES = {
+    "draft": {
+        "width": 640,
+        "height": 360,
+        "fps": 12,
+        "preset": "ultrafast",
+        "crf": 32,
+        "cached_clips_only": True,
+        "output_file": "rendered_video_draft.mp4"
+    },
+    "standard": {
+        "width": 1920,
+        "height": 1080,
+        "fps": 25,
+        "preset": "ultrafast",
+        "crf": 23,
+        "cached_clips_only": False,
+        "output_file": "rendered_video.mp4"
+    },
+    "final": {
+        "width": 1920,
+        "height": 1080,
+        "fps": 30,
+        "preset": "medium",
+        "crf": 18,
+        "cached_clips_only": False,
+        "output_file": "rendered_video_final.mp4"
+    }
+}
+
+DEFAULT_RENDER_PROFILE = os.environ.get("RENDER_PROFILE", "standard")
+
+# Height the caption size and position constants are expressed in
+REFERENCE_HEIGHT = 1080
+
+# Output formats. A profile's resolution describes the landscape format; other
+# formats keep its short side and change the aspect ratio. Background clips are
+# scaled to fill the frame and centre-cropped. ``caption_position`` is the top
+# edge of the captions as a fraction of the frame height.
+OUTPUT_FORMATS = {
+    "landscape": {
+        "aspect": (16, 9),
+        "caption_position": CAPTION_TOP / REFERENCE_HEIGHT,
+        "wrap_captions": False
+    },
+    "vertical": {
+        "aspect": (9, 16),
+        "caption_position": 0.65,  # Clear of the UI overlaid at the bottom of short-form players
+        "wrap_captions": True
+    },
+    "square": {
+        "aspect": (1, 1),
+        "caption_position": 0.72,
+        "wrap_captions": True
+    }
+}
+DEFAULT_OUTPUT_FORMAT = "landscape"
+
+
+def available_cpus():
+    """Number of CPUs this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def get_render_profile(name=None):
+    """
+    Look up a render profile by name.
+
+    Args:
+        name (str or dict, optional): Profile name, or an already resolved
+            profile; defaults to DEFAULT_RENDER_PROFILE
+
+    Returns a copy with ``name`` and ``threads`` (the CPUs available to this
+    process) filled in, so callers may adjust it freely.
+
+    Raises:
+        ValueError: If the profile does not exist
+    """
+    if isinstance(name, dict):
+        return dict(name)
+    name = name or DEFAULT_RENDER_PROFILE
+    if name not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile '{name}', expected one of {sorted(RENDER_PROFILES)}")
+    profile = dict(RENDER_PROFILES[name])
+    profile["name"] = name
+    profile.setdefault("threads", available_cpus())
+    return profile
+
+
+def encoder_args(profile, pix_fmt="yuv420p"):
+    """x264 arguments for ffmpeg that implement a profile's quality settings."""
+    args = ["-c:v", "libx264", "-preset", profile["preset"]]
+    if profile.get("crf") is not None:
+        args += ["-crf", str(profile["crf"])]
+    elif profile.get("bitrate"):
+        args += ["-b:v", profile["bitrate"]]
+    return args + ["-pix_fmt", pix_fmt]
+
+
+def apply_output_format(profile, output_format=None):
+    """
+    Adapt a resolved profile to an output format.
+
+    Args:
+        profile (dict): Resolved render profile
+        output_format (str, optional): Key of OUTPUT_FORMATS; defaults to
+            DEFAULT_OUTPUT_FORMAT
+
+    Returns a copy with the format's resolution, caption placement and
+    ``output_format`` set. Formats other than landscape get the format name
+    appended to the output file name.
+
+    Raises:
+        ValueError: If the format does not exist
+    """
+    output_format = output_format or DEFAULT_OUTPUT_FORMAT
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of {sorted(OUTPUT_FORMATS)}")
+    settings = OUTPUT_FORMATS[output_format]
+    profile = dict(profile)
+    short_side = min(profile["width"], profile["height"])
+    aspect_w, aspect_h = settings["aspect"]
+    if aspect_w >= aspect_h:
+        width, height = short_side * aspect_w / aspect_h, short_side
+    else:
+        width, height = short_side, short_side * aspect_h / aspect_w
+    # x264 needs even dimensions
+    profile["width"] = int(round(width / 2)) * 2
+    profile["height"] = int(round(height / 2)) * 2
+    profile["output_format"] = output_format
+    profile["caption_position"] = settings["caption_position"]
+    profile["wrap_captions"] = settings["wrap_captions"]
+    if output_format != DEFAULT_OUTPUT_FORMAT:
+        profile["output_file"] = format_output_file(profile["output_file"], output_format)
+    return profile
+
+
+def format_output_file(output_file, output_format):
+    """``video.mp4`` -> ``video_vertical.mp4``."""
+    root, ext = os.path.splitext(output_file)
+    return f"{root}_{output_format}{ext or '.mp4'}"
+
+
+def caption_scale(profile):
+    """Factor applied to 1080p caption sizes for a profile's short side."""
+    return min(profile["width"], profile["height"]) / REFERENCE_HEIGHT
+
+
+def caption_layout(profile):
+    """
+    Caption font size and top edge, in output pixels, for a profile.
+
+    Returns:
+        tuple: (font_size, caption_top)
+    """
+    position = profile.get("caption_position", CAPTION_TOP / REFERENCE_HEIGHT)
+    return int(round(CAPTION_FONT_SIZE * caption_scale(profile))), int(round(position * profile["height"]))
@@ -0,0 +1,71 @@
+"""
+Time-indexed compositing for the moviepy backend.
+
+moviepy's ``CompositeVideoClip`` finds the layers to draw for a frame by
+calling ``is_playing`` on every clip, which costs O(clips) Python work per
+frame. ``TimelineIndex`` sorts every clip start and end once and stores, for
+each interval between consecutive boundaries, the clips playing during it,
+so a frame only needs a binary search. ``IndexedCompositeVideoClip`` is a
+drop-in ``CompositeVideoClip`` that uses it.
+"""
+
+from bisect import bisect_right
+from collections import defaultdict
+
+from moviepy.video.compositing.CompositeVideoClip import CompositeVideoClip
+
+
+class TimelineIndex:
+    """
+    Clips playing at any time, looked up in O(log n).
+
+    Args:
+        clips (list): Clips with ``start`` and ``end`` set (``end`` may be None
+            for clips that never stop); list order is the layer order
+    """
+
+    def __init__(self, clips):
+        self.clips = list(clips)
+        starts = defaultdict(list)
+        ends = defaultdict(list)
+        for index, clip in enumerate(self.clips):
+            starts[clip.start].append(index)
+            if clip.end is not None:
+                ends[clip.end].append(index)
+
+        self.boundaries = sorted(set(starts) | set(ends))
+        self.layers = []  # Clips playing from boundaries[i] until boundaries[i + 1]
+        active = set()
+        for boundary in self.boundaries:
+            # Starts before ends so zero-length clips are never active, matching is_playing
+            active.update(starts.get(boundary, ()))
+            active.difference_update(ends.get(boundary, ()))
+            self.layers.append(tuple(self.clips[index] for index in sorted(active)))
+
+    def playing(self, t):
+        """Clips playing at time ``t``, bottom layer first."""
+        position = bisect_right(self.boundaries, t) - 1
+        if position < 0:
+            return ()
+        return self.layers[position]
+
+    def __len__(self):
+        return len(self.boundaries)
+
+
+class IndexedCompositeVideoClip(CompositeVideoClip):
+    """
+    CompositeVideoClip that finds the layers of each frame with a TimelineIndex.
+
+    Takes the same arguments as CompositeVideoClip. The clips must not be
+    re-timed after the composite is built.
+    """
+
+    def __init__(self, clips, *args, **kwargs):
+        CompositeVideoClip.__init__(self, clips, *args, **kwargs)
+        self.timeline = TimelineIndex(self.clips)
+        if isinstance(self.mask, CompositeVideoClip):
+            self.mask.playing_clips = TimelineIndex(self.mask.clips).playing
+
+    def playing_clips(self, t=0):
+        return self.timeline.playing(t)
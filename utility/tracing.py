@@ -0,0 +1,224 @@
+"""
+Span tracing for pipeline stages.
+
+Stages and their sub-steps are wrapped in ``span(name, ...)`` blocks. While
+tracing is off (the default) and no listener is registered, a span costs two
+attribute checks. Once
+``start_tracing()`` has been called, every span records its start, duration,
+process, thread and arguments. The trace can be saved as Chrome trace-event
+JSON (open it in chrome://tracing or https://ui.perfetto.dev) and summarised
+as a per-step table.
+
+Work done in process pools is traced too. Pools started with
+``Deadline.pool_options()`` hand their workers the spool directory, the
+workers append their spans there, and ``save_trace`` merges them into the
+parent's trace. Nothing is passed through the environment, so jobs running
+as threads of one process do not share tracing state through it.
+"""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import functools
+from contextlib import contextmanager
+
+
+class Tracer:
+    """
+    Collects spans for one job.
+
+    Args:
+        spool_dir (str, optional): Directory shared with worker processes;
+            spans recorded outside the owning process are appended there
+    """
+
+    def __init__(self, spool_dir=None):
+        self.enabled = spool_dir is not None
+        self.spool_dir = spool_dir
+        # Owning process; a tracer created with a spool belongs to a worker
+        self.pid = None if spool_dir is not None else os.getpid()
+        self.origin = time.time()
+        self.spans = []
+        self.listeners = []  # Objects with span_started(name, category) and span_finished(name, category, ok)
+        self._lock = threading.Lock()
+
+    def start(self, spool_dir):
+        """Start recording; ``spool_dir`` receives spans from worker processes."""
+        os.makedirs(spool_dir, exist_ok=True)
+        self.spool_dir = spool_dir
+        self.pid = os.getpid()
+        self.origin = time.time()
+        self.spans = []
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+
+    def worker_spool(self):
+        """Spool directory to hand to worker processes, or None while tracing is off."""
+        return self.spool_dir if self.enabled else None
+
+    def enter_worker(self, spool_dir):
+        """Record this worker process's spans into the parent's ``spool_dir``."""
+        self.spool_dir = spool_dir
+        self.pid = None
+        self.enabled = True
+
+    @contextmanager
+    def span(self, name, category="stage", **args):
+        """Record the enclosed block as a span; ``args`` are attached to it."""
+        if not self.enabled and not self.listeners:
+            yield args
+            return
+        listeners = list(self.listeners)
+        for listener in listeners:
+            listener.span_started(name, category)
+        start = time.time()
+        ok = False
+        try:
+            yield args
+            ok = True
+        finally:
+            duration = time.time() - start
+            for listener in listeners:
+                listener.span_finished(name, category, ok)
+            if self.enabled:
+                self.record(name, category, start, duration, args)
+
+    def record(self, name, category, start, duration, args=None):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": int(start * 1e6),
+            "dur": int(duration * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+            "args": {key: _jsonable(value) for key, value in (args or {}).items()}
+        }
+        if os.getpid() == self.pid:
+            with self._lock:
+                self.spans.append(event)
+            return
+        # Forked or spawned worker: hand the span to the parent through the spool
+        try:
+            with open(os.path.join(self.spool_dir, f"spans.{os.getpid()}.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(event) + "\n")
+        except OSError:
+            pass
+
+    def all_spans(self):
+        """Spans of this process plus those spooled by workers, in start order."""
+        with self._lock:
+            spans = list(self.spans)
+        if self.spool_dir and os.path.isdir(self.spool_dir):
+            for name in os.listdir(self.spool_dir):
+                if not name.endswith(".jsonl"):
+                    continue
+                with open(os.path.join(self.spool_dir, name), "r", encoding="utf-8") as f:
+                    spans.extend(json.loads(line) for line in f if line.strip())
+        return sorted(spans, key=lambda span: span["ts"])
+
+    def chrome_trace(self):
+        """The trace as a Chrome trace-event document."""
+        spans = self.all_spans()
+        origin = int(self.origin * 1e6)
+        events = [dict(span, ts=span["ts"] - origin) for span in spans]
+        for pid in sorted({span["pid"] for span in spans}):
+            label = "main" if pid == self.pid else f"worker {pid}"
+            events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": label}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def summary(self):
+        """
+        Per-span-name totals.
+
+        Returns:
+            list: Dicts with name, category, count, total, mean and max
+            seconds, sorted by total time
+        """
+        rows = {}
+        for span in self.all_spans():
+            row = rows.setdefault(span["name"], {"name": span["name"], "category": span["cat"],
+                                                 "count": 0, "total": 0.0, "max": 0.0})
+            seconds = span["dur"] / 1e6
+            row["count"] += 1
+            row["total"] += seconds
+            row["max"] = max(row["max"], seconds)
+        for row in rows.values():
+            row["mean"] = row["total"] / row["count"]
+        return sorted(rows.values(), key=lambda row: row["total"], reverse=True)
+
+
+def _jsonable(value):
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+_TRACER = Tracer()
+
+
+def get_tracer():
+    """Return the process-wide tracer."""
+    return _TRACER
+
+
+def span(name, category="stage", **args):
+    """Record a span on the process-wide tracer (a no-op while tracing is off)."""
+    return _TRACER.span(name, category, **args)
+
+
+def traced(name=None, category="stage"):
+    """Decorator recording every call of a function as a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _TRACER.span(name or func.__name__, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_span_listener(listener):
+    """Notify ``listener`` of every span this process starts and finishes, even while tracing is off."""
+    _TRACER.listeners.append(listener)
+
+
+def remove_span_listener(listener):
+    if listener in _TRACER.listeners:
+        _TRACER.listeners.remove(listener)
+
+
+def start_tracing(spool_dir=None):
+    """Start recording spans for this process and the workers it starts."""
+    _TRACER.start(spool_dir or tempfile.mkdtemp(prefix="trace_spool_"))
+    return _TRACER
+
+
+def format_trace_summary(rows=None, wall_seconds=None):
+    """Format ``Tracer.summary()`` rows as a text table."""
+    rows = _TRACER.summary() if rows is None else rows
+    if wall_seconds is None:
+        spans = _TRACER.all_spans()
+        wall_seconds = (max((s["ts"] + s["dur"] for s in spans), default=0) - min((s["ts"] for s in spans), default=0)) / 1e6
+    lines = [f"{'step':<28} {'category':<10} {'count':>6} {'total s':>9} {'mean s':>8} {'max s':>8} {'% wall':>7}"]
+    for row in rows:
+        share = 100 * row["total"] / wall_seconds if wall_seconds else 0
+        lines.append(f"{row['name'][:28]:<28} {row['category'][:10]:<10} {row['count']:>6} {row['total']:>9.2f} "
+                     f"{row['mean']:>8.3f} {row['max']:>8.3f} {share:>6.1f}%")
+    return "\n".join(lines)
+
+
+def save_trace(path):
+    """Write the Chrome trace-event JSON and stop tracing; spooled worker spans are merged in."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(_TRACER.chrome_trace(), f)
+    spool_dir = _TRACER.spool_dir
+    _TRACER.stop()
+    if spool_dir:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    return path
@@ -1,6 +1,10 @@
 import os
 from datetime import datetime
 import json
+import time
+import queue
+import atexit
+import threading
 
 # Log types
 LOG_TYPE_GPT = "GPT"
@@ -10,25 +14,213 @@ LOG_TYPE_PEXEL = "PEXEL"
 DIRECTORY_LOG_GPT = ".logs/gpt_logs"
 DIRECTORY_LOG_PEXEL = ".logs/pexel_logs"
 
+# Rotation and buffering settings for the JSONL response logs
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024))  # Rotate after 10 MB
+LOG_ROTATE_SECONDS = int(os.environ.get("LOG_ROTATE_SECONDS", 24 * 60 * 60))  # Rotate daily, 0 disables
+LOG_QUEUE_SIZE = 1000  # Pending entries before callers are made to wait
+LOG_COMPACT = os.environ.get("LOG_COMPACT", "0") == "1"  # Keep only compact payloads
+
+# Fields kept from each Pexels video / video file when compacting
+COMPACT_VIDEO_FIELDS = ("id", "width", "height", "duration", "url")
+COMPACT_FILE_FIELDS = ("id", "quality", "file_type", "width", "height", "fps", "link")
+COMPACT_MAX_TEXT = 2000
+
+_LOG_SETTINGS = {
+    LOG_TYPE_GPT: (DIRECTORY_LOG_GPT, "gpt3"),
+    LOG_TYPE_PEXEL: (DIRECTORY_LOG_PEXEL, "pexel"),
+}
+
+
+def compact_payload(response):
+    """
+    Reduce a logged response to the fields needed for debugging searches.
+
+    Pexels search results keep the video ids, sizes and file links; any other
+    payload is kept as is, with long strings truncated.
+    """
+    if isinstance(response, dict) and isinstance(response.get("videos"), list):
+        videos = []
+        for video in response["videos"]:
+            compact_video = {key: video.get(key) for key in COMPACT_VIDEO_FIELDS if key in video}
+            compact_video["video_files"] = [
+                {key: file.get(key) for key in COMPACT_FILE_FIELDS if key in file}
+                for file in video.get("video_files", [])
+            ]
+            videos.append(compact_video)
+        compact = {key: value for key, value in response.items() if key not in ("videos", "url")}
+        compact["videos"] = videos
+        return compact
+    if isinstance(response, str) and len(response) > COMPACT_MAX_TEXT:
+        return response[:COMPACT_MAX_TEXT] + "..."
+    return response
+
+
+class ResponseLogger:
+    """
+    Append-only JSONL logger with a background writer thread.
+
+    Entries are queued by the caller and written by a single thread that keeps
+    the log file open, so logging never blocks on disk I/O unless the bounded
+    queue is full. The active file is rotated once it exceeds ``max_bytes`` or
+    is older than ``rotate_seconds``.
+    """
+
+    def __init__(self, directory, basename, max_bytes=LOG_MAX_BYTES,
+                 rotate_seconds=LOG_ROTATE_SECONDS, queue_size=LOG_QUEUE_SIZE, compact=LOG_COMPACT):
+        self.directory = directory
+        self.basename = basename
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compact = compact
+        self.path = os.path.join(directory, f"{basename}.jsonl")
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._file = None
+        self._opened_at = 0.0
+
+    def log(self, query, response):
+        """Queue a response for writing. Blocks only while the queue is full."""
+        entry = {
+            "query": query,
+            "response": compact_payload(response) if self.compact else response,
+            "timestamp": datetime.now().isoformat()
+        }
+        self._ensure_started()
+        self._queue.put(entry)
+
+    def flush(self):
+        """Wait until every queued entry has been written to disk."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Flush pending entries and stop the writer thread."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"log-writer-{self.basename}", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                entry = self._queue.get()
+                if entry is None:
+                    self._queue.task_done()
+                    break
+                self._write_entry(entry)
+                # Drain whatever else is pending before flushing once
+                stop = False
+                while not stop:
+                    try:
+                        pending = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if pending is None:
+                        self._queue.task_done()
+                        stop = True
+                    else:
+                        self._write_entry(pending)
+                try:
+                    if self._file is not None:
+                        self._file.flush()
+                except Exception as e:
+                    print(f"Warning: Could not write response log {self.path}: {str(e)}")
+                if stop:
+                    break
+        finally:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write_entry(self, entry):
+        # Every entry is marked done, written or not, so flush() never waits on a failed write
+        try:
+            self._write(entry)
+        except Exception as e:
+            print(f"Warning: Could not write response log {self.path}: {str(e)}")
+        finally:
+            self._queue.task_done()
+
+    def _write(self, entry):
+        if self._file is None:
+            self._open()
+        elif self._should_rotate():
+            self._rotate()
+        self._file.write(json.dumps(entry, default=str) + '\n')
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        if not self._opened_at:
+            self._opened_at = time.time()
+
+    def _should_rotate(self):
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        if self.rotate_seconds and time.time() - self._opened_at >= self.rotate_seconds:
+            return self._file.tell() > 0
+        return False
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        rotated = os.path.join(self.directory, f"{self.basename}.{stamp}.jsonl")
+        counter = 1
+        while os.path.exists(rotated):
+            rotated = os.path.join(self.directory, f"{self.basename}.{stamp}_{counter}.jsonl")
+            counter += 1
+        os.replace(self.path, rotated)
+        self._opened_at = 0.0
+        self._open()
+
+
+_LOGGERS = {}
+_LOGGERS_LOCK = threading.Lock()
+
+
+def get_response_logger(log_type):
+    """Return the shared logger for a log type, creating it on first use."""
+    logger = _LOGGERS.get(log_type)
+    if logger is None:
+        with _LOGGERS_LOCK:
+            logger = _LOGGERS.get(log_type)
+            if logger is None:
+                directory, basename = _LOG_SETTINGS[log_type]
+                logger = ResponseLogger(directory, basename)
+                _LOGGERS[log_type] = logger
+    return logger
+
+
+def flush_response_logs():
+    """Block until all queued response log entries are on disk."""
+    for logger in list(_LOGGERS.values()):
+        logger.flush()
+
+
+def close_response_logs():
+    """Flush and stop every response logger."""
+    for logger in list(_LOGGERS.values()):
+        logger.close()
+
+
+atexit.register(close_response_logs)
+
+
 # method to log response from pexel and openai
-def log_response(log_type, query,response):
-    log_entry = {
-        "query": query,
-        "response": response,
-        "timestamp": datetime.now().isoformat()
-    }
-    if log_type == LOG_TYPE_GPT:
-        if not os.path.exists(DIRECTORY_LOG_GPT):
-            os.makedirs(DIRECTORY_LOG_GPT)
-        filename = '{}_gpt3.txt'.format(datetime.now().strftime("%Y%m%d_%H%M%S"))
-        filepath = os.path.join(DIRECTORY_LOG_GPT, filename)
-        with open(filepath, "w") as outfile:
-            outfile.write(json.dumps(log_entry) + '\n')
-
-    if log_type == LOG_TYPE_PEXEL:
-        if not os.path.exists(DIRECTORY_LOG_PEXEL):
-            os.makedirs(DIRECTORY_LOG_PEXEL)
-        filename = '{}_pexel.txt'.format(datetime.now().strftime("%Y%m%d_%H%M%S"))
-        filepath = os.path.join(DIRECTORY_LOG_PEXEL, filename)
-        with open(filepath, "w") as outfile:
-            outfile.write(json.dumps(log_entry) + '\n')
+def log_response(log_type, query, response):
+    if log_type not in _LOG_SETTINGS:
+        return
+    get_response_logger(log_type).log(query, response)
@@ -4,12 +4,19 @@ import random
 import time
 import json
 from utility.utils import log_response, LOG_TYPE_PEXEL
+from utility.video.download_manager import get_download_manager
+from utility.video.search_cache import search_query, get_cached_search, put_cached_search
+from utility.tracing import span
+from utility.progress import get_progress
+from utility.deadline import current_deadline
 import numpy as np
 import soundfile as sf
 import librosa
 
 # Check for Pexels API key
 PEXELS_API_KEY = os.environ.get('PEXELS_KEY')
+# Base URL of the Pexels API; benchmarks point this at a local stand-in
+PEXELS_API_URL = os.environ.get('PEXELS_API_URL', 'https://api.pexels.com').rstrip('/')
 if not PEXELS_API_KEY:
     print("WARNING: No Pexels API key found in environment variables (PEXELS_KEY)")
     print("Video search functionality will be limited")
@@ -74,7 +81,7 @@ def search_videos(query_string, orientation_landscape=True):
     # Add quality indicators
     query_string = f"{query_string} 4k hd"
    
-    url = "https://api.pexels.com/videos/search"
+    url = f"{PEXELS_API_URL}/videos/search"
     headers = {
         "Authorization": PEXELS_API_KEY,
         "User-Agent": "Mozilla/5.0",
@@ -142,7 +149,7 @@ def getBestVideo(query_string, orientation_landscape=True, used_vids=[], attempt
     """Get the best video for a search term with improved search quality."""
     try:
         # Search for videos
-    vids = search_videos(query_string, orientation_landscape)
+        vids = search_videos(query_string, orientation_landscape)
         
         # Verify videos exist in the response
         if 'videos' not in vids or not vids['videos']:
@@ -210,22 +217,43 @@ def use_default_video():
     Create a text-only background if no videos are available at all.
     This is a last resort when even fallbacks fail.
     """
-    # For now, return None but in the future could generate a solid color or pattern
+    # The renderer draws a procedural background for "DEFAULT" segments
     print("CRITICAL: All video searches failed. Using default background.")
     return "DEFAULT"
 
 
-def generate_video_url(search_terms, video_server):
-    """Generate video URLs for each search term using Pexels API."""
+def generate_video_url(search_terms, video_server, api_key=None, api_url=None, search_cache_dir=None):
+    """
+    Generate video URLs for each search term using Pexels API.
+    
+    Args:
+        search_terms (list): ((t1, t2), keywords) pairs
+        video_server (str): Video provider; only "pexel" is supported
+        api_key (str, optional): Pexels API key; defaults to the PEXELS_KEY environment variable
+        api_url (str, optional): Pexels API base URL; defaults to PEXELS_API_URL
+        search_cache_dir (str, optional): Search cache directory; defaults to SEARCH_CACHE_DIR
+        
+    Request timeouts and retries are bounded by the job's deadline (see
+    utility.deadline); once it has passed, the segments not searched yet get
+    no video, so they are rendered with a procedural background.
+        
+    Returns:
+        list: ((t1, t2), video URL or None) pairs, or None without a usable provider
+    """
     if video_server != "pexel":
         return None
+    api_url = (api_url or PEXELS_API_URL).rstrip('/')
+    deadline = current_deadline()
     
     # Check for Pexels API key
-    pexels_key = os.getenv('PEXELS_KEY')
+    pexels_key = api_key or os.getenv('PEXELS_KEY')
     if not pexels_key:
         print("WARNING: PEXELS_KEY environment variable not set. Video search may fail.")
         return None
     
+    # Keyword lists from getVideoSearchQueriesTimed become query strings
+    search_terms = [((t1, t2), search_query(term)) for (t1, t2), term in search_terms]
+    
     # Initialize cache
     video_cache = {}
     successful_videos = {}  # Track successful video matches
@@ -233,13 +261,23 @@ def generate_video_url(search_terms, video_server):
     # First pass: Try to find videos for each term
     print("\nFirst pass: Searching for videos...")
     direct_matches = 0
+    skipped_searches = 0
     total_segments = len(search_terms)
     
     for i, ((t1, t2), term) in enumerate(search_terms):
+        get_progress().item("background search", i + 1, total_segments, term)
         try:
             # Skip if we already have a successful video for this term
             if term in successful_videos:
                 continue
+            
+            # Reuse the clip chosen for this query in an earlier run
+            cached_url = get_cached_search(term, video_server, directory=search_cache_dir)
+            if cached_url:
+                print(f"Using cached search result for '{term}'")
+                successful_videos[term] = cached_url
+                direct_matches += 1
+                continue
                 
             # Check cache first
             if term in video_cache:
@@ -247,127 +285,119 @@ def generate_video_url(search_terms, video_server):
                 videos = video_cache[term]
             else:
                 # Add delay between API calls to avoid rate limits
-                time.sleep(0.5)  # 500ms delay between requests
+                if not deadline.sleep(0.5):  # 500ms delay between requests
+                    # Out of time: leave the segment to the second pass or a procedural background
+                    skipped_searches += 1
+                    continue
                 
                 # Make API request with retries
                 max_retries = 3
                 retry_delay = 2  # seconds
                 
-                for attempt in range(max_retries):
-                    try:
-                        headers = {
-                            "Authorization": pexels_key,
-                            "Accept": "application/json"
-                        }
-                        response = requests.get(
-                            f"https://api.pexels.com/videos/search?query={term}&per_page=15",
-                            headers=headers,
-                            timeout=10
-                        )
+                with span("video search", category="api", query=term):
+                    for attempt in range(max_retries):
+                        try:
+                            headers = {
+                                "Authorization": pexels_key,
+                                "Accept": "application/json"
+                            }
+                            response = requests.get(
+                                f"{api_url}/videos/search?query={term}&per_page=15",
+                                headers=headers,
+                                timeout=deadline.timeout(10)
+                            )
                         
-                        if response.status_code == 429:  # Rate limit
-                            if attempt < max_retries - 1:
-                                print(f"Rate limit hit for '{term}', retrying in {retry_delay} seconds...")
-                                time.sleep(retry_delay)
-                                retry_delay *= 2  # Exponential backoff
-                                continue
-                            else:
-                                print(f"Rate limit exceeded for '{term}' after {max_retries} attempts")
-                                break
+                            if response.status_code == 429:  # Rate limit
+                                if attempt < max_retries - 1 and deadline.allows(retry_delay):
+                                    print(f"Rate limit hit for '{term}', retrying in {retry_delay} seconds...")
+                                    if not deadline.sleep(retry_delay):
+                                        break
+                                    retry_delay *= 2  # Exponential backoff
+                                    continue
+                                else:
+                                    print(f"Rate limit exceeded for '{term}' after {attempt + 1} attempts")
+                                    break
                                 
-                        response.raise_for_status()
-                        data = response.json()
+                            response.raise_for_status()
+                            data = response.json()
                         
-                        if not data.get('videos'):
-                            print(f"No videos found for '{term}'")
-                            break
+                            if not data.get('videos'):
+                                print(f"No videos found for '{term}'")
+                                break
                             
-                        videos = data['videos']
-                        video_cache[term] = videos
+                            videos = data['videos']
+                            video_cache[term] = videos
                         
-                        # Print available resolutions for debugging
-                        resolutions = {}
-                        for video in videos:
-                            for file in video.get('video_files', []):
-                                res = f"{file.get('width', '?')}x{file.get('height', '?')}"
-                                resolutions[res] = resolutions.get(res, 0) + 1
-                        print(f"Found {len(videos)} videos for '{term}'")
-                        print(f"Available resolutions for '{term}': {resolutions}")
+                            # Print available resolutions for debugging
+                            resolutions = {}
+                            for video in videos:
+                                for file in video.get('video_files', []):
+                                    res = f"{file.get('width', '?')}x{file.get('height', '?')}"
+                                    resolutions[res] = resolutions.get(res, 0) + 1
+                            print(f"Found {len(videos)} videos for '{term}'")
+                            print(f"Available resolutions for '{term}': {resolutions}")
                         
-                        # Try to find a suitable video
-                        video_url = None
-                        for video in videos:
-                            for file in video.get('video_files', []):
-                                # First try exact 1920x1080 match
-                                if file.get('width') == 1920 and file.get('height') == 1080:
-                                    video_url = file.get('link')
-                                    break
-                            if video_url:
-                                break
-                                
-                        # If no exact match, try flexible resolution
-                        if not video_url:
+                            # Try to find a suitable video
+                            video_url = None
                             for video in videos:
                                 for file in video.get('video_files', []):
-                                    width = file.get('width', 0)
-                                    height = file.get('height', 0)
-                                    if width >= 1280 and height >= 720:
+                                    # First try exact 1920x1080 match
+                                    if file.get('width') == 1920 and file.get('height') == 1080:
                                         video_url = file.get('link')
                                         break
                                 if video_url:
                                     break
+                                
+                            # If no exact match, try flexible resolution
+                            if not video_url:
+                                for video in videos:
+                                    for file in video.get('video_files', []):
+                                        width = file.get('width', 0)
+                                        height = file.get('height', 0)
+                                        if width >= 1280 and height >= 720:
+                                            video_url = file.get('link')
+                                            break
+                                    if video_url:
+                                        break
                                     
-                        # If still no match, use highest quality available
-                        if not video_url and videos:
-                            best_quality = max(
-                                videos[0].get('video_files', []),
-                                key=lambda x: (x.get('width', 0) * x.get('height', 0))
-                            )
-                            video_url = best_quality.get('link')
+                            # If still no match, use highest quality available
+                            if not video_url and videos:
+                                best_quality = max(
+                                    videos[0].get('video_files', []),
+                                    key=lambda x: (x.get('width', 0) * x.get('height', 0))
+                                )
+                                video_url = best_quality.get('link')
                         
-                        if video_url:
-                            successful_videos[term] = video_url
-                            direct_matches += 1
-                            break
+                            if video_url:
+                                successful_videos[term] = video_url
+                                put_cached_search(term, video_url, video_server, directory=search_cache_dir)
+                                direct_matches += 1
+                                break
                             
-                    except requests.exceptions.RequestException as e:
-                        if attempt < max_retries - 1:
-                            print(f"Request failed for '{term}', retrying in {retry_delay} seconds...")
-                            time.sleep(retry_delay)
-                            retry_delay *= 2
-                            continue
-                        else:
-                            print(f"Failed to fetch videos for '{term}': {str(e)}")
-                        break
+                        except requests.exceptions.RequestException as e:
+                            if attempt < max_retries - 1 and deadline.allows(retry_delay):
+                                print(f"Request failed for '{term}', retrying in {retry_delay} seconds...")
+                                if not deadline.sleep(retry_delay):
+                                    break
+                                retry_delay *= 2
+                                continue
+                            else:
+                                print(f"Failed to fetch videos for '{term}': {str(e)}")
+                            break
                             
         except Exception as e:
             print(f"Error processing term '{term}': {str(e)}")
             continue
     
+    if skipped_searches:
+        print(f"\nDeadline reached: skipped the search for {skipped_searches} segments")
+
     # Report direct match statistics
     print(f"\nFound direct video matches for {direct_matches}/{total_segments} segments ({direct_matches/total_segments*100:.1f}%)")
     
     # Second pass: Reuse successful videos for segments without matches
     print("\nSecond pass: Reusing successful videos...")
-    reuse_count = 0
-    
-    for i, ((t1, t2), term) in enumerate(search_terms):
-        if term not in successful_videos:
-            # Find the most similar successful term
-            best_match = None
-            best_similarity = 0
-            
-            for successful_term in successful_videos:
-                similarity = len(set(term.split()) & set(successful_term.split())) / len(set(term.split()) | set(successful_term.split()))
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    best_match = successful_term
-            
-            if best_match and best_similarity > 0.3:  # Only reuse if there's significant similarity
-                successful_videos[term] = successful_videos[best_match]
-                reuse_count += 1
-                print(f"Reusing existing video for segment {t1:.2f}-{t2:.2f}")
-    
+    reuse_count = reuse_similar_videos(search_terms, successful_videos)
     print(f"\nReused videos for {reuse_count}/{total_segments} segments")
     
     # Create final video URL list
@@ -382,6 +412,60 @@ def generate_video_url(search_terms, video_server):
     return video_urls
 
 
+def reuse_similar_videos(search_terms, successful_videos, min_similarity=0.3):
+    """
+    Give segments without a video of their own the video of the most similar
+    successful query (Jaccard similarity of their words). Segments that reuse
+    a video this way can in turn be matched by later segments.
+    
+    Args:
+        search_terms (list): ((t1, t2), query) pairs in timeline order
+        successful_videos (dict): Query -> video URL; updated in place
+        min_similarity (float): Only reuse when the similarity is above this
+        
+    Returns:
+        int: Number of segments that reused a video
+    """
+    # Only queries sharing a word can be similar, so candidates come from a
+    # word index instead of a comparison with every successful query
+    rank = {}  # query -> insertion order, so ties go to the earliest query
+    query_words = {}
+    queries_by_word = {}
+    
+    def index_query(query):
+        rank[query] = len(rank)
+        query_words[query] = set(query.split())
+        for word in query_words[query]:
+            queries_by_word.setdefault(word, []).append(query)
+    
+    for query in successful_videos:
+        index_query(query)
+    
+    reuse_count = 0
+    for (t1, t2), term in search_terms:
+        if term in successful_videos:
+            continue
+        words = set(term.split())
+        candidates = {query for word in words for query in queries_by_word.get(word, ())}
+        
+        # Find the most similar successful term
+        best_match = None
+        best_similarity = 0
+        for candidate in sorted(candidates, key=rank.get):
+            similarity = len(words & query_words[candidate]) / len(words | query_words[candidate])
+            if similarity > best_similarity:
+                best_similarity = similarity
+                best_match = candidate
+        
+        if best_match and best_similarity > min_similarity:  # Only reuse if there's significant similarity
+            successful_videos[term] = successful_videos[best_match]
+            index_query(term)
+            reuse_count += 1
+            print(f"Reusing existing video for segment {t1:.2f}-{t2:.2f}")
+    
+    return reuse_count
+
+
 def merge_empty_intervals(video_urls):
     """
     Merge empty intervals in the video URLs list by reusing the last non-empty video URL.
@@ -411,18 +495,8 @@ def merge_empty_intervals(video_urls):
 
 
 def download_file(url, filename):
-    try:
-        with open(filename, 'wb') as f:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-            }
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()  # Raise an error for bad status codes
-            f.write(response.content)
-            return True
-    except Exception as e:
-        print(f"ERROR downloading video: {str(e)}")
-        return False
+    """Download a video with the shared streaming download manager."""
+    return get_download_manager().download(url, filename)
 
 
 def preprocess_audio(audio_filename):
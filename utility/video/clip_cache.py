@@ -0,0 +1,367 @@
+"""
+Persistent on-disk cache for downloaded stock video clips.
+
+Clips are stored under a key derived from their normalized URL, published
+atomically, checked for integrity on lookup and evicted least-recently-used
+first once the cache grows past its byte cap. File locks make the cache safe
+to share between several worker processes, and a render leases the clips it
+uses (``lease``) so no process evicts them until the render is done.
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from filelock import FileLock, Timeout
+
+from utility.video.download_manager import get_download_manager, PARTIAL_SUFFIX
+from utility.tracing import span
+
+# Cache settings
+CLIP_CACHE_DIR = os.environ.get("CLIP_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "text-to-video", "clips"))
+CLIP_CACHE_MAX_BYTES = int(os.environ.get("CLIP_CACHE_MAX_BYTES", 10 * 1024 ** 3))  # 10 GB
+CLIP_CACHE_VERIFY_HASH = os.environ.get("CLIP_CACHE_VERIFY_HASH", "0") == "1"  # Re-hash clips on every hit
+CLIP_CACHE_LEASE_SECONDS = float(os.environ.get("CLIP_CACHE_LEASE_SECONDS", 6 * 3600))  # Leases not released (a crashed render) expire
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url):
+    """
+    Normalize a clip URL so equivalent links share one cache entry.
+
+    Lower-cases the scheme and host, drops default ports and fragments and
+    sorts query parameters.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+def cache_key(url):
+    """Content-address key for a clip URL."""
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ClipLease:
+    """Clips a render is using; eviction skips them until ``release``."""
+
+    def __init__(self, paths):
+        self.paths = paths
+
+    def release(self):
+        for path in self.paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.paths = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class ClipCache:
+    """
+    Size-bounded LRU cache of downloaded clips.
+
+    Clips leased with ``lease`` are left alone by eviction in this and every
+    other process sharing the directory until the lease is released, so a
+    render can still open the clips it was handed even when its working set
+    is larger than ``max_bytes``. The cache may stay above ``max_bytes``
+    while those renders run. A lease a crashed process never released
+    expires after ``lease_seconds``.
+
+    Args:
+        directory (str): Cache root, may be shared between processes
+        max_bytes (int): Total size the cache is trimmed to after each fetch
+        verify_hash (bool): Re-check the SHA-256 of a clip on every hit
+            (the size is always checked)
+        download_manager (DownloadManager, optional): Used for cache misses
+        lease_seconds (float): Age at which an unreleased lease is ignored
+    """
+
+    def __init__(self, directory=CLIP_CACHE_DIR, max_bytes=CLIP_CACHE_MAX_BYTES,
+                 verify_hash=CLIP_CACHE_VERIFY_HASH, download_manager=None, lease_seconds=CLIP_CACHE_LEASE_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lease_seconds = lease_seconds
+        self.verify_hash = verify_hash
+        self.download_manager = download_manager or get_download_manager()
+        self.objects_dir = os.path.join(directory, "objects")
+        self.tmp_dir = os.path.join(directory, "tmp")
+        self.locks_dir = os.path.join(directory, "locks")
+        self.leases_dir = os.path.join(directory, "leases")
+        for path in (self.objects_dir, self.tmp_dir, self.locks_dir, self.leases_dir):
+            os.makedirs(path, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        # fetch_many counts from several threads
+        self._counts_lock = threading.Lock()
+
+    def _paths(self, key):
+        shard = os.path.join(self.objects_dir, key[:2])
+        return os.path.join(shard, key + ".mp4"), os.path.join(shard, key + ".json")
+
+    def _lock(self, key):
+        return FileLock(os.path.join(self.locks_dir, key + ".lock"))
+
+    def _valid(self, data_path, meta_path):
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if os.path.getsize(data_path) != meta["size"]:
+                return False
+            if self.verify_hash and meta.get("sha256") and file_sha256(data_path) != meta["sha256"]:
+                return False
+            return True
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def lookup(self, url):
+        """Return the cached path for ``url``, or None on a miss."""
+        return self._lookup(url, locked=False)
+
+    def _lookup(self, url, locked):
+        key = cache_key(url)
+        data_path, meta_path = self._paths(key)
+        if not os.path.exists(data_path):
+            return None
+        if not self._valid(data_path, meta_path):
+            print(f"WARNING: Cached clip failed integrity check, discarding: {url}")
+            if locked:
+                self._remove(key)
+            else:
+                with self._lock(key):
+                    if not self._valid(data_path, meta_path):
+                        self._remove(key)
+            return None
+        try:
+            # Modification time is the LRU clock
+            os.utime(data_path)
+        except OSError:
+            pass
+        return data_path
+
+    def lease(self, urls):
+        """
+        Protect the clips of ``urls`` from eviction until the lease is released;
+        take it before fetching them.
+
+        Returns:
+            ClipLease: Release it (or use it as a context manager) once the clips are closed
+        """
+        token = uuid.uuid4().hex
+        paths = []
+        for key in dict.fromkeys(cache_key(url) for url in urls):
+            path = os.path.join(self.leases_dir, f"{key}.{token}")
+            with open(path, "w", encoding="utf-8"):
+                pass
+            paths.append(path)
+        return ClipLease(paths)
+
+    def _leased_keys(self):
+        """Keys with a live lease; leases older than ``lease_seconds`` are removed."""
+        expired = time.time() - self.lease_seconds
+        keys = set()
+        for name in os.listdir(self.leases_dir):
+            path = os.path.join(self.leases_dir, name)
+            try:
+                if os.path.getmtime(path) < expired:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            keys.add(name.split(".", 1)[0])
+        return keys
+
+    def contains(self, url):
+        """Check whether a clip is cached without updating its LRU position."""
+        data_path, meta_path = self._paths(cache_key(url))
+        return os.path.exists(data_path) and self._valid(data_path, meta_path)
+
+    def _count(self, hit):
+        with self._counts_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def fetch(self, url):
+        """
+        Return a local path for ``url``, downloading it on a cache miss.
+
+        Only one process downloads a given clip at a time; others wait for the
+        lock and then find it published.
+
+        Returns:
+            str: Path to the cached clip, or None if the download failed
+        """
+        path = self._fetch(url)
+        self.evict(keep={cache_key(url)})
+        return path
+
+    def _fetch(self, url):
+        with span("clip fetch", category="io", url=url) as trace_args:
+            path = self.lookup(url)
+            if path is not None:
+                self._count(hit=True)
+                trace_args["cache"] = "hit"
+                return path
+            trace_args["cache"] = "miss"
+
+            key = cache_key(url)
+            data_path, meta_path = self._paths(key)
+            with self._lock(key):
+                path = self._lookup(url, locked=True)
+                if path is not None:
+                    self._count(hit=True)
+                    trace_args["cache"] = "hit"
+                    return path
+
+                self._count(hit=False)
+                tmp_path = os.path.join(self.tmp_dir, key + ".mp4")
+                if not self.download_manager.download(url, tmp_path):
+                    return None
+                size = os.path.getsize(tmp_path)
+                if size == 0:
+                    print(f"ERROR: Downloaded clip is empty: {url}")
+                    os.remove(tmp_path)
+                    return None
+
+                meta = {
+                    "url": normalize_url(url),
+                    "size": size,
+                    "sha256": file_sha256(tmp_path),
+                    "created": time.time()
+                }
+                os.makedirs(os.path.dirname(data_path), exist_ok=True)
+                tmp_meta = tmp_path + ".json"
+                with open(tmp_meta, "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+                # Publish metadata first so a visible clip always has its metadata
+                os.replace(tmp_meta, meta_path)
+                os.replace(tmp_path, data_path)
+                os.utime(data_path)
+        return data_path
+
+    def fetch_many(self, urls, workers=None):
+        """
+        Fetch several clips in parallel. Returns paths (or None) in order.
+
+        The cache is trimmed once afterwards, never removing the clips just returned.
+        """
+        workers = workers or self.download_manager.workers
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="clip-cache") as executor:
+            # Each fetch runs in a copy of the caller's context, so it sees the job's deadline
+            futures = [executor.submit(contextvars.copy_context().run, self._fetch, url) for url in urls]
+            paths = [future.result() for future in futures]
+        self.evict(keep={cache_key(url) for url in urls})
+        return paths
+
+    def entries(self):
+        """List (key, size, last_used) for every published clip."""
+        entries = []
+        for shard in os.listdir(self.objects_dir):
+            shard_dir = os.path.join(self.objects_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if not name.endswith(".mp4"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(shard_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((name[:-4], stat.st_size, stat.st_mtime))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=()):
+        """
+        Remove least-recently-used clips until the cache fits in ``max_bytes``.
+
+        Args:
+            keep (iterable): Keys never to remove, e.g. the clips a render is about to open;
+                leased clips are kept as well
+        """
+        if not self.max_bytes:
+            return 0
+        removed = 0
+        with FileLock(os.path.join(self.locks_dir, "evict.lock")):
+            keep = set(keep) | self._leased_keys()
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for key, size, last_used in sorted(entries, key=lambda entry: entry[2]):
+                if total <= self.max_bytes:
+                    break
+                if key in keep:
+                    # Open in a render of this or another process
+                    continue
+                lock = self._lock(key)
+                try:
+                    # Skip clips another process is publishing or re-validating
+                    lock.acquire(timeout=0)
+                except Timeout:
+                    continue
+                try:
+                    self._remove(key)
+                finally:
+                    lock.release()
+                total -= size
+                removed += 1
+        if total > self.max_bytes:
+            print(f"WARNING: Clip cache is {total / (1024 * 1024):.0f} MB, over its {self.max_bytes / (1024 * 1024):.0f} MB "
+                  f"cap: the remaining clips are in use by running renders")
+        return removed
+
+    def clear_partials(self):
+        """Delete interrupted downloads left in the temporary directory."""
+        for name in os.listdir(self.tmp_dir):
+            if name.endswith(PARTIAL_SUFFIX):
+                os.remove(os.path.join(self.tmp_dir, name))
+
+
+_DEFAULT_CACHE = None
+_DEFAULT_CACHE_LOCK = threading.Lock()
+
+
+def get_clip_cache():
+    """Return the process-wide clip cache, creating it on first use."""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        with _DEFAULT_CACHE_LOCK:
+            if _DEFAULT_CACHE is None:
+                _DEFAULT_CACHE = ClipCache()
+    return _DEFAULT_CACHE
@@ -0,0 +1,273 @@
+"""
+Streaming download manager for stock video clips.
+
+All clip downloads share one keep-alive session and a pool of worker
+threads. Files are written to disk in chunks as they arrive, interrupted
+transfers resume with HTTP Range requests, and the number of concurrent
+connections to any single host is capped.
+"""
+
+import os
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utility.tracing import span
+from utility.progress import get_progress
+from utility.deadline import current_deadline
+
+# Download settings
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", 4))  # Parallel downloads
+PER_HOST_LIMIT = int(os.environ.get("DOWNLOAD_PER_HOST_LIMIT", 4))  # Concurrent connections per host
+CHUNK_SIZE = 256 * 1024  # Bytes written per chunk
+DOWNLOAD_TIMEOUT = 30  # Seconds to wait for a connection or the next chunk
+MAX_RETRIES = 3  # Attempts per file, resuming where the last one stopped
+RETRY_DELAY = 2  # Seconds, doubled after each failed attempt
+PARTIAL_SUFFIX = ".part"
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+
+class DownloadStats:
+    """Counters describing the work done by a DownloadManager."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.files = 0
+        self.failures = 0
+        self.resumed = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def record(self, downloaded_bytes, seconds, success, resumed=False):
+        with self._lock:
+            self.bytes += downloaded_bytes
+            self.seconds += seconds
+            if success:
+                self.files += 1
+            else:
+                self.failures += 1
+            if resumed:
+                self.resumed += 1
+
+    def throughput(self):
+        """
+        Average transfer rate of one download in bytes per second. Parallel
+        downloads together move data faster; see ``since``.
+        """
+        with self._lock:
+            return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "files": self.files,
+                "failures": self.failures,
+                "resumed": self.resumed,
+                "bytes": self.bytes,
+                "seconds": round(self.seconds, 3),
+                # Per download: bytes over the summed seconds of every transfer
+                "stream_bytes_per_second": round(self.bytes / self.seconds, 1) if self.seconds > 0 else 0.0
+            }
+
+    def since(self, before, wall_seconds):
+        """
+        What was downloaded since ``before`` (an earlier ``as_dict()``).
+
+        Args:
+            before (dict): Counters taken before the downloads started
+            wall_seconds (float): Wall time the downloads took; the aggregate
+                rate of parallel downloads is their bytes over this time
+
+        Returns:
+            dict: The counter differences, ``wall_seconds`` and
+                ``throughput_bytes_per_second``
+        """
+        now = self.as_dict()
+        delta = {key: now[key] - before[key] for key in ("files", "failures", "resumed", "bytes")}
+        delta["seconds"] = round(now["seconds"] - before["seconds"], 3)
+        delta["wall_seconds"] = round(wall_seconds, 3)
+        delta["throughput_bytes_per_second"] = round(delta["bytes"] / wall_seconds, 1) if wall_seconds > 0 else 0.0
+        return delta
+
+
+class DownloadManager:
+    """
+    Download files in parallel over a shared session.
+
+    Args:
+        workers (int): Number of downloads that may run at the same time
+        per_host_limit (int): Maximum concurrent connections to one host
+        chunk_size (int): Bytes read from the socket per write
+        timeout (float): Connect/read timeout in seconds
+        max_retries (int): Attempts per file before giving up
+        progress_callback (callable, optional): Called as
+            ``progress_callback(url, bytes_done, bytes_total)`` while a file
+            downloads; ``bytes_total`` is None when the server does not say
+    """
+
+    def __init__(self, workers=DOWNLOAD_WORKERS, per_host_limit=PER_HOST_LIMIT, chunk_size=CHUNK_SIZE,
+                 timeout=DOWNLOAD_TIMEOUT, max_retries=MAX_RETRIES, progress_callback=None):
+        self.workers = max(1, workers)
+        self.per_host_limit = max(1, per_host_limit)
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.max_retries = max(1, max_retries)
+        self.progress_callback = progress_callback
+        self.stats = DownloadStats()
+
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": USER_AGENT})
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._executor = None
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.per_host_limit)
+                self._host_slots[host] = slot
+            return slot
+
+    def download(self, url, filename):
+        """
+        Download ``url`` to ``filename``, streaming chunks straight to disk.
+
+        Data is written to ``filename + '.part'`` first and renamed once the
+        transfer is complete, so a partial file left by a failed attempt (or
+        an earlier run) is resumed rather than restarted. The job's deadline
+        (see utility.deadline) caps the timeouts, stops a transfer when it
+        passes and skips retries that could not finish in time.
+
+        Returns:
+            bool: True if the file was downloaded successfully
+        """
+        partial = filename + PARTIAL_SUFFIX
+        retry_delay = RETRY_DELAY
+        deadline = current_deadline()
+        with self._host_slot(url):
+            with span("download", category="io", url=url) as trace_args:
+                for attempt in range(self.max_retries):
+                    start = time.time()
+                    offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+                    progress = {"written": 0}
+                    try:
+                        complete = self._transfer(url, partial, offset, progress, deadline)
+                        error = None if complete else "connection closed before the file was complete"
+                    except Exception as e:
+                        complete = False
+                        error = str(e)
+                    self.stats.record(progress["written"], time.time() - start, complete, resumed=offset > 0)
+                    if complete:
+                        os.replace(partial, filename)
+                        trace_args.update(bytes=os.path.getsize(filename), attempts=attempt + 1)
+                        return True
+                    if deadline.expired:
+                        print(f"Giving up on {url}: {error}")
+                        break
+                    if attempt < self.max_retries - 1:
+                        print(f"Download interrupted for {url} ({error}), retrying in {retry_delay} seconds...")
+                        if not deadline.sleep(retry_delay):
+                            print(f"No time left to retry {url}")
+                            break
+                        retry_delay *= 2
+                    else:
+                        print(f"ERROR downloading video: {error}")
+        return False
+
+    def _transfer(self, url, partial, offset, progress, deadline):
+        """Stream one attempt into ``partial``. Returns True once the file is complete."""
+        headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+        with self.session.get(url, headers=headers, stream=True, timeout=deadline.timeout(self.timeout)) as response:
+            if response.status_code == 416 and offset > 0:
+                # Nothing left to fetch: the partial file already holds everything
+                return True
+            response.raise_for_status()
+
+            if offset > 0 and response.status_code != 206:
+                # Server ignored the Range header, start over
+                offset = 0
+            mode = "ab" if offset > 0 else "wb"
+
+            length = response.headers.get("Content-Length")
+            total = offset + int(length) if length is not None else None
+
+            with open(partial, mode) as f:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    progress["written"] += len(chunk)
+                    if self.progress_callback is not None:
+                        self.progress_callback(url, offset + progress["written"], total)
+                    get_progress().bytes(url, offset + progress["written"], total)
+                    deadline.check("download")
+
+            return total is None or offset + progress["written"] >= total
+
+    def submit(self, url, filename):
+        """Schedule a download on the worker pool. Returns a Future of bool."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="download")
+            executor = self._executor
+        # Run in the caller's context, so the download sees the job's deadline
+        return executor.submit(contextvars.copy_context().run, self.download, url, filename)
+
+    def download_many(self, items):
+        """
+        Download several files in parallel.
+
+        Args:
+            items (list): (url, filename) pairs
+
+        Returns:
+            list: One bool per item, in the same order
+        """
+        futures = [self.submit(url, filename) for url, filename in items]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"ERROR downloading video: {str(e)}")
+                results.append(False)
+        return results
+
+    def close(self):
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self.session.close()
+
+
+_DEFAULT_MANAGER = None
+_DEFAULT_MANAGER_LOCK = threading.Lock()
+
+
+def get_download_manager():
+    """Return the process-wide download manager, creating it on first use."""
+    global _DEFAULT_MANAGER
+    if _DEFAULT_MANAGER is None:
+        with _DEFAULT_MANAGER_LOCK:
+            if _DEFAULT_MANAGER is None:
+                _DEFAULT_MANAGER = DownloadManager()
+    return _DEFAULT_MANAGER
+
+
+def download_file(url, filename):
+    """Download a single file with the shared manager. Returns True on success."""
+    return get_download_manager().download(url, filename)
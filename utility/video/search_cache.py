@@ -0,0 +1,67 @@
+"""
+Persistent cache of stock video search results.
+
+Stores the clip URL chosen for each search query, so repeated runs (and
+``app.py --plan``) can resolve a segment's background without calling the
+video API. Entries are small JSON files written atomically and expire after
+SEARCH_CACHE_TTL seconds.
+"""
+
+import os
+import json
+import time
+import hashlib
+import uuid
+
+# Cache settings
+SEARCH_CACHE_DIR = os.environ.get("SEARCH_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "text-to-video", "search"))
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", 7 * 24 * 3600))  # One week
+
+
+def search_query(term):
+    """Search string for a search term, which may be a list of keywords."""
+    if isinstance(term, (list, tuple)):
+        return " ".join(str(word) for word in term)
+    return str(term)
+
+
+def search_cache_key(query, video_server="pexel", orientation_landscape=True):
+    normalized = " ".join(search_query(query).lower().split())
+    key = f"{video_server}|{'landscape' if orientation_landscape else 'portrait'}|{normalized}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key, directory):
+    return os.path.join(directory or SEARCH_CACHE_DIR, key[:2], key + ".json")
+
+
+def get_cached_search(query, video_server="pexel", orientation_landscape=True, directory=None):
+    """
+    Look up the clip URL previously chosen for a query.
+
+    Returns:
+        str: The URL, or None on a miss or an expired entry
+    """
+    path = _entry_path(search_cache_key(query, video_server, orientation_landscape), directory)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if SEARCH_CACHE_TTL and time.time() - entry.get("created", 0) > SEARCH_CACHE_TTL:
+        return None
+    return entry.get("url")
+
+
+def put_cached_search(query, url, video_server="pexel", orientation_landscape=True, directory=None):
+    """Remember the clip URL chosen for a query."""
+    path = _entry_path(search_cache_key(query, video_server, orientation_landscape), directory)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per writer: the cache may be shared by several machines
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"query": search_query(query), "url": url, "created": time.time()}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: Could not write search cache entry: {str(e)}")
@@ -58,14 +58,14 @@ def extract_keywords(text, captions):
         
         if segment_keywords:
             # Add visual context based on keywords
-            for word in segment_keywords:
+            for word in list(segment_keywords):
                 for context, related in visual_context.items():
                     if word in context or context in word:
                         segment_keywords.extend(related)
                         break
             
-            # Remove duplicates and limit to 3 keywords
-            segment_keywords = list(set(segment_keywords))[:3]
+            # Remove duplicates (keeping the order, so queries are stable between runs) and limit to 3 keywords
+            segment_keywords = list(dict.fromkeys(segment_keywords))[:3]
             
             # Add this segment with timing and keywords
             keywords.append([time_range, segment_keywords])